@@ -0,0 +1,230 @@
+"""Columnar, memory-mapped sidecar cache of the h5ad cell table.
+
+The first time a dataset's ``obs`` table is needed (normally at ingest) every
+numeric column is written to its own ``.npy`` file and every boolean-like
+marker column is bit-packed into ``markers.npy``. Later commands open the
+sidecar with ``np.load(mmap_mode="r")`` instead of decoding HDF5 again. The
+sidecar records the h5ad file signature and is rebuilt when the source changes.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import shutil
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from .data_store import _file_signature, _matches_signature
+from .object_cache import get_object_cache, source_key
+from .obs_reader import list_obs_columns, positive_mask, read_obs_columns
+
+logger = logging.getLogger(__name__)
+
+CELL_TABLE_DIR = "cell_table"
+CELL_TABLE_META = "meta.json"
+CELL_TABLE_VERSION = 1
+MARKERS_FILE = "markers.npy"
+
+# String tokens that make an object/categorical column count as a marker flag.
+_BOOLEAN_TOKENS = {"true", "false", "t", "f", "yes", "no", "y", "n", "1", "0"}
+# Missing-value tokens a marker column may also hold (but not hold only).
+_MISSING_TOKENS = {"nan", "none", ""}
+
+
+def cell_table_dir(h5ad_path: str | Path, output_root: str | Path) -> Path:
+    """Return the sidecar directory for an h5ad file under ``output_root``."""
+    return Path(output_root) / CELL_TABLE_DIR / Path(h5ad_path).stem
+
+
+def _looks_boolean(values: np.ndarray) -> bool:
+    if values.dtype == bool:
+        return True
+    if values.dtype.kind != "O":
+        return False
+    tokens = set(np.char.lower(np.char.strip(np.unique(values.astype(str)))).tolist())
+    return bool(tokens & _BOOLEAN_TOKENS) and tokens <= _BOOLEAN_TOKENS | _MISSING_TOKENS
+
+
+def _column_file(name: str) -> str:
+    safe = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in name)
+    return f"col_{safe}.npy"
+
+
+class CellTable(Mapping):
+    """Read-only mapping of obs column name -> NumPy array backed by a sidecar.
+
+    Numeric columns are memory-mapped, marker columns are unpacked to boolean
+    arrays on access, and any other obs column falls back to the h5ad reader.
+    """
+
+    def __init__(self, root: Path, meta: dict, h5ad_path: str | Path) -> None:
+        self.root = Path(root)
+        self.meta = meta
+        self.h5ad_path = Path(h5ad_path)
+        self.n_cells = int(meta["n_cells"])
+        self._files: Dict[str, str] = dict(meta.get("columns", {}))
+        self._markers: List[str] = list(meta.get("markers", []))
+        self._all: List[str] = list(meta.get("all_columns", []))
+        self._packed: Optional[np.ndarray] = None
+        self._extra: Dict[str, np.ndarray] = {}
+
+    @property
+    def cache_handles(self) -> int:
+        """Memory maps kept open (the packed marker matrix, once read)."""
+        return int(self._packed is not None)
+
+    def __sizeof__(self) -> int:
+        return object.__sizeof__(self) + sum(int(np.asarray(v).nbytes) for v in self._extra.values())
+
+    @property
+    def numeric_columns(self) -> List[str]:
+        return list(self._files)
+
+    @property
+    def marker_columns(self) -> List[str]:
+        return list(self._markers)
+
+    def packed_markers(self) -> np.ndarray:
+        """Return the ``(n_markers, ceil(n_cells / 8))`` bit-packed marker matrix."""
+        if self._packed is None:
+            self._packed = np.load(self.root / MARKERS_FILE, mmap_mode="r")
+        return self._packed
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name in self._files:
+            return np.load(self.root / self._files[name], mmap_mode="r")
+        if name in self._markers:
+            row = self.packed_markers()[self._markers.index(name)]
+            return np.unpackbits(row, count=self.n_cells).view(bool)
+        if name not in self._extra:
+            if name not in self._all:
+                raise KeyError(name)
+            self._extra[name] = read_obs_columns(self.h5ad_path, [name])[name]
+        return self._extra[name]
+
+    def positive_at(self, name: str, index: np.ndarray) -> np.ndarray:
+        """``positive_mask(self[name])[index]`` without decoding the whole column.
+
+        Marker columns read only the bytes of the packed row that hold ``index``.
+        """
+        index = np.asarray(index, dtype=np.int64)
+        if name in self._markers:
+            row = self.packed_markers()[self._markers.index(name)]
+            return ((row[index >> 3] >> (7 - (index & 7))) & 1).astype(bool)
+        return positive_mask(np.asarray(self[name])[index])
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._files or name in self._markers or name in self._all
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._all)
+
+    def __len__(self) -> int:
+        return len(self._all)
+
+
+def _write_cell_table(h5ad_path: Path, tmp: Path) -> dict:
+    all_columns = list_obs_columns(h5ad_path)
+    files: Dict[str, str] = {}
+    markers: Dict[str, np.ndarray] = {}
+    n_cells: Optional[int] = None
+    # one column at a time keeps peak memory at a single obs column
+    for name in all_columns:
+        values = read_obs_columns(h5ad_path, [name])[name]
+        n_cells = len(values) if n_cells is None else n_cells
+        if _looks_boolean(values):
+            markers[name] = np.packbits(positive_mask(values))
+        elif values.dtype.kind in "biuf":
+            fname = _column_file(name)
+            np.save(tmp / fname, np.ascontiguousarray(values))
+            files[name] = fname
+    n_cells = n_cells or 0
+
+    packed = np.zeros((len(markers), (n_cells + 7) // 8), dtype=np.uint8)
+    for i, bits in enumerate(markers.values()):
+        packed[i] = bits
+    np.save(tmp / MARKERS_FILE, packed)
+
+    meta = {
+        "version": CELL_TABLE_VERSION,
+        "source": _file_signature(h5ad_path),
+        "n_cells": n_cells,
+        "columns": files,
+        "markers": list(markers),
+        "all_columns": all_columns,
+    }
+    with (tmp / CELL_TABLE_META).open("w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def build_cell_table(h5ad_path: str | Path, output_root: str | Path) -> CellTable:
+    """Decode the obs table once and write the columnar sidecar."""
+    h5ad_path = Path(h5ad_path)
+    target = cell_table_dir(h5ad_path, output_root)
+    tmp = target.with_name(target.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    try:
+        meta = _write_cell_table(h5ad_path, tmp)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    shutil.rmtree(target, ignore_errors=True)
+    tmp.rename(target)
+    logger.info(
+        f"[cells] cell table for {h5ad_path.name}: {meta['n_cells']} cells, "
+        f"{len(meta['columns'])} numeric + {len(meta['markers'])} marker columns -> {target}"
+    )
+    return CellTable(target, meta, h5ad_path)
+
+
+def _load_meta(target: Path) -> Optional[dict]:
+    meta_file = target / CELL_TABLE_META
+    if not meta_file.exists():
+        return None
+    try:
+        with meta_file.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def open_cell_table(
+    h5ad_path: str | Path,
+    output_root: str | Path,
+    *,
+    build: bool = True,
+) -> Optional[CellTable]:
+    """Open the sidecar for ``h5ad_path``, (re)building it when stale or missing."""
+    h5ad_path = Path(h5ad_path)
+    target = cell_table_dir(h5ad_path, output_root)
+    cache = get_object_cache()
+    key = source_key("cells", h5ad_path, str(target))
+    table = cache.get(key)
+    if table is not None and (target / CELL_TABLE_META).exists():
+        return table
+    meta = _load_meta(target)
+    if (
+        meta is not None
+        and meta.get("version") == CELL_TABLE_VERSION
+        and _matches_signature(meta.get("source", {}), h5ad_path)
+    ):
+        return cache.put(key, CellTable(target, meta, h5ad_path))
+    if not build:
+        return None
+    return cache.put(key, build_cell_table(h5ad_path, output_root))
+
+
+__all__ = [
+    "CELL_TABLE_DIR",
+    "CellTable",
+    "build_cell_table",
+    "cell_table_dir",
+    "open_cell_table",
+]
@@ -661,6 +661,8 @@ class CmdLoadMarkerData(BaseModel):
     h5ad_path: Optional[str] = None
     output_root: Optional[str] = None
     force_recompute: bool = False
+    preview: bool = False
+    preview_downsample: int = Field(default=1, ge=1)
 
 
 class CmdShowMask(BaseModel):
@@ -677,6 +679,7 @@ class CmdShowDensity(BaseModel):
 class CmdUpdateDensity(BaseModel):
     action: Literal["special_update_density"]
     marker_col: str
+    marker_cols: Optional[list[str]] = None  # further markers computed in the same pass
     dataset_id: Optional[str] = None
     image_path: Optional[str] = None
     h5ad_path: Optional[str] = None
@@ -686,6 +689,13 @@ class CmdUpdateDensity(BaseModel):
     force: bool = False
 
 
+class CmdGotoHotspot(BaseModel):
+    action: Literal["special_goto_hotspot"]
+    marker_col: str
+    hotspot: Optional[int] = Field(default=None, ge=1)  # 1 = densest
+    direction: Optional[Literal["next", "previous"]] = None
+
+
 class CmdComputeNeighborhood(BaseModel):
     action: Literal["special_compute_neighborhood"]
     marker_col: str
@@ -697,6 +707,21 @@ class CmdComputeNeighborhood(BaseModel):
     force_recompute: bool = False
 
 
+class CmdCountCellsInView(BaseModel):
+    action: Literal["special_count_cells_in_view"]
+    marker_col: Optional[str] = None
+    dataset_id: Optional[str] = None
+    image_path: Optional[str] = None
+    h5ad_path: Optional[str] = None
+    output_root: Optional[str] = None
+    # [x1, y1, x2, y2] like zoom_box; defaults to the current view
+    box: Optional[Annotated[list[Float], Field(min_length=4, max_length=4)]] = None
+    # [[x, y], ...] region of interest; takes precedence over box
+    polygon: Optional[
+        Annotated[list[Annotated[list[Float], Field(min_length=2, max_length=2)]], Field(min_length=3)]
+    ] = None
+
+
 # Context management commands
 class CmdSetDataset(BaseModel):
     action: Literal["set_dataset"]
@@ -721,6 +746,7 @@ class CmdClearCache(BaseModel):
     action: Literal["clear_processed_cache"]
     dataset_id: Optional[str] = None
     delete_raw: bool = False
+    derived_only: bool = False
 
 
 BaseNapariCommand = Union[
@@ -843,7 +869,9 @@ BaseNapariCommand = Union[
     CmdShowMask,
     CmdShowDensity,
     CmdUpdateDensity,
+    CmdGotoHotspot,
     CmdComputeNeighborhood,
+    CmdCountCellsInView,
     CmdSetDataset,
     CmdSetMarker,
     CmdListDatasets,
@@ -976,7 +1004,9 @@ __all__ = [
     "CmdShowMask",
     "CmdShowDensity",
     "CmdUpdateDensity",
+    "CmdGotoHotspot",
     "CmdComputeNeighborhood",
+    "CmdCountCellsInView",
     "CmdSetDataset",
     "CmdSetMarker",
     "CmdListDatasets",
@@ -7,6 +7,7 @@ TIFF / h5ad inputs and derived artifacts without relying on ad-hoc paths.
 from __future__ import annotations
 
 import json
+import logging
 import os
 import re
 import shutil
@@ -15,11 +16,18 @@ from datetime import datetime, timezone
 from pathlib import Path
 from typing import Iterable, Optional
 
+from .image_probe import header_from_manifest, image_info, probe_image, register_image_info
+from .object_cache import get_object_cache
+
 DATA_ROOT_ENV = "AIMINO_DATA_ROOT"
 DEFAULT_DATA_ROOT = Path.home() / "AIMINO_DATA"
 MANIFEST_NAME = "manifest.json"
 RAW_DIR = "raw"
 PROCESSED_DIR = "processed"
+# Content-addressed derived artifacts inside an output root (see artifact_cache).
+ARTIFACT_CACHE_DIR = "cache"
+
+logger = logging.getLogger(__name__)
 
 
 def _expand_path(value: str | Path) -> Path:
@@ -180,9 +188,41 @@ def ingest_dataset(
         },
         "created_at": datetime.now(timezone.utc).isoformat(),
     }
+    try:
+        manifest["source_info"]["image"]["header"] = probe_image(dst_image)
+        register_image_info(dst_image, manifest["source_info"]["image"]["header"])
+    except Exception as exc:
+        logger.warning(f"[ingest] could not read image header for '{dataset_id}': {exc}")
     if metadata:
         manifest["metadata"] = metadata
+
+    # Large slides get a multiscale pyramid so display never needs a global downsample;
+    # it is built in the background (or on first display), not here.
+    from .handlers.special_analysis.utils.pyramid import (
+        needs_pyramid,
+        planned_levels,
+        pyramid_dir,
+        schedule_pyramid,
+    )
+
+    try:
+        if needs_pyramid(str(dst_image)):
+            schedule_pyramid(str(dst_image), str(processed_dir))
+            manifest["pyramid"] = {
+                "dir": str(pyramid_dir(str(dst_image), str(processed_dir))),
+                "levels": planned_levels(image_info(dst_image)["plane_shape"]),
+            }
+    except Exception as exc:
+        logger.warning(f"[ingest] pyramid not scheduled for '{dataset_id}' (built on first display): {exc}")
     save_manifest(dataset_id, manifest)
+
+    # Decode the obs table once so later commands can memory-map it.
+    from .cell_table import build_cell_table
+
+    try:
+        build_cell_table(dst_h5ad, processed_dir)
+    except Exception as exc:
+        logger.warning(f"[ingest] cell table not built for '{dataset_id}' (built on first use): {exc}")
     return manifest
 
 
@@ -208,6 +248,23 @@ def _ensure_sources_intact(dataset_id: str, manifest: dict) -> None:
             )
 
 
+def _remember_image_header(dataset_id: str, manifest: dict, image_path: Path) -> None:
+    """Seed the header memo from the manifest, probing (and persisting) if absent."""
+    header = header_from_manifest(manifest)
+    if header is None:
+        try:
+            header = probe_image(image_path)
+        except Exception as exc:
+            logger.warning(f"[dataset] could not read image header for '{dataset_id}': {exc}")
+            return
+        manifest.setdefault("source_info", {}).setdefault("image", {})["header"] = header
+        try:
+            save_manifest(dataset_id, manifest)
+        except OSError:
+            pass
+    register_image_info(image_path, header)
+
+
 def get_dataset_paths(dataset_id: str) -> DatasetContext:
     """Return manifest-backed paths for an existing dataset, validating source integrity."""
     manifest = load_manifest(dataset_id)
@@ -219,6 +276,7 @@ def get_dataset_paths(dataset_id: str) -> DatasetContext:
     if not h5ad.exists():
         raise FileNotFoundError(f"Dataset '{dataset_id}' h5ad missing: {h5ad}")
     _ensure_sources_intact(dataset_id, manifest)
+    _remember_image_header(dataset_id, manifest, img)
     out_root.mkdir(parents=True, exist_ok=True)
     return DatasetContext(dataset_id, img, h5ad, out_root)
 
@@ -251,16 +309,30 @@ def resolve_dataset_context(
     return DatasetContext(None, img, h5ad, out_root)
 
 
-def clear_processed_cache(dataset_id: str, *, delete_raw: bool = False) -> dict:
-    """Remove processed outputs (and optionally raw copies) for a dataset."""
+def clear_processed_cache(dataset_id: str, *, delete_raw: bool = False, derived_only: bool = False) -> dict:
+    """Remove processed outputs (and optionally raw copies) for a dataset.
+
+    With ``derived_only`` only the artifact cache (density levels, contours)
+    is emptied; the cell table, labels and masks are kept.
+    """
     manifest = load_manifest(dataset_id)
     base = _dataset_dir(dataset_id)
     processed_root = _expand_path(manifest.get("output_root", base / PROCESSED_DIR))
-    removed = {"processed": False, "raw_files": []}
-    if processed_root.exists():
-        shutil.rmtree(processed_root, ignore_errors=True)
+    target = processed_root / ARTIFACT_CACHE_DIR if derived_only else processed_root
+    cache_dir = processed_root / ARTIFACT_CACHE_DIR
+    removed = {
+        "processed": False,
+        "raw_files": [],
+        "cache_bytes": sum(f.stat().st_size for f in cache_dir.rglob("*") if f.is_file()) if cache_dir.exists() else 0,
+    }
+    if target.exists():
+        shutil.rmtree(target, ignore_errors=True)
         removed["processed"] = True
     processed_root.mkdir(parents=True, exist_ok=True)
+    prefix = str(target)
+    get_object_cache().invalidate(
+        lambda key: any(isinstance(part, str) and part.startswith(prefix) for part in key)
+    )
 
     if delete_raw:
         for key in ("image_path", "h5ad_path"):
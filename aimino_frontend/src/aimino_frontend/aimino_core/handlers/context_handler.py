@@ -161,12 +161,15 @@ def handle_clear_cache(command, viewer: "Viewer") -> str:
         return "Error: No dataset specified and no active dataset"
 
     delete_raw = _get_attr(command, "delete_raw", False)
+    derived_only = _get_attr(command, "derived_only", False)
 
     try:
-        result = clear_processed_cache(dataset_id, delete_raw=delete_raw)
+        result = clear_processed_cache(dataset_id, delete_raw=delete_raw, derived_only=derived_only)
         msg = f"Cleared cache for dataset '{dataset_id}'"
         if result.get("processed"):
-            msg += " (processed files removed)"
+            msg += " (derived artifacts removed)" if derived_only else " (processed files removed)"
+        if result.get("cache_bytes"):
+            msg += f" (freed {result['cache_bytes'] / 1024**2:.1f} MiB of cached artifacts)"
         if result.get("raw_files"):
             msg += f" (raw files removed: {len(result['raw_files'])})"
         return msg
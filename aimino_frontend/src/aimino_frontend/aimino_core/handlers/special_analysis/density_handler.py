@@ -1,20 +1,18 @@
 """Density map command handlers."""
 
-import os
 from typing import TYPE_CHECKING
-import anndata as ad
 
-from ...command_models import CmdShowDensity, CmdUpdateDensity
+from ...command_models import CmdGotoHotspot, CmdShowDensity, CmdUpdateDensity
 from ...data_store import resolve_dataset_context
 from ...errors import CommandExecutionError
+from ...cell_table import open_cell_table
 from ...registry import register_handler
 from .utils import (
-    _ensure_density_layer,
-    density_to_boundary_paths,
+    _ensure_density_layers,
+    ensure_boundary_paths,
     zoom_to_dense_region,
-    load_boundary_paths_npz,
-    save_boundary_paths_npz,
-    get_output_paths,
+    zoom_to_hotspot,
+    set_boundary_layer,
 )
 from ..layer_management.layer_list import find_layer
 
@@ -60,62 +58,51 @@ def handle_update_density(command: CmdUpdateDensity, viewer: "Viewer") -> str:
     h5ad_path = str(ctx.h5ad_path)
     output_root = str(ctx.output_root)
     
+    markers = list(dict.fromkeys([command.marker_col, *(command.marker_cols or [])]))
+
     try:
-        adata = ad.read_h5ad(h5ad_path)
-        obs = adata.obs.copy()
-        
-        density, lname = _ensure_density_layer(
+        obs = open_cell_table(h5ad_path, output_root)
+
+        layers = _ensure_density_layers(
             viewer,
             image_path,
             obs,
-            command.marker_col,
+            markers,
             output_root,
             sigma=sigma,
             colormap=cmap,
             force_recompute=force,
-            layer_name=f"{command.marker_col}_density",
             visible=True,
         )
-        
-        # Update boundary if needed
-        bname = f"{command.marker_col}_density_boundary"
-        b_layer = find_layer(viewer, bname)
-        if b_layer is not None:
-            viewer.layers.remove(b_layer)
-        
-        _, _, _, _, bnd_npz = get_output_paths(
-            image_path, command.marker_col, output_root, sigma
-        )
-        paths = []
-        if (not force) and os.path.exists(bnd_npz):
-            paths = load_boundary_paths_npz(bnd_npz)
-        else:
-            paths = density_to_boundary_paths(
-                density, percentile=95.0, simplify_tol=4.0, min_vertices=20
-            )
-            save_boundary_paths_npz(paths, bnd_npz)
-        
-        if paths:
-            edge_colors = [[1.0, 1.0, 1.0, 1.0]] * len(paths)
-            face_colors = [[0.0, 0.0, 0.0, 0.0]] * len(paths)
-            viewer.add_shapes(
-                paths,
-                shape_type="path",
-                edge_color=edge_colors,
-                face_color=face_colors,
-                edge_width=2.0,
-                name=bname,
-                blending="translucent",
-                visible=True,
-            )
-        
-        msg = zoom_to_dense_region(viewer, lname)
-        return f"Density updated (sigma={sigma}, cmap={cmap}, force={force}). {msg}"
+
+        for marker_col, (density, _, scale) in layers.items():
+            paths = ensure_boundary_paths(density, output_root, force_recompute=force)
+            set_boundary_layer(viewer, f"{marker_col}_density_boundary", paths, scale=scale, visible=True)
+
+        msg = zoom_to_dense_region(viewer, layers[command.marker_col][1])
+        which = f" for {', '.join(markers)}" if len(markers) > 1 else ""
+        return f"Density updated{which} (sigma={sigma}, cmap={cmap}, force={force}). {msg}"
     except Exception as e:
         raise CommandExecutionError(f"Failed to update density: {e}") from e
 
 
+@register_handler("special_goto_hotspot")
+def handle_goto_hotspot(command: CmdGotoHotspot, viewer: "Viewer") -> str:
+    """Zoom to a numbered hotspot of a density layer, or to the next/previous one."""
+    lname = f"{command.marker_col}_density"
+    ly = find_layer(viewer, lname)
+    if not ly:
+        raise CommandExecutionError(
+            f"Density layer '{lname}' not found. Run special_update_density for {command.marker_col} first."
+        )
+    ly.visible = True
+    step = {"next": 1, "previous": -1}.get(command.direction or "", 0)
+    index = command.hotspot if command.hotspot is not None or step else 1
+    return zoom_to_hotspot(viewer, lname, index=index, step=step)
+
+
 __all__ = [
+    "handle_goto_hotspot",
     "handle_show_density",
     "handle_update_density",
 ]
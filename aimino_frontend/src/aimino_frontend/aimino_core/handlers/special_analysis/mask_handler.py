@@ -38,8 +38,11 @@ def handle_load_marker_data(command: CmdLoadMarkerData, viewer: "Viewer") -> str
             command.marker_col,
             str(ctx.output_root),
             force_recompute=command.force_recompute,
+            preview=command.preview,
+            preview_downsample=command.preview_downsample,
         )
-        return f"Loaded marker data for {command.marker_col} from {ctx.h5ad_path.name}"
+        mode = " (preview)" if command.preview and not command.force_recompute else ""
+        return f"Loaded marker data{mode} for {command.marker_col} from {ctx.h5ad_path.name}"
     except Exception as e:
         raise CommandExecutionError(f"Failed to load marker data: {e}") from e
 
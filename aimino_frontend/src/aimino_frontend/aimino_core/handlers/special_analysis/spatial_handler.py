@@ -0,0 +1,68 @@
+"""Viewport and region-of-interest cell statistics."""
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from ...cell_table import open_cell_table
+from ...command_models import CmdCountCellsInView
+from ...data_store import resolve_dataset_context
+from ...errors import CommandExecutionError
+from ...registry import register_handler
+from .utils.points_lod import view_box
+from .utils.spatial_index import open_spatial_index
+
+if TYPE_CHECKING:
+    from napari.viewer import Viewer
+
+
+@register_handler("special_count_cells_in_view")
+def handle_count_cells_in_view(command: CmdCountCellsInView, viewer: "Viewer") -> str:
+    """Count cells (optionally marker-positive ones) in the view, a box or a polygon."""
+    try:
+        ctx = resolve_dataset_context(
+            command.dataset_id,
+            command.image_path,
+            command.h5ad_path,
+            command.output_root,
+        )
+    except (ValueError, FileNotFoundError, RuntimeError) as exc:
+        raise CommandExecutionError(str(exc)) from exc
+
+    obs = open_cell_table(ctx.h5ad_path, ctx.output_root)
+    if command.marker_col and command.marker_col not in obs:
+        markers = ", ".join(obs.marker_columns) or "(none)"
+        raise CommandExecutionError(f"Marker column '{command.marker_col}' not found. Markers: {markers}")
+
+    try:
+        index = open_spatial_index(ctx.h5ad_path, ctx.output_root)
+        if command.polygon is not None:
+            # commands use (x, y) like zoom_box; the index is (y, x)
+            ids = index.cells_in_polygon(np.asarray(command.polygon, dtype=float)[:, ::-1])
+            region = f"the {len(command.polygon)}-vertex polygon"
+        else:
+            if command.box is not None:
+                x1, y1, x2, y2 = command.box
+                box = (y1, x1, y2, x2)
+                region = "the box"
+            else:
+                box = view_box(viewer, margin=0.0)
+                if box is None:
+                    raise CommandExecutionError("Cannot determine the current view; pass a box instead.")
+                region = "view"
+            ids = index.cells_in_box(*box)
+    except CommandExecutionError:
+        raise
+    except Exception as e:
+        raise CommandExecutionError(f"Failed to query cells: {e}") from e
+
+    if not command.marker_col:
+        return f"{len(ids)} of {index.n_cells} cells in {region}."
+    positive = int(np.count_nonzero(obs.positive_at(command.marker_col, ids))) if len(ids) else 0
+    share = f" ({100.0 * positive / len(ids):.1f}%)" if len(ids) else ""
+    return f"{positive} {command.marker_col} cells of {len(ids)} cells in {region}{share}."
+
+
+__all__ = [
+    "handle_count_cells_in_view",
+]
@@ -2,21 +2,47 @@
 
 from .image_processing import (
     load_image_for_mask,
+    mask_shape_for,
+    mask_downsample_for,
     _to_2d_gray_safe,
 )
 from .mask_processing import (
     rebuild_labels_from_obs_safe,
     _ensure_labels,
     _ensure_mask,
+    _ensure_masks,
+    build_marker_masks,
     add_marker_mask_from_h5ad,
 )
 from .density_processing import (
     density_to_boundary_paths,
-    save_boundary_paths_npz,
-    load_boundary_paths_npz,
+    ensure_boundary_paths,
+    save_boundary_paths,
+    load_boundary_paths,
+    set_boundary_layer,
     _ensure_density_layer,
+    _ensure_density_layers,
     zoom_to_dense_region,
+    zoom_to_hotspot,
 )
+from .density_grid import compute_density, grid_cell_for
+from .density_store import ensure_densities, ensure_density, refine_density
+from .artifacts import Artifact, RaggedArray, open_artifact, save_artifact
+from .artifact_cache import ArtifactCache, ArtifactKey, open_artifact_cache
+from .tiff_access import TiffPlane, open_plane
+from .rasterize import rasterize_ellipses
+from .raster_store import LazyRaster, open_raster, read_raster, write_levels, write_raster
+from .pyramid import (
+    build_pyramid,
+    ensure_pyramid,
+    on_pyramid_ready,
+    open_pyramid,
+    schedule_pyramid,
+)
+from .neighbor_graph import NeighborGraph, open_neighbor_graph
+from .neighbor_search import within_radius
+from .points_lod import PointsLOD
+from .spatial_index import SpatialIndex, open_spatial_index
 from .neighborhood import (
     compute_tumor_neighborhood_layers,
 )
@@ -31,16 +57,55 @@ from .helpers import (
 
 __all__ = [
     "load_image_for_mask",
+    "mask_shape_for",
+    "mask_downsample_for",
     "_to_2d_gray_safe",
     "rebuild_labels_from_obs_safe",
     "_ensure_labels",
     "_ensure_mask",
+    "_ensure_masks",
+    "build_marker_masks",
     "add_marker_mask_from_h5ad",
     "density_to_boundary_paths",
-    "save_boundary_paths_npz",
-    "load_boundary_paths_npz",
+    "ensure_boundary_paths",
+    "save_boundary_paths",
+    "load_boundary_paths",
+    "set_boundary_layer",
     "_ensure_density_layer",
+    "_ensure_density_layers",
     "zoom_to_dense_region",
+    "zoom_to_hotspot",
+    "compute_density",
+    "grid_cell_for",
+    "ensure_densities",
+    "ensure_density",
+    "refine_density",
+    "Artifact",
+    "RaggedArray",
+    "open_artifact",
+    "save_artifact",
+    "ArtifactCache",
+    "ArtifactKey",
+    "open_artifact_cache",
+    "TiffPlane",
+    "open_plane",
+    "rasterize_ellipses",
+    "LazyRaster",
+    "open_raster",
+    "read_raster",
+    "write_levels",
+    "write_raster",
+    "build_pyramid",
+    "ensure_pyramid",
+    "on_pyramid_ready",
+    "open_pyramid",
+    "schedule_pyramid",
+    "NeighborGraph",
+    "open_neighbor_graph",
+    "within_radius",
+    "PointsLOD",
+    "SpatialIndex",
+    "open_spatial_index",
     "compute_tumor_neighborhood_layers",
     "find_layer_simple",
     "list_layers",
@@ -0,0 +1,413 @@
+"""Content-addressed, disk-bounded cache of derived artifacts.
+
+Derived files (density levels, contour boundaries) are named by a hash of
+everything that determines their content: the artifact kind, a signature of
+the source data, the full parameter set and an algorithm version. Changing
+any of them yields a new name, so no lookup can return an artifact computed
+from other inputs, and nearby parameters (sigma 199.6 vs 200.4) never
+collide.
+
+Each output root has one cache directory (``<output_root>/cache``) with an
+``index.json`` recording, per artifact, its kind, parameters, size, creation
+time and last access. After every insert the cache is trimmed to
+``ARTIFACT_CACHE_QUOTA_MB`` by evicting least-recently-used artifacts, then
+all caches under the data root are trimmed together to
+``ARTIFACT_CACHE_GLOBAL_QUOTA_MB``. The artifact just written is never
+evicted by its own insert.
+
+Lookups only update access times in memory; the index is written on
+inserts and removals, at most every ``ARTIFACT_CACHE_FLUSH_SECONDS`` on
+lookups, and at exit. Writers take ``index.lock`` and merge their view with
+the index on disk, so processes sharing a data root do not drop each
+other's entries. The global quota keeps a running total of the bytes
+inserted and only scans the data root when the total crosses the quota or
+the last scan is older than ``ARTIFACT_CACHE_RESCAN_SECONDS``.
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from ....data_store import ARTIFACT_CACHE_DIR, get_data_root
+from ....object_cache import get_object_cache
+from .artifacts import remove_artifact
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_CACHE_INDEX = "index.json"
+ARTIFACT_CACHE_LOCK = "index.lock"
+ARTIFACT_CACHE_VERSION = 1
+# Disk quota of one output root's artifact cache, in MiB (0: unbounded).
+ARTIFACT_CACHE_QUOTA_MB = float(os.getenv("AIMINO_ARTIFACT_CACHE_QUOTA_MB", "4096"))
+# Disk quota of all artifact caches under the data root, in MiB (0: unbounded).
+ARTIFACT_CACHE_GLOBAL_QUOTA_MB = float(os.getenv("AIMINO_ARTIFACT_CACHE_GLOBAL_QUOTA_MB", "20480"))
+# Seconds lookups may keep access times in memory before the index is written.
+ARTIFACT_CACHE_FLUSH_SECONDS = 30.0
+# Seconds between full scans of the data root for the global quota.
+ARTIFACT_CACHE_RESCAN_SECONDS = 300.0
+# Hex digits of the key hash used in file names.
+_NAME_DIGITS = 24
+# A lock file older than this is left over from a crashed writer.
+_LOCK_STALE_SECONDS = 10.0
+
+
+class ArtifactKey(NamedTuple):
+    """Everything that determines an artifact's content.
+
+    ``source`` and ``params`` must be JSON-serializable; ``version`` is
+    bumped whenever the producing algorithm changes its output.
+    """
+
+    kind: str
+    source: Any
+    params: Dict[str, Any]
+    version: int
+    suffix: str = ""
+
+    @property
+    def digest(self) -> str:
+        blob = json.dumps(
+            {"kind": self.kind, "source": self.source, "params": self.params, "version": self.version},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    @property
+    def name(self) -> str:
+        return f"{self.kind}-{self.digest[:_NAME_DIGITS]}{self.suffix}"
+
+
+def _disk_size(path: Path) -> int:
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+    return path.stat().st_size if path.exists() else 0
+
+
+def _entry_bytes(entry: dict) -> int:
+    return sys.getsizeof(entry) + sys.getsizeof(entry["params"])
+
+
+def _invalidate_objects(paths: Iterable[Path]) -> None:
+    """Drop in-process object-cache entries of removed artifacts (call without holding a cache lock)."""
+    resolved = [str(p.resolve()) for p in paths]
+    if resolved:
+        get_object_cache().invalidate(lambda k: isinstance(k, tuple) and any(r in k for r in resolved))
+
+
+def _source_digest(source: Any) -> str:
+    return hashlib.sha256(json.dumps(source, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+class ArtifactCache:
+    """Index of the artifacts in one cache directory, trimmed LRU-first to a byte quota."""
+
+    def __init__(self, root: str | Path, quota_bytes: Optional[int] = None) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.quota_bytes = int(ARTIFACT_CACHE_QUOTA_MB * 1024**2) if quota_bytes is None else int(quota_bytes)
+        self._lock = threading.RLock()
+        self._entries: Dict[str, dict] = self._load_index()
+        self._index_bytes = sum(_entry_bytes(e) for e in self._entries.values())
+        self._removed: set = set()
+        self._dirty = False
+        self._flushed = time.monotonic()
+        _OPEN_CACHES.add(self)
+
+    # no open files; the in-memory index is what the object cache pays for
+    cache_handles = 0
+
+    def __sizeof__(self) -> int:
+        # lock-free: the object cache measures entries from other threads
+        return object.__sizeof__(self) + self._index_bytes
+
+    # -- index -----------------------------------------------------------
+    def _load_index(self) -> Dict[str, dict]:
+        try:
+            with (self.root / ARTIFACT_CACHE_INDEX).open("r", encoding="utf-8") as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if info.get("version") != ARTIFACT_CACHE_VERSION:
+            return {}
+        # artifacts deleted behind our back are forgotten
+        return {name: e for name, e in info.get("entries", {}).items() if (self.root / name).exists()}
+
+    @contextmanager
+    def _index_lock(self):
+        """Hold ``index.lock`` (shared with other processes) while rewriting the index."""
+        lock = self.root / ARTIFACT_CACHE_LOCK
+        while True:
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    stale = time.time() - lock.stat().st_mtime > _LOCK_STALE_SECONDS
+                except FileNotFoundError:
+                    continue
+                if stale:
+                    logger.warning(f"[cache] breaking stale lock {lock}")
+                    lock.unlink(missing_ok=True)
+                else:
+                    time.sleep(0.01)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            lock.unlink(missing_ok=True)
+
+    def _save_index(self) -> None:
+        """Merge this process's view into the index on disk and write it back."""
+        if not self.root.is_dir():
+            return  # wiped (e.g. clear_processed_cache); nothing left to index
+        with self._index_lock():
+            merged = self._load_index()  # entries other processes added meanwhile
+            for name in self._removed:
+                merged.pop(name, None)
+            for name, entry in self._entries.items():
+                other = merged.get(name)
+                if other is not None:
+                    entry["atime"] = max(entry["atime"], other["atime"])
+                merged[name] = entry
+            self._entries = {n: e for n, e in merged.items() if (self.root / n).exists()}
+            self._index_bytes = sum(_entry_bytes(e) for e in self._entries.values())
+            tmp = self.root / f"{ARTIFACT_CACHE_INDEX}.{os.getpid()}.tmp"
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump({"version": ARTIFACT_CACHE_VERSION, "entries": self._entries}, f, indent=1)
+            os.replace(tmp, self.root / ARTIFACT_CACHE_INDEX)
+        self._removed.clear()
+        self._dirty = False
+        self._flushed = time.monotonic()
+
+    def flush(self) -> None:
+        """Write access times recorded by lookups since the last index write."""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def close(self) -> None:
+        self.flush()
+
+    # -- lookups ---------------------------------------------------------
+    def path(self, key: ArtifactKey) -> Path:
+        """Where the artifact for ``key`` lives (whether or not it exists yet)."""
+        return self.root / key.name
+
+    def get(self, key: ArtifactKey) -> Optional[Path]:
+        """Path of the cached artifact for ``key`` (marking it used), or None."""
+        with self._lock:
+            entry = self._entries.get(key.name)
+            if entry is None:
+                return None
+            path = self.root / key.name
+            if not path.exists():
+                self._index_bytes -= _entry_bytes(self._entries.pop(key.name))
+                self._removed.add(key.name)
+                self._dirty = True
+                return None
+            entry["atime"] = time.time()
+            self._dirty = True
+            if time.monotonic() - self._flushed > ARTIFACT_CACHE_FLUSH_SECONDS:
+                self._save_index()
+            return path
+
+    def put(self, key: ArtifactKey) -> Path:
+        """Record the artifact just written at ``path(key)`` and enforce the quotas."""
+        path = self.path(key)
+        now = time.time()
+        size = _disk_size(path)
+        with self._lock:
+            old = self._entries.get(key.name)
+            entry = self._entries[key.name] = {
+                "kind": key.kind,
+                "key": key.digest,
+                "source": _source_digest(key.source),
+                "params": key.params,
+                "version": key.version,
+                "size": size,
+                "ctime": now,
+                "atime": now,
+            }
+            self._index_bytes += _entry_bytes(entry) - (_entry_bytes(old) if old else 0)
+            self._removed.discard(key.name)
+            self._save_index()
+        self.evict(self.quota_bytes, spare=[key.name])
+        _track_global_usage(size - (int(old["size"]) if old else 0))
+        enforce_global_quota(spare=[path])
+        return path
+
+    def entries(self, kind: str, source: Any = None, **params: Any) -> Dict[Path, dict]:
+        """Indexed artifacts of ``kind`` (from ``source``, if given) whose params include ``params``."""
+        digest = None if source is None else _source_digest(source)
+        with self._lock:
+            return {
+                self.root / name: dict(e)
+                for name, e in self._entries.items()
+                if e["kind"] == kind
+                and (digest is None or e["source"] == digest)
+                and all(e["params"].get(k) == v for k, v in params.items())
+            }
+
+    def usage(self) -> int:
+        """Bytes used by the indexed artifacts."""
+        with self._lock:
+            return sum(int(e["size"]) for e in self._entries.values())
+
+    # -- removal ---------------------------------------------------------
+    def remove(self, path: str | Path) -> None:
+        """Delete an artifact and forget it (also in the in-process object cache)."""
+        with self._lock:
+            self._forget(path)
+            self._save_index()
+        _invalidate_objects([self.root / Path(path).name])
+
+    def _forget(self, path: str | Path) -> int:
+        """Delete an artifact without rewriting the index or the object cache; return its indexed size."""
+        path = self.root / Path(path).name
+        with self._lock:
+            entry = self._entries.pop(path.name, None)
+            if entry is not None:
+                self._index_bytes -= _entry_bytes(entry)
+            self._removed.add(path.name)
+            self._dirty = True
+            remove_artifact(path)
+        size = int(entry["size"]) if entry else 0
+        _track_global_usage(-size)
+        return size
+
+    def lru(self) -> List[tuple]:
+        """``(atime, size, path)`` of every artifact, least recently used first."""
+        with self._lock:
+            return sorted((e["atime"], int(e["size"]), self.root / n) for n, e in self._entries.items())
+
+    def evict(self, max_bytes: int, spare: Iterable[str] = ()) -> int:
+        """Remove least-recently-used artifacts until at most ``max_bytes`` remain; return bytes freed."""
+        if max_bytes <= 0:
+            return 0
+        spare = set(spare)
+        freed, removed = 0, []
+        with self._lock:
+            used = self.usage()
+            for _, size, path in self.lru():
+                if used - freed <= max_bytes:
+                    break
+                if path.name in spare:
+                    continue
+                self._forget(path)
+                removed.append(path)
+                freed += size
+            if freed:
+                self._save_index()
+        _invalidate_objects(removed)
+        if freed:
+            logger.info(f"[cache] evicted {freed / 1024**2:.1f} MiB from {self.root}")
+        return freed
+
+
+_OPEN_CACHES: "weakref.WeakSet[ArtifactCache]" = weakref.WeakSet()
+# Running estimate of the bytes in all caches under the data root, refreshed by full scans.
+_GLOBAL_USAGE = {"root": None, "bytes": 0, "scanned": float("-inf")}
+_GLOBAL_LOCK = threading.Lock()
+
+
+@atexit.register
+def _flush_open_caches() -> None:
+    for cache in list(_OPEN_CACHES):
+        try:
+            cache.flush()
+        except OSError:
+            pass
+
+
+def _track_global_usage(delta: int) -> None:
+    with _GLOBAL_LOCK:
+        _GLOBAL_USAGE["bytes"] += delta
+
+
+def artifact_cache_dir(output_root: str | Path) -> Path:
+    """Return the artifact cache directory of ``output_root``."""
+    return Path(output_root) / ARTIFACT_CACHE_DIR
+
+
+def open_artifact_cache(output_root: str | Path) -> ArtifactCache:
+    """The (shared) artifact cache of ``output_root``."""
+    root = artifact_cache_dir(output_root).resolve()
+    cache = get_object_cache().get_or_load(("artifact_cache", str(root)), lambda: ArtifactCache(root))
+    if not root.exists():
+        # the directory was wiped (e.g. clear_processed_cache): start over
+        cache = get_object_cache().put(("artifact_cache", str(root)), ArtifactCache(root))
+    return cache
+
+
+def cache_roots() -> List[Path]:
+    """Artifact cache directories of the legacy and per-dataset output roots under the data root."""
+    data_root = get_data_root()
+    pattern = f"{ARTIFACT_CACHE_DIR}/{ARTIFACT_CACHE_INDEX}"
+    found = list(data_root.glob(f"*/{pattern}")) + list(data_root.glob(f"*/*/{pattern}"))
+    return sorted({p.parent for p in found})
+
+
+def enforce_global_quota(spare: Iterable[str | Path] = (), max_bytes: Optional[int] = None) -> int:
+    """Evict least-recently-used artifacts across all caches under the data root; return bytes freed."""
+    limit = int(ARTIFACT_CACHE_GLOBAL_QUOTA_MB * 1024**2) if max_bytes is None else int(max_bytes)
+    if limit <= 0:
+        return 0
+    data_root = str(get_data_root())
+    with _GLOBAL_LOCK:
+        fresh = (
+            _GLOBAL_USAGE["root"] == data_root
+            and time.monotonic() - _GLOBAL_USAGE["scanned"] < ARTIFACT_CACHE_RESCAN_SECONDS
+        )
+        if fresh and _GLOBAL_USAGE["bytes"] <= limit:
+            return 0
+    spare = {str(Path(p).resolve()) for p in spare}
+    caches = [open_artifact_cache(root.parent) for root in cache_roots()]
+    used = sum(c.usage() for c in caches)
+    freed = 0
+    if used > limit:
+        candidates = sorted(
+            (atime, size, path, cache) for cache in caches for atime, size, path in cache.lru()
+        )
+        touched, removed = set(), []
+        for _, size, path, cache in candidates:
+            if used - freed <= limit:
+                break
+            if str(path.resolve()) in spare:
+                continue
+            cache._forget(path)
+            touched.add(cache)
+            removed.append(path)
+            freed += size
+        for cache in touched:
+            cache.flush()
+        _invalidate_objects(removed)
+    with _GLOBAL_LOCK:
+        _GLOBAL_USAGE.update(root=data_root, bytes=used - freed, scanned=time.monotonic())
+    if freed:
+        logger.info(f"[cache] evicted {freed / 1024**2:.1f} MiB to stay within the global artifact quota")
+    return freed
+
+
+__all__ = [
+    "ARTIFACT_CACHE_DIR",
+    "ARTIFACT_CACHE_GLOBAL_QUOTA_MB",
+    "ARTIFACT_CACHE_QUOTA_MB",
+    "ArtifactCache",
+    "ArtifactKey",
+    "artifact_cache_dir",
+    "cache_roots",
+    "enforce_global_quota",
+    "open_artifact_cache",
+]
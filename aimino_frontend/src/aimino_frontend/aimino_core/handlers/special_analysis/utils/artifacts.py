@@ -0,0 +1,180 @@
+"""Memory-mappable artifact directories for derived geometry and masks.
+
+An artifact is a directory holding ``meta.json`` and one uncompressed
+``.npy`` file per buffer, so every buffer opens with
+``np.load(mmap_mode="r")`` and nothing is pickled. Three kinds of fields are
+supported:
+
+arrays
+    Stored as-is (``<name>.npy``).
+ragged
+    Sequences of arrays with a common trailing shape, such as contour paths:
+    one concatenated ``<name>.values.npy`` plus ``<name>.offsets.npy``
+    (``n + 1`` row offsets). Opening costs the same for ten or ten thousand
+    items; items are views into the mapped buffer.
+masks
+    Boolean arrays bit-packed into ``<name>.bits.npy``; the length is kept in
+    the metadata.
+
+Artifacts are written to a temporary directory and moved into place.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Dict, Iterable, Mapping, Optional
+
+import numpy as np
+
+ARTIFACT_FORMAT = "aimino-artifact"
+ARTIFACT_VERSION = 1
+ARTIFACT_META = "meta.json"
+
+
+class RaggedArray(Sequence):
+    """Read-only sequence of variable-length arrays backed by one buffer."""
+
+    def __init__(self, values: np.ndarray, offsets: np.ndarray) -> None:
+        self.values = values
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        n = len(self)
+        if not -n <= i < n:
+            raise IndexError(i)
+        i %= n
+        return self.values[int(self.offsets[i]) : int(self.offsets[i + 1])]
+
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+
+def pack_ragged(items: Iterable[np.ndarray], dtype=None) -> tuple[np.ndarray, np.ndarray]:
+    """Concatenate ``items`` along axis 0; return ``(values, offsets)``."""
+    items = [np.asarray(a, dtype=dtype) for a in items]
+    offsets = np.zeros(len(items) + 1, dtype=np.int64)
+    np.cumsum([len(a) for a in items], out=offsets[1:])
+    if items:
+        values = np.concatenate(items, axis=0)
+    else:
+        values = np.zeros((0,), dtype=dtype or np.float64)
+    return values, offsets
+
+
+def save_artifact(
+    path: str | Path,
+    *,
+    arrays: Optional[Mapping[str, np.ndarray]] = None,
+    ragged: Optional[Mapping[str, Iterable[np.ndarray]]] = None,
+    masks: Optional[Mapping[str, np.ndarray]] = None,
+    meta: Optional[dict] = None,
+    dtype=None,
+) -> Path:
+    """Write an artifact directory at ``path``, replacing any previous one.
+
+    ``dtype`` converts ragged items (e.g. ``np.float32`` for display geometry).
+    """
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    info: Dict[str, object] = {
+        "format": ARTIFACT_FORMAT,
+        "version": ARTIFACT_VERSION,
+        "arrays": [],
+        "ragged": [],
+        "masks": {},
+        "meta": meta or {},
+    }
+    try:
+        for name, arr in (arrays or {}).items():
+            np.save(tmp / f"{name}.npy", np.ascontiguousarray(arr), allow_pickle=False)
+            info["arrays"].append(name)
+        for name, items in (ragged or {}).items():
+            values, offsets = pack_ragged(items, dtype)
+            np.save(tmp / f"{name}.values.npy", values, allow_pickle=False)
+            np.save(tmp / f"{name}.offsets.npy", offsets, allow_pickle=False)
+            info["ragged"].append(name)
+        for name, mask in (masks or {}).items():
+            mask = np.asarray(mask, dtype=bool)
+            np.save(tmp / f"{name}.bits.npy", np.packbits(mask), allow_pickle=False)
+            info["masks"][name] = int(mask.size)
+        with (tmp / ARTIFACT_META).open("w", encoding="utf-8") as f:
+            json.dump(info, f, indent=2)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    remove_artifact(path)
+    os.replace(tmp, path)
+    return path
+
+
+class Artifact:
+    """An opened artifact; buffers are memory-mapped on first access."""
+
+    def __init__(self, root: Path, info: dict) -> None:
+        self.root = Path(root)
+        self.info = info
+        self.meta: dict = info.get("meta", {})
+
+    def _load(self, fname: str) -> np.ndarray:
+        return np.load(self.root / fname, mmap_mode="r", allow_pickle=False)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.info["arrays"] or name in self.info["ragged"] or name in self.info["masks"]
+
+    def array(self, name: str) -> np.ndarray:
+        if name not in self.info["arrays"]:
+            raise KeyError(name)
+        return self._load(f"{name}.npy")
+
+    def ragged(self, name: str) -> RaggedArray:
+        if name not in self.info["ragged"]:
+            raise KeyError(name)
+        return RaggedArray(self._load(f"{name}.values.npy"), self._load(f"{name}.offsets.npy"))
+
+    def mask(self, name: str) -> np.ndarray:
+        if name not in self.info["masks"]:
+            raise KeyError(name)
+        return np.unpackbits(self._load(f"{name}.bits.npy"), count=self.info["masks"][name]).view(bool)
+
+
+def open_artifact(path: str | Path) -> Optional[Artifact]:
+    """Open the artifact at ``path``; ``None`` when missing, unreadable or of another version."""
+    path = Path(path)
+    try:
+        with (path / ARTIFACT_META).open("r", encoding="utf-8") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if info.get("format") != ARTIFACT_FORMAT or info.get("version") != ARTIFACT_VERSION:
+        return None
+    return Artifact(path, info)
+
+
+def remove_artifact(path: str | Path) -> None:
+    """Delete an artifact directory (or a stray file of the same name)."""
+    path = Path(path)
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    elif path.exists():
+        path.unlink()
+
+
+__all__ = [
+    "Artifact",
+    "RaggedArray",
+    "open_artifact",
+    "pack_ragged",
+    "remove_artifact",
+    "save_artifact",
+]
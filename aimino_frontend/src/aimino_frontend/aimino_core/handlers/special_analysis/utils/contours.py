@@ -0,0 +1,160 @@
+"""Iso-contours of density maps.
+
+* ``histogram_quantile`` estimates a percentile of the positive values from a
+  fixed-size histogram accumulated block by block, without copying them out.
+* ``find_contours_tiled`` runs marching squares on overlapping tiles in a
+  thread pool. Neighbouring tiles share one row/column of samples, so a
+  contour crossing a seam ends in one tile exactly where it continues in the
+  next; ``stitch_paths`` joins those pieces back into whole contours.
+* ``simplify_paths`` is ``skimage.measure.approximate_polygon`` (Douglas-Peucker)
+  applied to all contours at once: each round splits every open segment of
+  every contour with a few array operations, instead of one Python step per
+  segment.
+
+Density maps are stored on a grid matched to sigma (see ``density_grid``), so
+contouring them is already cheap; tiling keeps very large grids bounded.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import numpy as np
+from skimage import measure
+
+# Side (in grid bins) of the tiles contoured in parallel; smaller maps are done in one go.
+CONTOUR_TILE = int(os.getenv("AIMINO_CONTOUR_TILE", "1024"))
+CONTOUR_WORKERS = int(os.getenv("AIMINO_CONTOUR_WORKERS", "0")) or min(8, os.cpu_count() or 1)
+HISTOGRAM_BINS = 65536
+
+
+def histogram_quantile(values, q: float, bins: int = HISTOGRAM_BINS, rows: int = 1024) -> float:
+    """Approximate ``np.quantile(values[values > 0], q)`` for values in [0, 1].
+
+    ``values`` (an array or a lazily decoded raster) is read in row blocks and
+    counted into ``bins`` equal bins, so memory stays constant; the result is
+    within one bin width of the exact quantile.
+    """
+    counts = np.zeros(bins, np.int64)
+    for y in range(0, values.shape[0], rows):
+        block = np.asarray(values[y : y + rows])
+        pos = block[block > 0]
+        counts += np.bincount(np.minimum((pos * bins).astype(np.int64), bins - 1), minlength=bins)
+    n = int(counts.sum())
+    if n == 0:
+        raise ValueError("no positive values")
+    cum = np.cumsum(counts)
+    target = q * (n - 1)
+    i = min(int(np.searchsorted(cum, target, side="right")), bins - 1)
+    before = cum[i - 1] if i else 0
+    frac = (target - before) / counts[i] if counts[i] else 0.0
+    return float((i + frac) / bins)
+
+
+def _tile_contours(density, level, y0, y1, x0, x1) -> List[np.ndarray]:
+    block = np.asarray(density[y0:y1, x0:x1])
+    return [c + (y0, x0) for c in measure.find_contours(block, level=level)]
+
+
+def _key(point) -> tuple:
+    return (round(float(point[0]), 6), round(float(point[1]), 6))
+
+
+def stitch_paths(pieces: List[np.ndarray]) -> List[np.ndarray]:
+    """Join contour pieces whose end point is another piece's start point."""
+    closed = [p for p in pieces if len(p) > 2 and _key(p[0]) == _key(p[-1])]
+    open_ = [p for p in pieces if not (len(p) > 2 and _key(p[0]) == _key(p[-1]))]
+    starts = {}
+    for i, p in enumerate(open_):
+        starts.setdefault(_key(p[0]), []).append(i)
+    has_pred = set()
+    for p in open_:
+        for j in starts.get(_key(p[-1]), []):
+            has_pred.add(j)
+
+    used = [False] * len(open_)
+
+    def _chain(i):
+        parts = [open_[i]]
+        used[i] = True
+        while True:
+            nxt = [j for j in starts.get(_key(parts[-1][-1]), []) if not used[j]]
+            if not nxt:
+                return parts
+            used[nxt[0]] = True
+            parts.append(open_[nxt[0]][1:])
+
+    out = list(closed)
+    # chains that start at the map border first, then the remaining loops
+    for i in [i for i in range(len(open_)) if i not in has_pred] + list(range(len(open_))):
+        if not used[i]:
+            out.append(np.concatenate(_chain(i)))
+    return out
+
+
+def simplify_paths(paths: List[np.ndarray], tolerance: float) -> List[np.ndarray]:
+    """Douglas-Peucker simplification of many paths, equal to ``approximate_polygon`` on each."""
+    if tolerance <= 0 or not paths:
+        return list(paths)
+    lengths = np.array([len(p) for p in paths])
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    coords = np.concatenate(paths).astype(np.float64, copy=False)
+    keep = np.zeros(len(coords), bool)
+    keep[starts] = keep[ends - 1] = True
+    seg_s, seg_e = starts, ends - 1
+    while True:
+        inner = seg_e - seg_s - 1
+        live = inner > 0
+        seg_s, seg_e, inner = seg_s[live], seg_e[live], inner[live]
+        if not len(seg_s):
+            break
+        seg = np.repeat(np.arange(len(seg_s)), inner)
+        k = seg_s[seg] + 1 + (np.arange(int(inner.sum())) - np.repeat(np.cumsum(inner) - inner, inner))
+        r0, c0 = coords[seg_s, 0][seg], coords[seg_s, 1][seg]
+        r1, c1 = coords[seg_e, 0][seg], coords[seg_e, 1][seg]
+        dr, dc = r1 - r0, c1 - c0
+        angle = -np.arctan2(dr, dc)
+        line = c0 * np.sin(angle) + r0 * np.cos(angle)
+        dr0, dc0 = coords[k, 0] - r0, coords[k, 1] - c0
+        dr1, dc1 = coords[k, 0] - r1, coords[k, 1] - c1
+        perp = ((dr0 * dr + dc0 * dc) > 0) & ((-dr1 * dr - dc1 * dc) > 0)
+        dist = np.where(
+            perp,
+            np.abs(coords[k, 0] * np.cos(angle) + coords[k, 1] * np.sin(angle) - line),
+            np.minimum(np.sqrt(dc0**2 + dr0**2), np.sqrt(dc1**2 + dr1**2)),
+        )
+        # first point of maximum distance within each segment
+        order = np.lexsort((k, -dist, seg))
+        first = order[np.r_[0, np.flatnonzero(np.diff(seg[order])) + 1]]
+        split = dist[first] > tolerance
+        mid = k[first[split]]
+        keep[mid] = True
+        seg_s, seg_e = np.r_[seg_s[split], mid], np.r_[mid, seg_e[split]]
+    return [coords[a:b][keep[a:b]] for a, b in zip(starts, ends)]
+
+
+def find_contours_tiled(density, level: float, tile: int | None = None, workers: int | None = None):
+    """``measure.find_contours(density, level)`` computed on parallel tiles and stitched."""
+    tile = tile or CONTOUR_TILE
+    H, W = density.shape
+    if H <= tile and W <= tile:
+        return _tile_contours(density, level, 0, H, 0, W)
+    jobs = [
+        (y0, min(H, y0 + tile + 1), x0, min(W, x0 + tile + 1))
+        for y0 in range(0, H - 1, tile)
+        for x0 in range(0, W - 1, tile)
+    ]
+    with ThreadPoolExecutor(max_workers=workers or CONTOUR_WORKERS) as pool:
+        results = pool.map(lambda job: _tile_contours(density, level, *job), jobs)
+        pieces = [c for tile_paths in results for c in tile_paths]
+    return stitch_paths(pieces)
+
+
+__all__ = [
+    "CONTOUR_TILE",
+    "find_contours_tiled",
+    "histogram_quantile",
+    "simplify_paths",
+    "stitch_paths",
+]
@@ -0,0 +1,106 @@
+"""Cell-density maps computed on a grid matched to the smoothing sigma.
+
+A Gaussian with sigma of a few hundred pixels carries no detail finer than a
+fraction of sigma, so smoothing at full image resolution wastes almost all of
+its work and memory. Instead, positive cells are counted into square bins of
+``grid_cell_for(sigma)`` full-resolution pixels, at least 4 per sigma
+(``np.bincount``, so several cells in one bin all count), and the Gaussian
+runs on that small grid with sigma expressed in bins. Bin ``(i, j)`` is centred on full-resolution pixel
+``(i * cell, j * cell)``, so showing the grid with layer ``scale=(cell, cell)``
+lines it up with the image.
+"""
+
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+# Minimum grid bins per sigma (4-8 after rounding bins down to a power of two).
+DENSITY_CELLS_PER_SIGMA = 4
+
+
+def grid_cell_for(sigma: float, cells_per_sigma: int | None = None) -> int:
+    """Bin size (full-resolution pixels) used for a density at ``sigma``.
+
+    Bins are powers of two, so the grid of a larger sigma is a subsampling
+    of the grid of a smaller one.
+    """
+    per_sigma = cells_per_sigma or DENSITY_CELLS_PER_SIGMA
+    cell = max(1, int(float(sigma) // per_sigma))
+    return 1 << (cell.bit_length() - 1)
+
+
+def grid_shape_for(shape, cell: int) -> tuple:
+    """Grid shape covering a full-resolution image of ``shape`` with bins of ``cell``."""
+    H, W = shape
+    return (int(round((H - 1) / cell)) + 1, int(round((W - 1) / cell)) + 1)
+
+
+def _bin_index(x, y, shape, cell: int):
+    gh, gw = grid_shape_for(shape, cell)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    ok = np.isfinite(x) & np.isfinite(y)
+    ix = np.clip(np.floor(np.where(ok, x, 0) / cell + 0.5), 0, gw - 1).astype(np.int64)
+    iy = np.clip(np.floor(np.where(ok, y, 0) / cell + 0.5), 0, gh - 1).astype(np.int64)
+    return iy * gw + ix, ok, (gh, gw)
+
+
+def bin_counts(x, y, shape, cell: int) -> np.ndarray:
+    """Count points ``(x, y)`` (full-resolution pixels) into a float32 grid."""
+    flat, ok, (gh, gw) = _bin_index(x, y, shape, cell)
+    counts = np.bincount(flat[ok], minlength=gh * gw)
+    return counts.reshape(gh, gw).astype(np.float32)
+
+
+def bin_counts_stack(x, y, selections, shape, cell: int) -> np.ndarray:
+    """Count the points selected by each boolean mask into a ``(M, gh, gw)`` float32 stack.
+
+    Bin indices are computed once for all points and shared by every selection.
+    """
+    flat, ok, (gh, gw) = _bin_index(x, y, shape, cell)
+    out = np.empty((len(selections), gh, gw), np.float32)
+    for m, sel in enumerate(selections):
+        out[m] = np.bincount(flat[ok & np.asarray(sel, bool)], minlength=gh * gw).reshape(gh, gw)
+    return out
+
+
+def smooth_normalized(counts: np.ndarray, sigma_cells: float) -> np.ndarray:
+    """Gaussian-smooth a count grid (or a stack of grids) and scale each to [0, 1]."""
+    sigmas = (0.0,) * (counts.ndim - 2) + (float(sigma_cells),) * 2
+    density = gaussian_filter(counts, sigmas)
+    mx = density.max(axis=(-2, -1), keepdims=True, initial=0)
+    np.divide(density, mx, out=density, where=mx > 0)
+    return density
+
+
+def compute_density(x, y, shape, sigma: float, cell: int | None = None):
+    """Normalized density of points ``(x, y)`` at ``sigma`` (full-resolution pixels).
+
+    Returns ``(density, cell)``: the float32 grid and its bin size, which is
+    also the layer scale that maps it onto the image.
+    """
+    cell = cell or grid_cell_for(sigma)
+    counts = bin_counts(x, y, shape, cell)
+    return smooth_normalized(counts, float(sigma) / cell), cell
+
+
+def compute_densities(x, y, selections, shape, sigma: float, cell: int | None = None):
+    """Densities of several point subsets (e.g. markers) of one cell table at once.
+
+    Binned together by ``bin_counts_stack`` and smoothed as one stack; returns
+    ``(stack, cell)`` with ``stack[m]`` equal to the density of ``selections[m]``.
+    """
+    cell = cell or grid_cell_for(sigma)
+    counts = bin_counts_stack(x, y, selections, shape, cell)
+    return smooth_normalized(counts, float(sigma) / cell), cell
+
+
+__all__ = [
+    "DENSITY_CELLS_PER_SIGMA",
+    "bin_counts",
+    "bin_counts_stack",
+    "compute_densities",
+    "compute_density",
+    "grid_cell_for",
+    "grid_shape_for",
+    "smooth_normalized",
+]
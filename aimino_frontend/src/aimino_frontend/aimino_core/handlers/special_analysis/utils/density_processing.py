@@ -1,132 +1,294 @@
 """Density map computation and visualization utilities."""
 
-import os
 import numpy as np
-from tifffile import imread
-from scipy.ndimage import gaussian_filter
-from skimage import measure
-from skimage.measure import approximate_polygon
-import napari
 import logging
+from pathlib import Path
+from typing import TYPE_CHECKING
 
-from .image_processing import load_image_for_mask
-from .helpers import find_layer_simple as find_layer, get_output_paths, set_view_box
+from ....data_store import _file_signature
+from ....obs_reader import positive_mask
+from .artifact_cache import ArtifactKey, open_artifact_cache
+from .artifacts import open_artifact, save_artifact
+from .contours import find_contours_tiled, histogram_quantile, simplify_paths
+from .density_store import ensure_densities, ensure_density
+from .geometry import path_segments, segments_to_vectors
+from .hotspots import find_hotspots
+from .pyramid import layer_data
+from .helpers import find_layer_simple as find_layer, set_view_box
+
+if TYPE_CHECKING:
+    from napari.viewer import Viewer
 
 logger = logging.getLogger(__name__)
 
+# Bumped whenever density_to_boundary_paths changes its output for the same inputs.
+CONTOUR_VERSION = 1
+
+
+def density_to_boundary_paths(density, percentile=95.0, simplify_tol=0.25, min_vertices=8):
+    """Convert density map to boundary paths using contour detection.
 
-def density_to_boundary_paths(density, percentile=95.0, simplify_tol=4.0, min_vertices=20):
-    """Convert density map to boundary paths using contour detection."""
-    vals = density[density > 0]
-    if vals.size == 0:
+    Paths are in density-grid coordinates; ``simplify_tol`` is in grid bins.
+    The level is estimated from a histogram of the positive values and large
+    maps are contoured in parallel tiles (see ``contours``).
+    """
+    try:
+        level = histogram_quantile(density, percentile / 100.0)
+    except ValueError:
         return []
-    level = np.quantile(vals, percentile / 100.0)
-    raw = measure.find_contours(density, level=level)
-    out = []
-    for c in raw:
-        if len(c) > min_vertices:
-            c = approximate_polygon(c, simplify_tol)
-            if len(c) > min_vertices:
-                out.append(c)
-    return out
+    raw = [c for c in find_contours_tiled(density, level) if len(c) > min_vertices]
+    return [c for c in simplify_paths(raw, simplify_tol) if len(c) > min_vertices]
 
 
-def save_boundary_paths_npz(paths, out_path: str):
-    """Save boundary paths to compressed NPZ file."""
-    np.savez_compressed(out_path, **{f"p{i}": arr for i, arr in enumerate(paths)})
+def save_boundary_paths(paths, out_path: str):
+    """Save boundary paths as one packed vertex buffer (see ``artifacts``)."""
+    save_artifact(out_path, ragged={"paths": paths}, dtype=np.float32)
 
 
-def load_boundary_paths_npz(path: str):
-    """Load boundary paths from NPZ file."""
-    if not os.path.exists(path):
+def load_boundary_paths(path: str):
+    """Open saved boundary paths as a memory-mapped ``RaggedArray`` (empty list if missing)."""
+    art = open_artifact(path)
+    if art is None or "paths" not in art:
         return []
-    with np.load(path, allow_pickle=False) as z:
-        keys = sorted([k for k in z.files if k.startswith("p")], key=lambda s: int(s[1:]))
-        return [z[k] for k in keys]
+    return art.ragged("paths")
 
 
-def _ensure_density_layer(
-    viewer: napari.Viewer,
-    raw_image_path: str,
-    obs,
-    marker_col: str,
-    output_root: str,
-    sigma=200.0,
-    colormap="magma",
-    force_recompute=False,
-    layer_name=None,
-    visible=False,
+def ensure_boundary_paths(
+    density, output_root: str, percentile=95.0, simplify_tol=0.25, min_vertices=8, force_recompute=False
 ):
-    """Ensure density layer exists, computing if necessary."""
-    img = load_image_for_mask(raw_image_path)
-    H, W = img.shape
-    _, _, _, dens_npy, _ = get_output_paths(raw_image_path, marker_col, output_root, sigma)
-
-    if (not force_recompute) and os.path.exists(dens_npy):
-        logger.info(f"[density] loading from {dens_npy}")
-        density = np.load(dens_npy)
-    else:
-        logger.info("[density] computing density map")
-        if marker_col not in obs.columns:
-            raise ValueError(f"obs missing '{marker_col}'")
-        s = obs[marker_col]
-        if s.dtype == bool:
-            pos_bool = s.to_numpy()
-        else:
-            pos_bool = (
-                s.astype(str)
-                .str.strip()
-                .str.lower()
-                .isin(["true", "t", "yes", "y", "1"])
-                .to_numpy()
-            )
-        pos_cells = obs.loc[pos_bool]
-        density = np.zeros((H, W), np.float32)
-        if len(pos_cells) > 0:
-            y = np.clip(pos_cells["Y_centroid"].astype(int), 0, H - 1)
-            x = np.clip(pos_cells["X_centroid"].astype(int), 0, W - 1)
-            density[y, x] = 1
-            density = gaussian_filter(density, float(sigma))
-            mx = float(density.max())
-            if mx > 0:
-                density /= mx
-        np.save(dens_npy, density)
-        logger.info(f"[density] saved to {dens_npy}")
+    """Boundary paths of a stored density level, from the artifact cache when possible.
 
-    lname = layer_name or f"{marker_col}_density"
+    The cache key covers the density artifact's signature and every contour
+    parameter, so a recomputed level or new parameters never reuse old paths.
+    """
+    cache = open_artifact_cache(output_root)
+    level = Path(density.path)
+    key = ArtifactKey(
+        "contours",
+        _file_signature(level),
+        {
+            "density": level.name,
+            "percentile": float(percentile),
+            "simplify_tol": float(simplify_tol),
+            "min_vertices": int(min_vertices),
+        },
+        CONTOUR_VERSION,
+        ".art",
+    )
+    path = None if force_recompute else cache.get(key)
+    if path is None:
+        paths = density_to_boundary_paths(density, percentile, simplify_tol, min_vertices)
+        path = cache.path(key)
+        save_boundary_paths(paths, str(path))
+        cache.put(key)
+    return load_boundary_paths(str(path))
+
+
+def set_boundary_layer(viewer: "Viewer", name: str, paths, scale=(1, 1), visible=True, edge_width=2.0):
+    """Replace layer ``name`` with the boundary ``paths`` drawn as one Vectors layer.
+
+    ``paths`` may be the ``RaggedArray`` from ``load_boundary_paths``; its
+    vertex buffer is turned into segments without per-path copies (see
+    ``geometry``). Returns the number of segments drawn.
+    """
+    existing = find_layer(viewer, name)
+    if existing is not None:
+        viewer.layers.remove(existing)
+    segments = path_segments(paths)
+    if not len(segments):
+        return 0
+    viewer.add_vectors(
+        segments_to_vectors(segments),
+        edge_color="white",
+        edge_width=edge_width,
+        vector_style="line",
+        name=name,
+        blending="translucent",
+        visible=visible,
+        scale=scale,
+    )
+    return len(segments)
+
+
+def _set_density_layer(viewer: "Viewer", density, cell: int, lname: str, colormap="magma", visible=False):
+    """Add or update the image layer ``lname`` showing ``density`` at grid scale ``cell``."""
     existing = find_layer(viewer, lname)
+    scale = (cell, cell)
+    data, multiscale = layer_data(density)
+    hotspots = getattr(density, "hotspots", None)
+    if hotspots is None:
+        hotspots = find_hotspots(density, cell, getattr(density, "sigma", 4.0 * cell))
+    metadata = {"hotspots": hotspots, "hotspot": 0}
     if existing is None:
         viewer.add_image(
-            density,
+            data,
             name=lname,
             colormap=colormap,
             opacity=0.6,
             blending="additive",
             contrast_limits=(0, 1),
             visible=visible,
+            multiscale=multiscale,
+            scale=scale,
+            metadata=metadata,
         )
     else:
-        existing.data = density
+        existing.data = data
+        existing.scale = scale
+        existing.metadata.update(metadata)
         existing.colormap = colormap
         existing.opacity = 0.6
         existing.contrast_limits = (0, 1)
         existing.blending = "additive"
         existing.visible = visible or existing.visible
-    return density, lname
+    return scale
+
+
+def _cells_source(obs):
+    """Source signature of a ``CellTable`` (None for plain obs mappings)."""
+    meta = getattr(obs, "meta", None)
+    return meta.get("source") if isinstance(meta, dict) else None
+
 
+def _ensure_density_layers(
+    viewer: "Viewer",
+    raw_image_path: str,
+    obs,
+    marker_cols,
+    output_root: str,
+    sigma=200.0,
+    colormap="magma",
+    force_recompute=False,
+    visible=False,
+):
+    """Ensure density layers ``<marker>_density`` exist for several markers.
 
-def zoom_to_dense_region(viewer: napari.Viewer, density_layer_name: str, zoom_margin=300):
-    """Zoom viewer to the densest region in density layer."""
+    The cell table is read once and markers without a usable cached level are
+    binned and smoothed together (see ``density_store.ensure_densities``).
+    Returns ``{marker_col: (density, layer_name, scale)}``.
+    """
+
+    def _positives(cols):
+        missing = [c for c in cols if c not in obs]
+        if missing:
+            raise ValueError(f"obs missing {', '.join(repr(c) for c in missing)}")
+        # centroids and sigma are in full-resolution pixels
+        return (
+            np.asarray(obs["X_centroid"]),
+            np.asarray(obs["Y_centroid"]),
+            [positive_mask(obs[c]) for c in cols],
+        )
+
+    levels = ensure_densities(
+        raw_image_path, _positives, list(marker_cols), output_root, sigma, force_recompute, _cells_source(obs)
+    )
+    out = {}
+    for col, density in levels.items():
+        lname = f"{col}_density"
+        scale = _set_density_layer(viewer, density, density.cell, lname, colormap, visible)
+        out[col] = (density, lname, scale)
+    return out
+
+
+def _ensure_density_layer(
+    viewer: "Viewer",
+    raw_image_path: str,
+    obs,
+    marker_col: str,
+    output_root: str,
+    sigma=200.0,
+    colormap="magma",
+    force_recompute=False,
+    layer_name=None,
+    visible=False,
+):
+    """Ensure density layer exists, computing if necessary.
+
+    The map is computed on a grid matched to ``sigma`` (see ``density_grid``),
+    or derived from a cached smaller sigma (see ``density_store``), and
+    returned as ``(density, layer_name, scale)``; ``scale`` maps grid bins to
+    full-resolution pixels and is used for the layer and its boundaries.
+    """
+
+    def _positive_centroids():
+        if marker_col not in obs:
+            raise ValueError(f"obs missing '{marker_col}'")
+        pos_bool = positive_mask(obs[marker_col])
+        # centroids and sigma are in full-resolution pixels
+        return np.asarray(obs["X_centroid"])[pos_bool], np.asarray(obs["Y_centroid"])[pos_bool]
+
+    density, cell = ensure_density(
+        raw_image_path,
+        _positive_centroids,
+        marker_col,
+        output_root,
+        sigma,
+        force_recompute=force_recompute,
+        source=_cells_source(obs),
+    )
+    lname = layer_name or f"{marker_col}_density"
+    scale = _set_density_layer(viewer, density, cell, lname, colormap, visible)
+    return density, lname, scale
+
+
+def _layer_hotspots(ly):
+    meta = getattr(ly, "metadata", None)
+    return meta.get("hotspots") if isinstance(meta, dict) else None
+
+
+def zoom_to_dense_region(viewer: "Viewer", density_layer_name: str, zoom_margin=300):
+    """Zoom viewer to the densest region in density layer.
+
+    Uses the layer's hotspot index when present, else scans the data.
+    """
     ly = find_layer(viewer, density_layer_name)
     if ly is None:
         return f"[warn] Density layer '{density_layer_name}' not found."
-    data = np.asarray(ly.data)
-    if data.ndim != 2 or data.max() <= 0:
+    data = ly.data[0] if getattr(ly, "multiscale", False) else ly.data
+    if data.ndim != 2:
         return "[warn] density map empty."
-    y, x = np.unravel_index(np.argmax(data), data.shape)
-    H, W = data.shape
+    # data -> world coordinates (density rasters may be stored at a coarser scale)
+    sy, sx = (float(v) for v in ly.scale[-2:])
+    H, W = data.shape[-2] * sy, data.shape[-1] * sx
+    hotspots = _layer_hotspots(ly)
+    if hotspots:
+        y, x = hotspots[0]["y"], hotspots[0]["x"]
+        ly.metadata["hotspot"] = 1
+    else:
+        data = np.asarray(data)
+        if data.ndim != 2 or data.max() <= 0:
+            return "[warn] density map empty."
+        y, x = np.unravel_index(np.argmax(data), data.shape)
+        y, x = int(y * sy), int(x * sx)
     x1, x2 = max(0, x - zoom_margin), min(W, x + zoom_margin)
     y1, y2 = max(0, y - zoom_margin), min(H, y + zoom_margin)
     set_view_box(viewer, x1, y1, x2, y2)
     return f"Zoomed to dense region near ({x},{y})."
 
+
+def zoom_to_hotspot(viewer: "Viewer", density_layer_name: str, index=None, step=0, zoom_margin=300):
+    """Zoom to hotspot ``index`` (1-based) of a density layer, or ``step`` hotspots from the current one."""
+    ly = find_layer(viewer, density_layer_name)
+    if ly is None:
+        return f"[warn] Density layer '{density_layer_name}' not found."
+    hotspots = _layer_hotspots(ly)
+    if not hotspots:
+        return f"[warn] No hotspots recorded for '{density_layer_name}'."
+    n = len(hotspots)
+    if index is None:
+        current = int(ly.metadata.get("hotspot") or 0)
+        index = (current - 1 + step) % n + 1 if current else (1 if step >= 0 else n)
+    if not 1 <= index <= n:
+        return f"[warn] Hotspot {index} does not exist; '{density_layer_name}' has {n} hotspots."
+    spot = hotspots[index - 1]
+    by0, bx0, by1, bx1 = spot["bbox"]
+    y, x = spot["y"], spot["x"]
+    set_view_box(
+        viewer,
+        max(0, min(bx0, x - zoom_margin)),
+        max(0, min(by0, y - zoom_margin)),
+        max(bx1, x + zoom_margin),
+        max(by1, y + zoom_margin),
+    )
+    ly.metadata["hotspot"] = index
+    return f"Zoomed to hotspot {index}/{n} near ({x},{y}), density {spot['value']:.2f}."
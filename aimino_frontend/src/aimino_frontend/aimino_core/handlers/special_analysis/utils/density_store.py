@@ -0,0 +1,269 @@
+"""Scale-space cache of density maps.
+
+Gaussians compose: blurring a density at ``sigma1`` by a further
+``sqrt(sigma2**2 - sigma1**2)`` gives the density at ``sigma2``. Every computed
+density is kept as a level of a small per-marker scale space (one artifact
+per sigma in the image's output directory), and a new sigma is derived from
+the closest cached smaller one instead of from the cell table. Because grid
+bins are powers of two (``grid_cell_for``), a coarser target grid is an exact
+subsampling of the blurred finer one.
+
+Levels live in the output root's artifact cache (see ``artifact_cache``),
+keyed by the image and cell-table signatures, the marker, the exact sigma,
+the quantization and ``DENSITY_VERSION``. At most ``DENSITY_CACHE_LEVELS``
+levels are kept per marker, least recently used first out; the finest level
+(from which all others can be derived) is never evicted.
+
+Levels are stored as tiled, compressed TIFFs quantized to ``DENSITY_BITS``
+(16 or 8) bits, with the grid scale, sigma, quantization step and hotspot
+index (see ``hotspots``) in the image description. ``load_density`` opens them as a ``DensityRaster``, which decodes
+only the tiles a slice touches and returns float32 values in [0, 1].
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+from tifffile import TiffFile, TiffWriter
+
+from ....data_store import _file_signature
+from ....image_probe import image_info
+from ....object_cache import get_object_cache, source_key
+from .artifact_cache import ArtifactKey, open_artifact_cache
+from .density_grid import compute_densities, grid_cell_for, grid_shape_for, smooth_normalized
+from .hotspots import find_hotspots
+from .raster_store import RASTER_COMPRESSION, RASTER_TILE, LazyRaster
+
+logger = logging.getLogger(__name__)
+
+DENSITY_CACHE_LEVELS = int(os.getenv("AIMINO_DENSITY_CACHE_LEVELS", "6"))
+# Quantization of stored density levels (16 or 8 bits).
+DENSITY_BITS = int(os.getenv("AIMINO_DENSITY_BITS", "16"))
+DENSITY_FORMAT = "aimino-density"
+# Bumped whenever stored levels change for the same inputs (format or algorithm).
+DENSITY_VERSION = 1
+
+
+class DensityRaster(LazyRaster):
+    """Lazily decoded density level, dequantized to float32 in [0, 1] on read."""
+
+    def __init__(self, path: str, level: int = 0) -> None:
+        super().__init__(path, level)
+        with TiffFile(self.path) as tf:
+            meta = json.loads(tf.pages[0].description)
+        if meta.get("format") != DENSITY_FORMAT:
+            raise ValueError(f"{self.path} is not a density artifact")
+        self.cell = int(meta["scale"])
+        self.sigma = float(meta["sigma"])
+        self._step = np.float32(meta["step"])
+        self._hotspots = meta.get("hotspots")
+        self.dtype = np.dtype(np.float32)
+
+    @property
+    def hotspots(self) -> list:
+        """Stored hotspot index (computed on first use for levels written without one)."""
+        if self._hotspots is None:
+            self._hotspots = find_hotspots(self, self.cell, self.sigma)
+        return self._hotspots
+
+    def __getitem__(self, key) -> np.ndarray:
+        return super().__getitem__(key) * self._step
+
+
+def save_density(
+    path: str, density: np.ndarray, cell: int, sigma: float, bits: int | None = None, hotspots=None
+) -> None:
+    """Quantize a [0, 1] density to ``bits`` and write it as a tiled, compressed TIFF."""
+    dtype = np.uint8 if (bits or DENSITY_BITS) <= 8 else np.uint16
+    top = np.iinfo(dtype).max
+    q = np.round(np.clip(density, 0.0, 1.0) * top).astype(dtype)
+    meta = {
+        "format": DENSITY_FORMAT,
+        "version": DENSITY_VERSION,
+        "scale": int(cell),
+        "sigma": float(sigma),
+        "step": 1.0 / top,
+        "hotspots": find_hotspots(density, cell, sigma) if hotspots is None else hotspots,
+    }
+    tmp = f"{path}.tmp"
+    try:
+        with TiffWriter(tmp) as tw:
+            tw.write(
+                q,
+                tile=(RASTER_TILE, RASTER_TILE),
+                compression=RASTER_COMPRESSION,
+                photometric="minisblack",
+                description=json.dumps(meta),
+                metadata=None,
+            )
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def load_density(path: str) -> DensityRaster:
+    """Open a stored density level (handles are shared in-process)."""
+    return get_object_cache().get_or_load(source_key("density", path), lambda: DensityRaster(path))
+
+
+def density_key(raw_image_path: str, marker_col: str, sigma: float, source=None) -> ArtifactKey:
+    """Cache key of the level of ``marker_col`` at ``sigma``.
+
+    ``source`` is the signature of the cell table the positives come from
+    (``CellTable.meta["source"]``), if known.
+    """
+    return ArtifactKey(
+        "density",
+        {"image": _file_signature(Path(raw_image_path)), "cells": source},
+        {"marker": marker_col, "sigma": float(sigma), "bits": DENSITY_BITS},
+        DENSITY_VERSION,
+        ".tif",
+    )
+
+
+def cached_levels(raw_image_path: str, marker_col: str, output_root: str, source=None) -> dict:
+    """Map of sigma -> artifact path for the cached levels of ``marker_col``."""
+    src = density_key(raw_image_path, marker_col, 0.0, source).source
+    entries = open_artifact_cache(output_root).entries("density", src, marker=marker_col, bits=DENSITY_BITS)
+    return {float(e["params"]["sigma"]): str(path) for path, e in entries.items()}
+
+
+def refine_density(density: np.ndarray, cell: int, sigma_from: float, sigma_to: float, shape):
+    """Derive the density at ``sigma_to`` from one at a smaller ``sigma_from``.
+
+    Returns ``(density, cell)`` on the grid ``compute_density`` would use for
+    ``sigma_to`` over a full-resolution image of ``shape``.
+    """
+    if sigma_to < sigma_from:
+        raise ValueError(f"cannot sharpen a density from sigma={sigma_from} to sigma={sigma_to}")
+    extra = np.sqrt(float(sigma_to) ** 2 - float(sigma_from) ** 2) / cell
+    out = smooth_normalized(np.asarray(density, dtype=np.float32), extra)
+    cell_to = max(cell, grid_cell_for(sigma_to))
+    step = cell_to // cell
+    gh, gw = grid_shape_for(shape, cell_to)
+    out = out[::step, ::step][:gh, :gw]
+    if out.shape != (gh, gw):
+        out = np.pad(out, ((0, gh - out.shape[0]), (0, gw - out.shape[1])), mode="edge")
+    return np.ascontiguousarray(out), cell_to
+
+
+def _prune_levels(raw_image_path: str, marker_col: str, output_root: str, keep: int, source=None) -> None:
+    """Drop the least recently used levels beyond ``keep`` (and their contours), sparing the finest unless ``keep`` is 0."""
+    cache = open_artifact_cache(output_root)
+    levels = cache.entries(
+        "density", density_key(raw_image_path, marker_col, 0.0, source).source, marker=marker_col, bits=DENSITY_BITS
+    )
+    if len(levels) <= keep:
+        return
+    finest = min(levels, key=lambda p: levels[p]["params"]["sigma"])
+    spare = [finest] if keep else []
+    others = sorted((p for p in levels if p not in spare), key=lambda p: levels[p]["atime"])
+    for path in others[: len(levels) - keep]:
+        for contour in cache.entries("contours", density=path.name):
+            cache.remove(contour)
+        cache.remove(path)
+        logger.info(f"[density] evicted scale-space level sigma={levels[path]['params']['sigma']:g}")
+
+
+def _from_cache(
+    raw_image_path: str, marker_col: str, output_root: str, sigma: float, shape, force_recompute: bool, source=None
+):
+    """The level at ``sigma`` if it is stored or derivable from a smaller stored one, else None."""
+    cache = open_artifact_cache(output_root)
+    key = density_key(raw_image_path, marker_col, sigma, source)
+    path = None if force_recompute else cache.get(key)
+    if path is not None:
+        logger.info(f"[density] loading from {path}")
+        return load_density(str(path))
+    if force_recompute:
+        # levels derived from the old cell table are stale too
+        _prune_levels(raw_image_path, marker_col, output_root, 0, source)
+        return None
+    levels = cached_levels(raw_image_path, marker_col, output_root, source)
+    below = [t for t in levels if t < float(sigma)]
+    if not below:
+        return None
+    # get() also marks the base level as used
+    base = load_density(str(cache.get(density_key(raw_image_path, marker_col, max(below), source))))
+    logger.info(f"[density] deriving {marker_col} sigma={sigma} from cached sigma={base.sigma}")
+    density, cell = refine_density(base, base.cell, base.sigma, sigma, shape)
+    return _store(raw_image_path, marker_col, output_root, sigma, density, cell, source)
+
+
+def _store(
+    raw_image_path: str, marker_col: str, output_root: str, sigma: float, density, cell: int, source=None
+):
+    cache = open_artifact_cache(output_root)
+    key = density_key(raw_image_path, marker_col, sigma, source)
+    path = str(cache.path(key))
+    save_density(path, density, cell, sigma)
+    cache.put(key)
+    logger.info(f"[density] saved {density.shape} grid (bin {cell}px) to {path}")
+    _prune_levels(raw_image_path, marker_col, output_root, DENSITY_CACHE_LEVELS, source)
+    # hand out the stored level, so cache hits and misses see the same values
+    return load_density(path)
+
+
+def ensure_densities(
+    raw_image_path: str, positives, marker_cols, output_root: str, sigma: float, force_recompute=False, source=None
+):
+    """Densities of several markers at ``sigma`` as ``{marker_col: DensityRaster}``.
+
+    Markers that are cached, or derivable from a cached smaller sigma, come
+    from the scale-space cache. The rest are computed together:
+    ``positives(cols)`` is called once with them and returns
+    ``(x, y, masks)``, the centroids in full-resolution pixels and one boolean
+    positive mask per column; they are binned and smoothed as one stack.
+    ``source`` is the cell-table signature that keys the cached levels.
+    """
+    shape = image_info(raw_image_path)["plane_shape"]
+    out = {}
+    for col in marker_cols:
+        level = _from_cache(raw_image_path, col, output_root, sigma, shape, force_recompute, source)
+        if level is not None:
+            out[col] = level
+    todo = [col for col in marker_cols if col not in out]
+    if todo:
+        logger.info(f"[density] computing density maps for {', '.join(todo)}")
+        x, y, masks = positives(todo)
+        stack, cell = compute_densities(x, y, masks, shape, sigma)
+        for col, density in zip(todo, stack):
+            out[col] = _store(raw_image_path, col, output_root, sigma, density, cell, source)
+    return {col: out[col] for col in marker_cols}
+
+
+def ensure_density(
+    raw_image_path: str, points, marker_col: str, output_root: str, sigma: float, force_recompute=False, source=None
+):
+    """Density of ``marker_col`` at ``sigma`` as ``(DensityRaster, cell)``, derived from the cache when possible.
+
+    ``points`` is a callable returning the positive centroids ``(x, y)`` in
+    full-resolution pixels; it is only called when no cached level can be used.
+    """
+
+    def _positives(_cols):
+        x, y = points()
+        return x, y, [np.ones(len(x), bool)]
+
+    density = ensure_densities(
+        raw_image_path, _positives, [marker_col], output_root, sigma, force_recompute, source
+    )[marker_col]
+    return density, density.cell
+
+
+__all__ = [
+    "DENSITY_BITS",
+    "DENSITY_CACHE_LEVELS",
+    "DensityRaster",
+    "cached_levels",
+    "density_key",
+    "ensure_densities",
+    "ensure_density",
+    "load_density",
+    "refine_density",
+    "save_density",
+]
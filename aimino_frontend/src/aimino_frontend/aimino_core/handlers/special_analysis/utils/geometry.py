@@ -0,0 +1,61 @@
+"""Merged line geometry for large overlays.
+
+napari triangulates every object of a Shapes layer separately, which takes
+minutes for hundreds of thousands of edges. Overlays made of straight pieces
+(Delaunay edges, contour boundaries) are instead drawn as one Vectors layer:
+each piece is a ``[start, end - start]`` row of a single ``(n, 2, 2)``
+float32 array, built with array operations from segments or from packed
+paths (a vertex buffer plus offsets, see ``artifacts``).
+"""
+
+import os
+from typing import Iterable
+
+import numpy as np
+
+from .artifacts import RaggedArray, pack_ragged
+
+# Delaunay edges longer than this multiple of the median edge length are not drawn.
+EDGE_MAX_FACTOR = float(os.getenv("AIMINO_EDGE_MAX_FACTOR", "4"))
+
+
+def path_segments(paths) -> np.ndarray:
+    """Consecutive vertex pairs of every path as ``(n, 2, 2)`` segments.
+
+    ``paths`` is a ``RaggedArray`` (used without copying its items) or any
+    iterable of ``(k, 2)`` vertex arrays.
+    """
+    if isinstance(paths, RaggedArray):
+        values, offsets = np.asarray(paths.values), np.asarray(paths.offsets)
+    else:
+        values, offsets = pack_ragged(list(paths), np.float32)
+    if len(values) < 2:
+        return np.zeros((0, 2, 2), dtype=np.float32)
+    values = values.reshape(len(values), -1)
+    keep = np.ones(len(values) - 1, dtype=bool)
+    # no segment from the last vertex of one path to the first of the next
+    ends = offsets[1:-1] - 1
+    keep[ends[(ends >= 0) & (ends < len(keep))]] = False
+    return np.stack([values[:-1][keep], values[1:][keep]], axis=1).astype(np.float32)
+
+
+def drop_long_segments(segments: np.ndarray, factor: float = EDGE_MAX_FACTOR) -> np.ndarray:
+    """Drop segments longer than ``factor`` times the median segment length (``factor <= 0``: keep all)."""
+    if factor <= 0 or not len(segments):
+        return segments
+    lengths = np.hypot(*(segments[:, 1] - segments[:, 0]).T)
+    return segments[lengths <= factor * np.median(lengths)]
+
+
+def segments_to_vectors(segments: Iterable) -> np.ndarray:
+    """``(n, 2, 2)`` segments ``[start, end]`` as napari vectors ``[start, end - start]`` (float32)."""
+    seg = np.asarray(segments, dtype=np.float32).reshape(-1, 2, 2)
+    return np.stack([seg[:, 0], seg[:, 1] - seg[:, 0]], axis=1)
+
+
+__all__ = [
+    "EDGE_MAX_FACTOR",
+    "drop_long_segments",
+    "path_segments",
+    "segments_to_vectors",
+]
@@ -21,16 +21,17 @@ def _output_dir_for_image(raw_image_path: str, output_root: str) -> str:
     return outdir
 
 
-def get_output_paths(raw_image_path: str, marker_col: str, output_root: str, sigma: float):
-    """Get all output file paths for a given image and marker."""
+def get_output_paths(raw_image_path: str, marker_col: str, output_root: str):
+    """Get the output directory, labels and marker mask paths for an image.
+
+    Artifacts that depend on parameters (density levels, contour boundaries)
+    are content-addressed in the artifact cache instead (see ``artifact_cache``).
+    """
     outdir = _output_dir_for_image(raw_image_path, output_root)
     base = _basename_noext(raw_image_path)
-    sigma_tag = int(round(float(sigma)))
     labels_tif = os.path.join(outdir, f"{base}_rebuilt_labels.tif")
     mask_tif = os.path.join(outdir, f"{base}_{marker_col}_mask.tif")
-    dens_npy = os.path.join(outdir, f"{base}_{marker_col}_density_sigma{sigma_tag}.npy")
-    bnd_npz = os.path.join(outdir, f"{base}_{marker_col}_density_boundary_sigma{sigma_tag}_p95.npz")
-    return outdir, labels_tif, mask_tif, dens_npy, bnd_npz
+    return outdir, labels_tif, mask_tif
 
 
 def find_layer_simple(viewer: "Viewer", name: str):
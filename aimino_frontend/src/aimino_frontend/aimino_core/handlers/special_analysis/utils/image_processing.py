@@ -2,51 +2,72 @@
 
 import os
 import numpy as np
-from tifffile import imread, TiffFile
 import logging
 
+from ....image_probe import image_info
+from ....object_cache import get_object_cache, source_key
+from .tiff_access import open_plane, rgb_to_gray
+
 logger = logging.getLogger(__name__)
 
 # Auto-downsample factor from environment (0=disabled, 2=2x, 4=4x, etc.)
 AUTO_DOWNSAMPLE = int(os.getenv("AIMINO_AUTO_DOWNSAMPLE", "0"))
 
 
-def _to_2d_gray_safe(arr):
-    """Convert array to 2D grayscale, handling various input shapes."""
+def _to_2d_gray_safe(arr, out=None):
+    """Convert array to 2D grayscale, handling various input shapes.
+
+    RGB input is converted in float32 row blocks (threaded) into ``out`` or a
+    new plane, so no full-size float temporaries are created.
+    """
     a = np.squeeze(arr)
     if a.ndim == 2:
-        return a
+        if out is None:
+            return a
+        out[...] = a
+        return out
     if a.ndim == 3 and a.shape[-1] in (3, 4):
-        rgb = a[..., :3].astype(float)
-        return (
-            0.2989 * rgb[..., 0] + 0.587 * rgb[..., 1] + 0.114 * rgb[..., 2]
-        ).astype(a.dtype)
-    return _to_2d_gray_safe(a[0])
+        return rgb_to_gray(a, out=out)
+    return _to_2d_gray_safe(a[0], out=out)
+
+
+def _downsample_factor(shape) -> int:
+    """Downsample factor ``load_image_for_mask`` applies to a 2D image of ``shape``."""
+    if AUTO_DOWNSAMPLE > 1:
+        return AUTO_DOWNSAMPLE
+    if max(shape) > 16384:
+        return (max(shape) // 16384) + 1
+    return 1
+
 
+def mask_shape_for(path: str) -> tuple:
+    """Return the (H, W) of ``load_image_for_mask(path)`` from the TIFF header only."""
+    H, W = image_info(path)["plane_shape"]
+    f = _downsample_factor((H, W))
+    return (-(-H // f), -(-W // f))
 
-def _apply_downsample(img: np.ndarray, factor: int) -> np.ndarray:
-    """Downsample image by given factor."""
-    if factor <= 1:
-        return img
-    logger.info(f"[image] auto-downsampling by {factor}x: {img.shape} -> {img.shape[0]//factor}x{img.shape[1]//factor}")
-    return img[::factor, ::factor]
+
+def mask_downsample_for(path: str) -> int:
+    """Factor between full-resolution pixels and the mask/density frame of ``path``."""
+    return _downsample_factor(image_info(path)["plane_shape"])
 
 
 def load_image_for_mask(path: str) -> np.ndarray:
-    """Load image from TIFF file for mask processing."""
-    logger.info(f"[image] loading image for mask from {path}")
-    with TiffFile(path) as tf:
-        arr = tf.series[0].asarray()
-    img = _to_2d_gray_safe(arr)
+    """Load image from TIFF file for mask processing (decoded once per process)."""
+    key = source_key("image", path, AUTO_DOWNSAMPLE)
+    return get_object_cache().get_or_load(key, lambda: _read_image_for_mask(path))
 
-    # Auto-downsample if enabled and image is large
-    if AUTO_DOWNSAMPLE > 1:
-        img = _apply_downsample(img, AUTO_DOWNSAMPLE)
-    elif max(img.shape) > 16384:
-        # Auto-calculate downsample factor to fit within 16k
-        factor = (max(img.shape) // 16384) + 1
-        logger.warning(f"[image] Image {img.shape} exceeds 16k, auto-downsampling by {factor}x")
-        img = _apply_downsample(img, factor)
-
-    return img
+
+def _read_image_for_mask(path: str) -> np.ndarray:
+    logger.info(f"[image] loading image for mask from {path}")
+    with open_plane(path) as plane:
+        # Auto-downsample if enabled, or to fit within 16k if the image is large
+        factor = _downsample_factor(plane.shape)
+        if factor > 1 and AUTO_DOWNSAMPLE <= 1:
+            logger.warning(f"[image] Image {plane.shape} exceeds 16k, auto-downsampling by {factor}x")
+        if factor > 1:
+            H, W = plane.shape
+            logger.info(f"[image] auto-downsampling by {factor}x: {plane.shape} -> {-(-H // factor)}x{-(-W // factor)}")
+        # Read block by block through the cheapest backend (memmap/zarr/chunk stream)
+        return plane.downsample(factor)
 
@@ -2,20 +2,27 @@
 
 import os
 import numpy as np
-from tifffile import imread, imwrite, TiffFile
-import anndata as ad
-import napari
 import logging
+from typing import TYPE_CHECKING
 
-from .image_processing import load_image_for_mask
+from ....cell_table import open_cell_table
+from ....image_probe import image_info
+from ....object_cache import get_object_cache, source_key
+from ....obs_reader import positive_mask
+from .image_processing import AUTO_DOWNSAMPLE, load_image_for_mask, mask_downsample_for, mask_shape_for
+from .pyramid import ensure_pyramid, layer_data, on_pyramid_ready
+from .rasterize import rasterize_ellipses_tiled
+from .raster_store import open_raster, read_raster, write_raster
 from .helpers import find_layer_simple as find_layer, list_layers, _parse_color, get_output_paths
 from .density_processing import (
     _ensure_density_layer,
-    density_to_boundary_paths,
-    load_boundary_paths_npz,
-    save_boundary_paths_npz,
+    ensure_boundary_paths,
+    set_boundary_layer,
 )
 
+if TYPE_CHECKING:
+    from napari.viewer import Viewer
+
 logger = logging.getLogger(__name__)
 
 # Configuration constants
@@ -23,50 +30,205 @@ ELLIPSE_VERTS = 36
 ORIENTATION_IS_DEGREES = False
 
 
-def rebuild_labels_from_obs_safe(obs, shape, ellipse_verts=ELLIPSE_VERTS, orientation_is_degrees=ORIENTATION_IS_DEGREES):
-    """Rebuild label image from observation dataframe with ellipse shapes."""
-    from skimage.draw import polygon
-    
-    H, W = shape
-    labels = np.zeros((H, W), np.int32)
-    cx = obs["X_centroid"]
-    cy = obs["Y_centroid"]
-    maj = obs["MajorAxisLength"]
-    minr = obs["MinorAxisLength"]
-    theta = obs["Orientation"]
-    a = np.maximum(maj / 2, 1)
-    b = np.maximum(minr / 2, 1)
+def rebuild_labels_from_obs_safe(
+    obs,
+    shape,
+    ellipse_verts=ELLIPSE_VERTS,
+    orientation_is_degrees=ORIENTATION_IS_DEGREES,
+    workers=None,
+    tile_size=None,
+):
+    """Rebuild label image from observation dataframe with ellipse shapes.
+
+    Cells are rasterized in batches against the analytic ellipse; where cells
+    overlap the earlier cell keeps the pixel. Large images are split into
+    tiles built in parallel (``AIMINO_LABEL_WORKERS`` / ``AIMINO_LABEL_TILE_SIZE``
+    unless ``workers`` / ``tile_size`` are given). ``ellipse_verts`` is
+    accepted for compatibility with the former polygon rasterizer and is unused.
+    """
+    a = np.maximum(np.asarray(obs["MajorAxisLength"], dtype=float) / 2, 1)
+    b = np.maximum(np.asarray(obs["MinorAxisLength"], dtype=float) / 2, 1)
+    theta = np.asarray(obs["Orientation"], dtype=float)
     if orientation_is_degrees:
         theta = np.deg2rad(theta)
-    angles = np.linspace(0, 2 * np.pi, ellipse_verts, endpoint=False)
-    cosA, sinA = np.cos(angles), np.sin(angles)
-    for x, y, aa, bb, th, cid in zip(cx, cy, a, b, theta, obs["CellID"]):
-        ex = x + aa * cosA * np.cos(th) - bb * sinA * np.sin(th)
-        ey = y + aa * cosA * np.sin(th) + bb * sinA * np.cos(th)
-        rr, cc = polygon(ey, ex, shape=(H, W))
-        bg = labels[rr, cc] == 0
-        labels[rr[bg], cc[bg]] = int(cid)
-    return labels
+    return rasterize_ellipses_tiled(
+        tuple(shape), obs["X_centroid"], obs["Y_centroid"], a, b, theta, obs["CellID"],
+        workers=workers, tile_size=tile_size,
+    )
+
+
+def _obs_in_frame(obs, factor: int):
+    """Scale cell geometry from full-resolution pixels into a frame downsampled by ``factor``."""
+    if factor <= 1:
+        return obs
+    frame = {c: obs[c] for c in ("CellID", "Orientation")}
+    for c in ("X_centroid", "Y_centroid", "MajorAxisLength", "MinorAxisLength"):
+        frame[c] = np.asarray(obs[c], dtype=float) / factor
+    return frame
+
+
+def _stored_shape(path: str) -> tuple:
+    """(H, W) of a stored raster, read from its header."""
+    try:
+        return tuple(image_info(path)["plane_shape"])
+    except Exception:
+        return ()
 
 
 def _ensure_labels(raw_image_path: str, obs, output_root: str, force_recompute: bool = False):
     """Ensure labels image exists, rebuilding if necessary."""
-    img = load_image_for_mask(raw_image_path)
-    H, W = img.shape
-    _, labels_tif, _, _, _ = get_output_paths(raw_image_path, "", output_root, 0)
-    if (not force_recompute) and os.path.exists(labels_tif):
-        labels = imread(labels_tif)
-        if labels.shape == (H, W):
-            logger.info(f"[labels] loaded from {labels_tif}")
+    H, W = mask_shape_for(raw_image_path)
+    _, labels_tif, _ = get_output_paths(raw_image_path, "", output_root)
+    cache = get_object_cache()
+    key = source_key("labels", raw_image_path, labels_tif, AUTO_DOWNSAMPLE)
+    if not force_recompute:
+        labels = cache.get(key)
+        if labels is not None and labels.shape == (H, W):
             return labels
+        if os.path.exists(labels_tif) and _stored_shape(labels_tif) == (H, W):
+            labels = read_raster(labels_tif)
+            logger.info(f"[labels] loaded from {labels_tif}")
+            return cache.put(key, labels)
     logger.info("[labels] rebuilding from obs")
-    labels = rebuild_labels_from_obs_safe(obs, (H, W))
+    labels = rebuild_labels_from_obs_safe(_obs_in_frame(obs, mask_downsample_for(raw_image_path)), (H, W))
     try:
-        imwrite(labels_tif, labels, dtype=np.int32)
+        write_raster(labels_tif, labels)
         logger.info(f"[labels] saved to {labels_tif}")
     except Exception as e:
         logger.warning(f"[labels] could not save labels_tif: {e}")
-    return labels
+    return cache.put(key, labels)
+
+
+def build_marker_masks(labels, cell_ids, positives: dict, block_rows: int = 1024) -> dict:
+    """Build uint8 masks for several markers in a single pass over ``labels``.
+
+    Each marker becomes one bit of a lookup table indexed by CellID; every
+    block of label rows is translated through the table once and the marker
+    bits are split out, so the cost scales with pixels, not pixels x markers.
+    """
+    names = list(positives)
+    lut_dtype = np.min_scalar_type(max(1, (1 << len(names)) - 1))
+    ids = np.asarray(cell_ids).astype(np.int64)
+    lut = np.zeros(int(ids.max(initial=0)) + 1, dtype=lut_dtype)
+    valid = ids >= 0
+    for bit, name in enumerate(names):
+        pos = np.asarray(positives[name], dtype=bool) & valid
+        lut[ids[pos]] |= lut_dtype.type(1 << bit)
+    lut[0] = 0  # background
+    masks = {name: np.zeros(labels.shape, np.uint8) for name in names}
+    for y0 in range(0, labels.shape[0], block_rows):
+        block = np.asarray(labels[y0 : y0 + block_rows])
+        codes = np.take(lut, block, mode="clip")
+        codes[block >= len(lut)] = 0  # ids not in the table
+        for bit, name in enumerate(names):
+            np.bitwise_and(codes >> bit, 1, out=masks[name][y0 : y0 + block_rows], casting="unsafe")
+    return masks
+
+
+def render_marker_preview(obs, marker_col: str, shape, factor: float) -> np.ndarray:
+    """uint8 mask of ``marker_col``'s positive cells drawn straight from the cell table.
+
+    Only positive cells are rasterized and no label image is needed; ``factor``
+    maps full-resolution cell geometry into the (coarser) target frame. Unlike
+    the exact mask, pixels shared with an overlapping negative cell count as
+    positive.
+    """
+    pos = positive_mask(obs[marker_col])
+    frame = _obs_in_frame(obs, factor)
+    col = lambda name: np.asarray(frame[name], dtype=float)[pos]
+    theta = col("Orientation")
+    if ORIENTATION_IS_DEGREES:
+        theta = np.deg2rad(theta)
+    drawn = rasterize_ellipses_tiled(
+        tuple(shape),
+        col("X_centroid"),
+        col("Y_centroid"),
+        np.maximum(col("MajorAxisLength") / 2, 1),
+        np.maximum(col("MinorAxisLength") / 2, 1),
+        theta,
+        np.ones(int(pos.sum()), np.int32),
+    )
+    return (np.asarray(drawn) > 0).astype(np.uint8)
+
+
+def _preview_masks(raw_image_path: str, obs, marker_cols, output_root: str, downsample: int = 1):
+    """Masks for a first look: exact ones if already available, else previews.
+
+    Returns ``{col: (mask, factor)}`` where ``factor`` is the mask's pixel size
+    in full-resolution pixels (for the layer scale).
+    """
+    f = mask_downsample_for(raw_image_path)
+    exact = _ensure_masks(raw_image_path, obs, marker_cols, output_root, build=False)
+    out = {col: (m, f) for col, m in exact.items()}
+    pf = f * max(1, int(downsample))
+    H, W = image_info(raw_image_path)["plane_shape"]
+    shape = (-(-H // pf), -(-W // pf))
+    cache = get_object_cache()
+    h5ad_path = getattr(obs, "h5ad_path", None)
+    for col in marker_cols:
+        if col in out:
+            continue
+        if h5ad_path is None:
+            m = render_marker_preview(obs, col, shape, pf)
+        else:
+            key = source_key("mask_preview", h5ad_path, str(raw_image_path), col, shape)
+            m = cache.get_or_load(key, lambda: render_marker_preview(obs, col, shape, pf))
+        logger.info(f"[mask] preview for {col} at 1/{pf} resolution")
+        out[col] = (m, pf)
+    return out
+
+
+def _ensure_masks(
+    raw_image_path: str,
+    obs,
+    marker_cols,
+    output_root: str,
+    force_recompute: bool = False,
+    build: bool = True,
+) -> dict:
+    """Ensure masks exist for several marker columns, building missing ones together.
+
+    With ``build=False`` only masks that are already cached or on disk are
+    returned (no label image is built).
+    """
+    logger.info(f"[mask] _ensure_masks for {list(marker_cols)} (force={force_recompute})")
+    H, W = mask_shape_for(raw_image_path)
+    cache = get_object_cache()
+    masks, missing = {}, {}
+
+    for marker_col in marker_cols:
+        _, _, mask_tif = get_output_paths(raw_image_path, marker_col, output_root)
+        key = source_key("mask", raw_image_path, mask_tif, AUTO_DOWNSAMPLE)
+        if not force_recompute:
+            m = cache.get(key)
+            if m is not None and m.shape == (H, W):
+                masks[marker_col] = m
+                continue
+            if os.path.exists(mask_tif) and _stored_shape(mask_tif) == (H, W):
+                # opened lazily: tiles are decoded only when a layer shows them
+                m = open_raster(mask_tif)
+                logger.info(f"[mask] opened mask from {mask_tif}")
+                masks[marker_col] = cache.put(key, m)
+                continue
+        missing[marker_col] = (mask_tif, key)
+
+    if not build:
+        return masks
+    if missing:
+        labels = _ensure_labels(raw_image_path, obs, output_root, force_recompute=force_recompute)
+        logger.info(f"[mask] building {len(missing)} mask(s) in one pass: {list(missing)}")
+        built = build_marker_masks(
+            labels, obs["CellID"], {col: positive_mask(obs[col]) for col in missing}
+        )
+        for marker_col, (mask_tif, key) in missing.items():
+            m = built[marker_col]
+            try:
+                write_raster(mask_tif, m, binary=True)
+                logger.info(f"[mask] saved to {mask_tif}")
+            except Exception as e:
+                logger.warning(f"[mask] could not save mask: {e}")
+            masks[marker_col] = cache.put(key, m)
+    return {col: masks[col] for col in marker_cols}
 
 
 def _ensure_mask(
@@ -77,82 +239,102 @@ def _ensure_mask(
     force_recompute: bool = False,
 ):
     """Ensure mask exists for given marker column, building if necessary."""
-    logger.info(f"[mask] _ensure_mask for {marker_col} (force={force_recompute})")
-    img = load_image_for_mask(raw_image_path)
-    H, W = img.shape
+    return _ensure_masks(raw_image_path, obs, [marker_col], output_root, force_recompute)[marker_col]
 
-    _, labels_tif, mask_tif, _, _ = get_output_paths(raw_image_path, marker_col, output_root, 0)
 
-    if (not force_recompute) and os.path.exists(labels_tif):
-        labels = imread(labels_tif)
-    else:
-        labels = _ensure_labels(raw_image_path, obs, output_root, force_recompute=force_recompute)
+def _follow_pyramid(layer, raw_image_path: str, output_root: str) -> None:
+    """Swap the full pyramid into ``layer`` on the UI thread once its build finishes."""
+    from superqt.utils import ensure_main_thread
 
-    s = obs[marker_col]
-    if s.dtype == bool:
-        pos_bool = s.to_numpy()
-    else:
-        pos_bool = (
-            s.astype(str)
-            .str.strip()
-            .str.lower()
-            .isin(["true", "t", "yes", "y", "1"])
-            .to_numpy()
-        )
-    pos_ids = np.unique(obs.loc[pos_bool, "CellID"].astype(int))
+    @ensure_main_thread
+    def swap(levels):
+        layer.data = levels
+        logger.info(f"[image] '{layer.name}' now has {len(levels)} pyramid levels")
 
-    if (not force_recompute) and os.path.exists(mask_tif):
-        m = imread(mask_tif).astype(np.uint8)
-        if m.shape == (H, W):
-            logger.info(f"[mask] loaded mask from {mask_tif}")
-            return m
-
-    logger.info("[mask] building new mask")
-    m = np.isin(labels, pos_ids).astype(np.uint8)
-    try:
-        imwrite(mask_tif, m, dtype=np.uint8)
-        logger.info(f"[mask] saved to {mask_tif}")
-    except Exception as e:
-        logger.warning(f"[mask] could not save mask: {e}")
-    return m
+    on_pyramid_ready(raw_image_path, output_root, swap)
 
 
 def add_marker_mask_from_h5ad(
-    viewer: napari.Viewer,
+    viewer: "Viewer",
     raw_image_path: str,
     h5ad_path: str,
     marker_col: str,
     output_root: str,
     force_recompute: bool = False,
+    preview: bool = False,
+    preview_downsample: int = 1,
 ):
-    """Add marker mask layer from h5ad file to napari viewer."""
+    """Add marker mask layer from h5ad file to napari viewer.
+
+    With ``preview`` the masks are drawn straight from the cell table (only
+    positive cells, optionally ``preview_downsample`` times coarser) unless
+    exact masks already exist; the label image is then built only when an
+    exact mask is requested.
+    """
     logger.info(f"[main] add_marker_mask_from_h5ad → outputs in {output_root}")
 
-    img = load_image_for_mask(raw_image_path)
+    # Mask rasters live in the (possibly downsampled) analysis frame;
+    # layer scale maps them onto full-resolution world coordinates.
+    f = mask_downsample_for(raw_image_path)
+    frame_scale = (f, f)
+
     base_name = os.path.basename(raw_image_path)
     if find_layer(viewer, base_name) is None:
-        viewer.add_image(img, name=base_name, visible=True)
-        logger.info(f"[image] added base image layer '{base_name}'")
+        levels = ensure_pyramid(raw_image_path, output_root)
+        if levels is not None:
+            layer = viewer.add_image(levels, multiscale=True, name=base_name, visible=True)
+            logger.info(f"[image] added multiscale base image layer '{base_name}' ({len(levels)} levels)")
+            if len(levels) == 1:  # reduced levels are still being built
+                _follow_pyramid(layer, raw_image_path, output_root)
+        else:
+            img = load_image_for_mask(raw_image_path)
+            viewer.add_image(img, name=base_name, visible=True, scale=frame_scale)
+            logger.info(f"[image] added base image layer '{base_name}'")
+
+    # Extra masks for CD45, CD20, CD3E
+    extra_markers = {
+        "CD45_positive": (0, 1, 0, 0.9),   # immune, green
+        "CD20_positive": (1, 0.5, 0, 0.9), # B cells, orange
+        "CD3E_positive": (1, 0, 1, 0.9),   # T cells, magenta
+    }
 
-    logger.info(f"[H5AD] reading {h5ad_path}")
-    adata = ad.read_h5ad(h5ad_path)
-    obs = adata.obs.copy()
+    logger.info(f"[H5AD] opening cell table for {h5ad_path}")
+    obs = open_cell_table(h5ad_path, output_root)
+
+    # Main + extra marker masks, built together in one pass over the labels
+    for col in extra_markers:
+        if col not in obs:
+            logger.warning(f"[extra mask] column {col} not in obs; skipping.")
+    panel = [marker_col] + [col for col in extra_markers if col in obs and col != marker_col]
+    if preview and not force_recompute:
+        resolved = _preview_masks(raw_image_path, obs, panel, output_root, preview_downsample)
+    else:
+        exact = _ensure_masks(raw_image_path, obs, panel, output_root, force_recompute=force_recompute)
+        resolved = {col: (m, f) for col, m in exact.items()}
+    masks = {col: m for col, (m, _) in resolved.items()}
+    mask_scale = {col: (mf, mf) for col, (_, mf) in resolved.items()}
 
     # Main marker mask
-    pos_mask = _ensure_mask(
-        raw_image_path, obs, marker_col, output_root, force_recompute=force_recompute
-    )
+    pos_mask = masks[marker_col]
     fg_rgba = _parse_color((1, 0, 0, 1))
     bg_rgba = (0, 0, 0, 0.0)
     color_map = {0: bg_rgba, 1: fg_rgba}
     lname = f"{marker_col}_mask"
     ly = find_layer(viewer, lname)
+    data, multiscale = layer_data(pos_mask)
     if ly is None:
         ly = viewer.add_labels(
-            pos_mask, name=lname, opacity=1.0, blending="translucent", visible=False
+            data,
+            name=lname,
+            opacity=1.0,
+            blending="translucent",
+            visible=False,
+            multiscale=multiscale,
+            scale=mask_scale[marker_col],
         )
     else:
-        ly.data = pos_mask
+        ly.data = data
+        ly.scale = mask_scale[marker_col]
         ly.visible = False
     try:
         ly.color = color_map
@@ -164,7 +346,7 @@ def add_marker_mask_from_h5ad(
         pass
 
     # Density layer + boundary
-    density, dname = _ensure_density_layer(
+    density, dname, dscale = _ensure_density_layer(
         viewer,
         raw_image_path,
         obs,
@@ -176,53 +358,29 @@ def add_marker_mask_from_h5ad(
         layer_name=f"{marker_col}_density",
         visible=False,
     )
-    _, _, _, _, bnd_npz = get_output_paths(raw_image_path, marker_col, output_root, 200.0)
-    paths = []
-    if (not force_recompute) and os.path.exists(bnd_npz):
-        paths = load_boundary_paths_npz(bnd_npz)
-    else:
-        paths = density_to_boundary_paths(
-            density, percentile=95.0, simplify_tol=4.0, min_vertices=20
-        )
-        save_boundary_paths_npz(paths, bnd_npz)
-    if paths:
-        edge_rgba = _parse_color((1, 1, 1, 1))
-        edge_colors = np.tile(np.array(edge_rgba, dtype=float), (len(paths), 1))
-        face_colors = np.tile(np.array([0, 0, 0, 0], dtype=float), (len(paths), 1))
-        bname = f"{marker_col}_density_boundary"
-        b_layer = find_layer(viewer, bname)
-        if b_layer is not None:
-            viewer.layers.remove(b_layer)
-        viewer.add_shapes(
-            paths,
-            shape_type="path",
-            edge_color=edge_colors,
-            face_color=face_colors,
-            edge_width=2.0,
-            name=bname,
-            blending="translucent",
-            visible=False,
-        )
+    paths = ensure_boundary_paths(density, output_root, force_recompute=force_recompute)
+    set_boundary_layer(viewer, f"{marker_col}_density_boundary", paths, scale=dscale, visible=False)
 
-    # Extra masks for CD45, CD20, CD3E
-    extra_markers = {
-        "CD45_positive": (0, 1, 0, 0.9),   # immune, green
-        "CD20_positive": (1, 0.5, 0, 0.9), # B cells, orange
-        "CD3E_positive": (1, 0, 1, 0.9),   # T cells, magenta
-    }
     for col, rgba in extra_markers.items():
-        if col not in obs.columns:
-            logger.warning(f"[extra mask] column {col} not in obs; skipping.")
+        if col not in masks:
             continue
-        m = _ensure_mask(raw_image_path, obs, col, output_root, force_recompute=force_recompute)
+        m = masks[col]
         lname = f"{col}_mask"
         ly = find_layer(viewer, lname)
+        data, multiscale = layer_data(m)
         if ly is None:
             ly = viewer.add_labels(
-                m, name=lname, opacity=1.0, blending="translucent", visible=False
+                data,
+                name=lname,
+                opacity=1.0,
+                blending="translucent",
+                visible=False,
+                multiscale=multiscale,
+                scale=mask_scale[col],
             )
         else:
-            ly.data = m
+            ly.data = data
+            ly.scale = mask_scale[col]
             ly.visible = False
         fg = _parse_color(rgba)
         cmap = {0: (0, 0, 0, 0), 1: fg}
@@ -0,0 +1,272 @@
+"""Persistent fixed-radius neighbor graph of a dataset's cells.
+
+The graph is built once per cell table at ``NEIGHBOR_GRAPH_RADIUS`` (or at
+a larger requested radius) and written next to the cell-table sidecar in
+``processed/``:
+
+``indptr.npy`` / ``indices.bin`` / ``distances.bin``
+    CSR adjacency without self-loops; the pair arrays are raw int32 (or
+    int64) and float32 buffers. Each row lists the neighbors of one cell
+    sorted by distance in pixels, so the neighbors within any smaller radius
+    are a prefix of the row and the ``k`` nearest are its first ``k`` entries.
+``meta.json``
+    Format version, radius, cell count and the h5ad file signature; the graph
+    is rebuilt when the source changes.
+
+All three are memory-mapped when opened, so radius sweeps, kNN lookups and
+neighbor counts only filter the stored pairs. Smaller radii are compared at
+float32 precision.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from ....cell_table import open_cell_table
+from ....data_store import _file_signature, _matches_signature
+from ....object_cache import get_object_cache, source_key
+
+logger = logging.getLogger(__name__)
+
+NEIGHBOR_GRAPH_DIR = "neighbor_graph"
+NEIGHBOR_GRAPH_META = "meta.json"
+NEIGHBOR_GRAPH_VERSION = 1
+# Radius (pixels) the graph is built at; larger radii are searched directly.
+NEIGHBOR_GRAPH_RADIUS = float(os.getenv("AIMINO_NEIGHBOR_GRAPH_RADIUS", "100"))
+# Cells whose neighbor lists are computed together while building.
+BUILD_CHUNK = 65536
+
+
+def neighbor_graph_dir(h5ad_path: str | Path, output_root: str | Path) -> Path:
+    """Return the graph directory for an h5ad file under ``output_root``."""
+    return Path(output_root) / NEIGHBOR_GRAPH_DIR / Path(h5ad_path).stem
+
+
+class NeighborGraph:
+    """Read-only CSR neighbor graph with distance-sorted rows."""
+
+    def __init__(self, root: Path, meta: dict) -> None:
+        self.root = Path(root)
+        self.meta = meta
+        self.radius = float(meta["radius"])
+        self.n_cells = int(meta["n_cells"])
+        self.indptr = np.load(self.root / "indptr.npy", mmap_mode="r")
+        self.indices = self._pairs("indices.bin", meta["index_dtype"])
+        self.distances = self._pairs("distances.bin", np.float32)
+        self._rows: Optional[np.ndarray] = None
+
+    def _pairs(self, name: str, dtype) -> np.ndarray:
+        nnz = int(self.meta["n_pairs"])
+        if not nnz:  # empty files cannot be mapped
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self.root / name, dtype=dtype, mode="r", shape=(nnz,))
+
+    @property
+    def cache_handles(self) -> int:
+        return sum(isinstance(a, np.memmap) for a in (self.indptr, self.indices, self.distances))
+
+    def __sizeof__(self) -> int:
+        return object.__sizeof__(self) + (0 if self._rows is None else int(self._rows.nbytes))
+
+    @property
+    def n_pairs(self) -> int:
+        return int(self.indptr[-1])
+
+    def rows(self) -> np.ndarray:
+        """Row (source cell) of every stored pair."""
+        if self._rows is None:
+            self._rows = np.repeat(np.arange(self.n_cells, dtype=np.int32), np.diff(self.indptr))
+        return self._rows
+
+    def _check(self, radius: float) -> np.float32:
+        if radius > self.radius:
+            raise ValueError(f"radius {radius} exceeds the graph radius {self.radius}")
+        return np.float32(radius)
+
+    def degree(self, radius: Optional[float] = None) -> np.ndarray:
+        """Number of neighbors of every cell within ``radius`` (default: graph radius)."""
+        if radius is None or radius >= self.radius:
+            return np.diff(self.indptr)
+        keep = self.distances <= self._check(radius)
+        return np.bincount(self.rows()[keep], minlength=self.n_cells)
+
+    def subgraph(self, radius: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """CSR ``(indptr, indices, distances)`` restricted to pairs within ``radius``."""
+        keep = self.distances <= self._check(radius)
+        counts = np.bincount(self.rows()[keep], minlength=self.n_cells)
+        indptr = np.zeros(self.n_cells + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return indptr, np.asarray(self.indices[keep]), np.asarray(self.distances[keep])
+
+    def knn(self, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """``(indices, distances)`` of the ``k`` nearest neighbors of every cell.
+
+        Only neighbors within the graph radius are known; missing slots hold
+        ``-1`` and ``inf``.
+        """
+        k = int(k)
+        idx = np.full((self.n_cells, k), -1, dtype=np.int64)
+        dist = np.full((self.n_cells, k), np.inf, dtype=np.float32)
+        if k <= 0:
+            return idx, dist
+        start = np.asarray(self.indptr[:-1])
+        avail = np.minimum(np.diff(self.indptr), k)
+        slot = np.arange(k)
+        valid = slot[None, :] < avail[:, None]
+        pos = (start[:, None] + slot[None, :])[valid]
+        idx[valid] = self.indices[pos]
+        dist[valid] = self.distances[pos]
+        return idx, dist
+
+    def nearest(self, sources: np.ndarray) -> np.ndarray:
+        """Distance from every cell to the closest other cell flagged in ``sources``.
+
+        Cells with no flagged neighbor within the graph radius get ``inf``. The
+        result does not depend on a radius, so callers keep it and compare it
+        against each radius of a sweep.
+        """
+        flagged = np.flatnonzero(np.asarray(sources, dtype=bool)[self.indices])
+        out = np.full(self.n_cells, np.inf, dtype=np.float32)
+        if not flagged.size:
+            return out
+        # rows are sorted by distance, so the first flagged pair of a row is the closest
+        first = np.searchsorted(flagged, np.asarray(self.indptr[:-1]))
+        hit = first < flagged.size
+        hit[hit] = flagged[first[hit]] < self.indptr[1:][hit]
+        out[hit] = self.distances[flagged[first[hit]]]
+        return out
+
+    def within(self, sources: np.ndarray, radius: float) -> np.ndarray:
+        """Boolean mask of cells within ``radius`` of any other cell flagged in ``sources``."""
+        return self.nearest(sources) <= self._check(radius)
+
+
+def _write_graph(points: np.ndarray, radius: float, tmp: Path) -> dict:
+    n = len(points)
+    tree = cKDTree(points)
+    index_dtype = np.dtype(np.int32 if n < 2**31 else np.int64)
+    counts = np.zeros(n, dtype=np.int64)
+    # rows are produced in order, so chunks are appended straight to the pair files
+    with (tmp / "indices.bin").open("wb") as fi, (tmp / "distances.bin").open("wb") as fd:
+        for lo in range(0, n, BUILD_CHUNK):
+            hi = min(n, lo + BUILD_CHUNK)
+            pairs = cKDTree(points[lo:hi]).sparse_distance_matrix(tree, radius, output_type="ndarray")
+            rows = pairs["i"].astype(np.int64) + lo
+            cols = pairs["j"].astype(np.int64)
+            off = rows != cols
+            rows, cols, dist = rows[off], cols[off], pairs["v"][off]
+            dist = dist.astype(np.float32)
+            # one sort on (row, distance): non-negative float32 bit patterns order like their values
+            key = ((rows - lo).astype(np.uint64) << np.uint64(32)) | dist.view(np.uint32).astype(np.uint64)
+            order = np.argsort(key)
+            cols[order].astype(index_dtype).tofile(fi)
+            dist[order].tofile(fd)
+            counts[lo:hi] = np.bincount(rows - lo, minlength=hi - lo)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    np.save(tmp / "indptr.npy", indptr)
+    return {
+        "version": NEIGHBOR_GRAPH_VERSION,
+        "radius": float(radius),
+        "n_cells": n,
+        "n_pairs": int(indptr[-1]),
+        "index_dtype": index_dtype.name,
+    }
+
+
+def build_neighbor_graph(
+    h5ad_path: str | Path, output_root: str | Path, radius: Optional[float] = None
+) -> NeighborGraph:
+    """Compute the neighbor graph of the cell centroids and write it under ``output_root``."""
+    h5ad_path = Path(h5ad_path)
+    radius = NEIGHBOR_GRAPH_RADIUS if radius is None else float(radius)
+    obs = open_cell_table(h5ad_path, output_root)
+    # (y, x) to match napari image coordinates
+    points = np.column_stack([np.asarray(obs["Y_centroid"]), np.asarray(obs["X_centroid"])]).astype(float)
+
+    target = neighbor_graph_dir(h5ad_path, output_root)
+    tmp = target.with_name(target.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    try:
+        meta = _write_graph(points, radius, tmp)
+        meta["source"] = _file_signature(h5ad_path)
+        with (tmp / NEIGHBOR_GRAPH_META).open("w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    shutil.rmtree(target, ignore_errors=True)
+    tmp.rename(target)
+    logger.info(
+        f"[neigh] neighbor graph for {h5ad_path.name}: {meta['n_cells']} cells, "
+        f"{meta['n_pairs']} pairs within r={radius:g} -> {target}"
+    )
+    return NeighborGraph(target, meta)
+
+
+def _load_meta(target: Path) -> Optional[dict]:
+    meta_file = target / NEIGHBOR_GRAPH_META
+    if not meta_file.exists():
+        return None
+    try:
+        with meta_file.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def open_neighbor_graph(
+    h5ad_path: str | Path,
+    output_root: str | Path,
+    *,
+    radius: Optional[float] = None,
+    build: bool = True,
+    force: bool = False,
+) -> Optional[NeighborGraph]:
+    """Open the graph for ``h5ad_path``, (re)building it when stale, missing, too small or forced.
+
+    A stored graph is reused when its radius covers ``radius``. Graphs are
+    built at ``max(radius, NEIGHBOR_GRAPH_RADIUS)``, so every radius up to
+    the configured one only filters the stored pairs.
+    """
+    h5ad_path = Path(h5ad_path)
+    needed = 0.0 if radius is None else float(radius)
+    target = neighbor_graph_dir(h5ad_path, output_root)
+    cache = get_object_cache()
+    key = source_key("neighbor_graph", h5ad_path, str(target))
+    if not force:
+        graph = cache.get(key)
+        if graph is not None and graph.radius >= needed and (target / NEIGHBOR_GRAPH_META).exists():
+            return graph
+        meta = _load_meta(target)
+        if (
+            meta is not None
+            and meta.get("version") == NEIGHBOR_GRAPH_VERSION
+            and float(meta.get("radius", 0)) >= needed
+            and _matches_signature(meta.get("source", {}), h5ad_path)
+        ):
+            return cache.put(key, NeighborGraph(target, meta))
+    if not build:
+        return None
+    cache.invalidate(lambda k: k == key)
+    return cache.put(key, build_neighbor_graph(h5ad_path, output_root, max(needed, NEIGHBOR_GRAPH_RADIUS)))
+
+
+__all__ = [
+    "NEIGHBOR_GRAPH_META",
+    "NEIGHBOR_GRAPH_RADIUS",
+    "NeighborGraph",
+    "build_neighbor_graph",
+    "neighbor_graph_dir",
+    "open_neighbor_graph",
+]
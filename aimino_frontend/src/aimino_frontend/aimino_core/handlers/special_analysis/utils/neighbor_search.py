@@ -0,0 +1,126 @@
+"""Fixed-radius neighbor flags for large cell tables.
+
+``within_radius`` marks every point that lies within ``radius`` of at least
+one source point (e.g. a tumor cell), as a boolean array. Two engines are
+available:
+
+``kdtree``
+    A ``cKDTree`` over the sources queried with ``k=1`` and
+    ``distance_upper_bound``; the query runs on all cores and returns arrays,
+    so no per-cell neighbor lists are built.
+``grid``
+    A cell list: sources are hashed into square buckets of side ``radius``
+    and each point is tested against the sources of its 3x3 bucket
+    neighbourhood in array chunks. It needs no tree and its memory grows with
+    the number of candidate pairs, which suits very large, evenly spread
+    tables.
+
+``auto`` picks ``grid`` from ``NEIGHBOR_GRID_MIN_POINTS`` points up.
+"""
+
+import os
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Default engine: "auto", "kdtree" or "grid".
+NEIGHBOR_ENGINE = os.getenv("AIMINO_NEIGHBOR_ENGINE", "auto")
+# Point count from which "auto" uses the cell-list engine.
+NEIGHBOR_GRID_MIN_POINTS = int(os.getenv("AIMINO_NEIGHBOR_GRID_MIN_POINTS", "5000000"))
+# Candidate pairs tested at once by the cell-list engine.
+GRID_CHUNK_PAIRS = 1 << 22
+
+ENGINES = ("auto", "kdtree", "grid")
+
+
+def _within_kdtree(points: np.ndarray, sources: np.ndarray, radius: float) -> np.ndarray:
+    tree = cKDTree(sources)
+    # the bound is exclusive; widen it and compare, so distances equal to radius count as with query_ball_point
+    dist, _ = tree.query(points, k=1, distance_upper_bound=radius * (1 + 1e-9) + 1e-9, workers=-1)
+    return dist <= radius
+
+
+def _within_grid(points: np.ndarray, sources: np.ndarray, radius: float) -> np.ndarray:
+    origin = np.minimum(points.min(axis=0), sources.min(axis=0))
+    src_cells = np.floor((sources - origin) / radius).astype(np.int64)
+    pt_cells = np.floor((points - origin) / radius).astype(np.int64)
+    # one padding row/column on each side so every neighbouring bucket has a key
+    height = int(max(src_cells[:, 0].max(), pt_cells[:, 0].max())) + 3
+    width = int(max(src_cells[:, 1].max(), pt_cells[:, 1].max())) + 3
+
+    def key(cells, dy=0, dx=0):
+        return (cells[:, 0] + 1 + dy) * width + (cells[:, 1] + 1 + dx)
+
+    src_keys = key(src_cells)
+    order = np.argsort(src_keys, kind="stable")
+    src_sorted = sources[order]
+    src_keys = src_keys[order]
+    if height * width <= 4 * (len(points) + len(sources)):
+        # dense bucket table: O(1) lookups
+        starts = np.searchsorted(src_keys, np.arange(height * width + 1))
+
+        def bucket(k):
+            return starts[k], starts[k + 1] - starts[k]
+
+    else:
+
+        def bucket(k):
+            lo = np.searchsorted(src_keys, k, side="left")
+            return lo, np.searchsorted(src_keys, k, side="right") - lo
+
+    # visit points bucket by bucket so source gathers stay local
+    visit = np.argsort(key(pt_cells), kind="stable")
+    points, pt_cells = points[visit], pt_cells[visit]
+    r2 = radius * radius
+
+    found = np.zeros(len(points), dtype=bool)
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            todo = np.flatnonzero(~found)
+            if not todo.size:
+                break
+            k = key(pt_cells[todo], dy, dx)
+            lo, counts = bucket(k)
+            has = counts > 0
+            todo, lo, counts = todo[has], lo[has], counts[has]
+            ends = np.cumsum(counts)
+            start = 0
+            while start < len(todo):
+                # largest run of points whose candidate pairs fit one chunk
+                base = ends[start - 1] if start else 0
+                stop = max(start + 1, int(np.searchsorted(ends, base + GRID_CHUNK_PAIRS, side="right")))
+                c = counts[start:stop]
+                owner = np.repeat(np.arange(start, stop), c)
+                offset = np.arange(int(c.sum())) - np.repeat(np.cumsum(c) - c, c)
+                cand = src_sorted[lo[owner] + offset]
+                d2 = ((points[todo[owner]] - cand) ** 2).sum(axis=1)
+                found[todo[owner[d2 <= r2]]] = True
+                start = stop
+    out = np.empty_like(found)
+    out[visit] = found
+    return out
+
+
+def within_radius(points, sources, radius: float, engine: str | None = None) -> np.ndarray:
+    """Boolean mask of ``points`` within ``radius`` (inclusive) of any of ``sources``.
+
+    Both arrays are ``(n, 2)`` coordinates in the same units as ``radius``.
+    """
+    engine = (engine or NEIGHBOR_ENGINE).lower()
+    if engine not in ENGINES:
+        raise ValueError(f"unknown neighbor engine {engine!r}; expected one of {', '.join(ENGINES)}")
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    sources = np.asarray(sources, dtype=np.float64).reshape(-1, 2)
+    if not len(points) or not len(sources) or radius < 0:
+        return np.zeros(len(points), dtype=bool)
+    if engine == "auto":
+        engine = "grid" if len(points) >= NEIGHBOR_GRID_MIN_POINTS else "kdtree"
+    if engine == "grid" and radius > 0:
+        return _within_grid(points, sources, float(radius))
+    return _within_kdtree(points, sources, float(radius))
+
+
+__all__ = [
+    "NEIGHBOR_ENGINE",
+    "within_radius",
+]
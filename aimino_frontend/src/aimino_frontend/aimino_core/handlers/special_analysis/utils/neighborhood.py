@@ -2,12 +2,22 @@
 
 import os
 import numpy as np
-from scipy.spatial import cKDTree, Delaunay
-import anndata as ad
-import napari
+from scipy.spatial import Delaunay
 import logging
+from typing import TYPE_CHECKING
 
+from ....cell_table import open_cell_table
+from ....obs_reader import positive_mask
+from ....object_cache import get_object_cache, source_key
+from .artifacts import open_artifact, save_artifact
+from .geometry import drop_long_segments, segments_to_vectors
 from .helpers import find_layer_simple as find_layer
+from .neighbor_graph import NEIGHBOR_GRAPH_META, NEIGHBOR_GRAPH_RADIUS, open_neighbor_graph
+from .neighbor_search import within_radius
+from .points_lod import PointsLOD, view_box
+
+if TYPE_CHECKING:
+    from napari.viewer import Viewer
 
 logger = logging.getLogger(__name__)
 
@@ -24,21 +34,114 @@ NEIGH_COLORS = {
     "T": (0.0, 1.0, 1.0, 1.0),   # cyan
     "other": (0.5, 0.5, 0.5, 1.0),   # grey
 }
+NEIGH_CLASSES = tuple(NEIGH_COLORS)
+
+
+def _delaunay_segments(tumor_points: np.ndarray) -> np.ndarray:
+    """Unique Delaunay edges of the tumor points as ``(n, 2, 2)`` (y, x) segments."""
+    logger.info("[neigh] computing Delaunay triangulation on tumor points")
+    if len(tumor_points) < 3:
+        logger.warning("[neigh] not enough tumor points for triangulation.")
+        return np.empty((0, 2, 2), dtype=float)
+    tri = Delaunay(tumor_points)
+    Ttri = tri.simplices
+    edges = np.vstack(
+        [Ttri[:, [0, 1]], Ttri[:, [1, 2]], Ttri[:, [2, 0]]]
+    )
+    edges = np.sort(edges, axis=1)
+    edges = np.unique(edges, axis=0)
+    p0 = tumor_points[edges[:, 0]]
+    p1 = tumor_points[edges[:, 1]]
+    segments = np.stack([p0, p1], axis=1)
+    logger.info(f"[neigh] Delaunay edges kept: {segments.shape[0]}")
+    return segments
+
+
+def _set_neighborhood_points(viewer: "Viewer", name: str, points, classes, sizes):
+    """Add or update the level-of-detail Points layer ``name`` (see ``points_lod``)."""
+    ly = find_layer(viewer, name)
+    lod = ly.metadata.get("lod") if ly is not None else None
+    if lod is not None:
+        lod.set_points(points, **{"class": classes, "size": sizes})
+        lod.update(viewer)
+        return
+    if ly is not None:
+        viewer.layers.remove(ly)
+    lod = PointsLOD(name)
+    lod.set_points(points, **{"class": classes, "size": sizes})
+    idx = lod.select(view_box(viewer))
+    viewer.add_points(
+        lod.points[idx],
+        properties={"class": lod.attrs["class"][idx]},
+        size=lod.attrs["size"][idx],
+        face_color="class",
+        # explicit category -> color mapping, independent of which classes are on screen
+        face_color_cycle=dict(NEIGH_COLORS),
+        name=name,
+        blending="translucent",
+        metadata={"lod": lod},
+    )
+    lod.connect(viewer)
+
+
+def _set_neighborhood_edges(viewer: "Viewer", name: str, segments):
+    """Draw Delaunay edges as one level-of-detail Vectors layer ``name``.
+
+    Edges much longer than typical (see ``geometry.drop_long_segments``) are
+    left out, and at low zoom only a sample anchored at edge midpoints is drawn.
+    """
+    segments = drop_long_segments(np.asarray(segments, dtype=np.float32))
+    ly = find_layer(viewer, name)
+    lod = ly.metadata.get("lod") if ly is not None else None
+    if not len(segments):
+        if ly is not None:
+            viewer.layers.remove(ly)
+        return
+    midpoints = segments.mean(axis=1)
+    vectors = segments_to_vectors(segments)
+    if lod is not None:
+        lod.set_points(midpoints, vectors)
+        lod.update(viewer)
+        return
+    if ly is not None:
+        # Shapes layer of the earlier one-shape-per-edge display
+        viewer.layers.remove(ly)
+    lod = PointsLOD(name)
+    lod.set_points(midpoints, vectors)
+    viewer.add_vectors(
+        lod.drawn(lod.select(view_box(viewer))),
+        edge_color="white",
+        edge_width=0.4,
+        vector_style="line",
+        name=name,
+        blending="translucent",
+        visible=True,
+        metadata={"lod": lod},
+    )
+    lod.connect(viewer)
 
 
 def compute_tumor_neighborhood_layers(
-    viewer: napari.Viewer,
+    viewer: "Viewer",
     raw_image_path: str,
     h5ad_path: str,
     marker_col: str,
     output_root: str,
     radius: float = DEFAULT_NEIGH_RADIUS,
     force_recompute: bool = False,
+    engine: str | None = None,
 ):
     """
     Compute tumor neighborhood within a given radius and overlay as napari layers.
 
     Uses (y, x) order for coordinates to match napari's image indexing.
+    Radii up to ``NEIGHBOR_GRAPH_RADIUS`` are answered from the dataset's
+    stored neighbor graph (see ``neighbor_graph``), so changing the radius
+    only filters it; larger radii are searched directly with ``engine`` (see
+    ``neighbor_search``). The radius-independent Delaunay edges are cached per
+    marker. Cells are drawn as one Points layer with a categorical ``class``
+    property and edges as one Vectors layer, both with viewport level of
+    detail (see ``points_lod``).
     """
     logger.info(
         f"[neigh] compute_tumor_neighborhood_layers radius={radius}, force={force_recompute}"
@@ -48,206 +151,102 @@ def compute_tumor_neighborhood_layers(
 
     outdir = _output_dir_for_image(raw_image_path, output_root)
     base = _basename_noext(raw_image_path)
-    tag = int(round(radius))
-    cache_path = os.path.join(outdir, f"{base}_{marker_col}_neighborhood_yx_r{tag}.npz")
-
-    if os.path.exists(cache_path) and not force_recompute:
-        logger.info(f"[neigh] loading cached neighborhood from {cache_path}")
-        data = np.load(cache_path, allow_pickle=True)
-        all_points = data["all_points"]
-        mask_tumor = data["mask_tumor"]
-        mask_immune = data["mask_immune"]
-        mask_B = data["mask_B"]
-        mask_T = data["mask_T"]
-        mask_other = data["mask_other"]
-        segments = data["segments"]
+    edges_path = os.path.join(outdir, f"{base}_{marker_col}_neighborhood_edges.art")
+
+    logger.info(f"[neigh] opening cell table for h5ad: {h5ad_path}")
+    obs = open_cell_table(h5ad_path, output_root)
+
+    # coordinates as (y, x) to match napari image
+    x_all = np.asarray(obs["X_centroid"])
+    y_all = np.asarray(obs["Y_centroid"])
+    all_points = np.column_stack([y_all, x_all]).astype(float)
+
+    mask_tumor = positive_mask(obs[marker_col])
+    tumor_points = all_points[mask_tumor]
+    n_tumor = len(tumor_points)
+    logger.info(f"[neigh] tumor cells = {n_tumor}")
+
+    if n_tumor == 0:
+        logger.warning("[neigh] no tumor cells found; nothing to compute.")
+        return "No tumor cells found."
+
+    n = len(all_points)
+    if radius <= NEIGHBOR_GRAPH_RADIUS:
+        graph = open_neighbor_graph(h5ad_path, output_root, radius=radius, force=force_recompute)
+        logger.info(f"[neigh] filtering neighbor graph (r={graph.radius:g}) to radius={radius}")
+        # radius-independent; later radii for this marker only compare against it
+        key = source_key("neighbor_nearest", graph.root / NEIGHBOR_GRAPH_META, marker_col)
+        nearest = get_object_cache().get_or_load(key, lambda: graph.nearest(mask_tumor))
+        mask_neighbor = (nearest <= np.float32(radius)) & ~mask_tumor
     else:
-        logger.info(f"[neigh] reading h5ad: {h5ad_path}")
-        adata = ad.read_h5ad(h5ad_path)
-        obs = adata.obs.copy()
-
-        # coordinates as (y, x) to match napari image
-        x_all = obs["X_centroid"].to_numpy()
-        y_all = obs["Y_centroid"].to_numpy()
-        all_points = np.column_stack([y_all, x_all]).astype(float)
-
-        tumor_raw = obs[marker_col]
-        if tumor_raw.dtype == bool:
-            tumor_mask = tumor_raw.to_numpy()
-        else:
-            tumor_mask = (
-                tumor_raw.astype(str)
-                .str.strip()
-                .str.lower()
-                .isin(["true", "t", "yes", "y", "1"])
-                .to_numpy()
-            )
-
-        tumor_indices = np.where(tumor_mask)[0]
-        tumor_points = all_points[tumor_mask]
-        n_tumor = len(tumor_points)
-        logger.info(f"[neigh] tumor cells = {n_tumor}")
-
-        if n_tumor == 0:
-            logger.warning("[neigh] no tumor cells found; nothing to compute.")
-            return "No tumor cells found."
-
-        tree_all = cKDTree(all_points)
-        logger.info(f"[neigh] querying neighbors within radius={radius}")
-        neighbor_indices = tree_all.query_ball_point(tumor_points, r=float(radius))
-        flat_neighbors = set()
-        for inds in neighbor_indices:
-            flat_neighbors.update(inds)
-        flat_neighbors -= set(tumor_indices)
-        flat_neighbors = sorted(flat_neighbors)
-        logger.info(f"[neigh] neighbor cells (non-tumor) = {len(flat_neighbors)}")
-
-        n = len(all_points)
-        mask_tumor = np.zeros(n, dtype=bool)
-        mask_tumor[tumor_indices] = True
-
-        mask_neighbor = np.zeros(n, dtype=bool)
-        if flat_neighbors:
-            mask_neighbor[flat_neighbors] = True
-
-        def col_bool(colname: str) -> np.ndarray:
-            if colname not in obs.columns:
-                return np.zeros(n, dtype=bool)
-            s = obs[colname]
-            if s.dtype == bool:
-                return s.to_numpy()
-            return (
-                s.astype(str)
-                .str.strip()
-                .str.lower()
-                .isin(["true", "t", "yes", "y", "1"])
-                .to_numpy()
-            )
-
-        mask_cd45 = col_bool("CD45_positive")
-        mask_cd20 = col_bool("CD20_positive")
-        mask_cd3e = col_bool("CD3E_positive")
-
-        mask_immune = mask_neighbor & mask_cd45
-        mask_B = mask_neighbor & mask_cd20
-        mask_T = mask_neighbor & mask_cd3e
-        mask_other = ~(mask_tumor | mask_neighbor)
-
-        n_neigh = mask_neighbor.sum()
-        n_immune = mask_immune.sum()
-        n_B = mask_B.sum()
-        n_T = mask_T.sum()
-        if n_neigh > 0:
-            logger.info(
-                f"[neigh] neighbors: {n_neigh}, "
-                f"immune: {n_immune} ({n_immune/n_neigh:.1%}), "
-                f"B: {n_B} ({n_B/n_neigh:.1%}), "
-                f"T: {n_T} ({n_T/n_neigh:.1%})"
-            )
-        else:
-            logger.info("[neigh] neighbors: 0")
-
-        logger.info("[neigh] computing Delaunay triangulation on tumor points")
-        if n_tumor >= 3:
-            tri = Delaunay(tumor_points)
-            Ttri = tri.simplices
-            edges = np.vstack(
-                [Ttri[:, [0, 1]], Ttri[:, [1, 2]], Ttri[:, [2, 0]]]
-            )
-            edges = np.sort(edges, axis=1)
-            edges = np.unique(edges, axis=0)
-            p0 = tumor_points[edges[:, 0]]
-            p1 = tumor_points[edges[:, 1]]
-            segments = np.stack([p0, p1], axis=1)
-            logger.info(f"[neigh] Delaunay edges kept: {segments.shape[0]}")
-        else:
-            logger.warning("[neigh] not enough tumor points for triangulation.")
-            segments = np.empty((0, 2, 2), dtype=float)
-
-        np.savez_compressed(
-            cache_path,
-            all_points=all_points,
-            mask_tumor=mask_tumor,
-            mask_immune=mask_immune,
-            mask_B=mask_B,
-            mask_T=mask_T,
-            mask_other=mask_other,
-            segments=segments,
+        logger.info(f"[neigh] searching neighbors within radius={radius}")
+        mask_neighbor = within_radius(all_points, tumor_points, float(radius), engine) & ~mask_tumor
+    logger.info(f"[neigh] neighbor cells (non-tumor) = {int(mask_neighbor.sum())}")
+
+    def col_bool(colname: str) -> np.ndarray:
+        if colname not in obs:
+            return np.zeros(n, dtype=bool)
+        return positive_mask(obs[colname])
+
+    mask_cd45 = col_bool("CD45_positive")
+    mask_cd20 = col_bool("CD20_positive")
+    mask_cd3e = col_bool("CD3E_positive")
+
+    mask_immune = mask_neighbor & mask_cd45
+    mask_B = mask_neighbor & mask_cd20
+    mask_T = mask_neighbor & mask_cd3e
+    mask_other = ~(mask_tumor | mask_neighbor)
+
+    n_neigh = mask_neighbor.sum()
+    n_immune = mask_immune.sum()
+    n_B = mask_B.sum()
+    n_T = mask_T.sum()
+    if n_neigh > 0:
+        logger.info(
+            f"[neigh] neighbors: {n_neigh}, "
+            f"immune: {n_immune} ({n_immune/n_neigh:.1%}), "
+            f"B: {n_B} ({n_B/n_neigh:.1%}), "
+            f"T: {n_T} ({n_T/n_neigh:.1%})"
         )
-        logger.info(f"[neigh] cached neighborhood to {cache_path}")
+    else:
+        logger.info("[neigh] neighbors: 0")
 
-    # --- Add / update napari layers ---------------------------------
+    cached = None if force_recompute else open_artifact(edges_path)
+    # the stored tumor mask tells whether the edges still match the marker column
+    if cached is not None and np.array_equal(cached.mask("tumor"), mask_tumor):
+        segments = cached.array("segments")
+    else:
+        segments = _delaunay_segments(tumor_points).astype(np.float32)
+        save_artifact(edges_path, arrays={"segments": segments}, masks={"tumor": mask_tumor})
+        logger.info(f"[neigh] cached Delaunay edges to {edges_path}")
 
-    def add_points_layer(name: str, mask: np.ndarray, rgba, size: float):
-        """Add or update a Points layer with a single RGBA color."""
-        coords = all_points[mask]
-        if coords.size == 0:
-            logger.info(f"[neigh] {name}: no points to draw.")
-            return
-
-        ly = find_layer(viewer, name)
-        if ly is None:
-            viewer.add_points(
-                coords,
-                size=size,
-                face_color=rgba,
-                name=name,
-                blending="translucent",
-                opacity=rgba[3],
-            )
-        else:
-            ly.data = coords
-            ly.size = size
-            ly.face_color = rgba
-            ly.opacity = rgba[3]
-
-    add_points_layer(
-        f"{marker_col}_neigh_tumor",
-        mask_tumor,
-        NEIGH_COLORS["tumor"],
-        NEIGH_POINT_SIZE,
-    )
-    add_points_layer(
-        f"{marker_col}_neigh_immune",
-        mask_immune,
-        NEIGH_COLORS["immune"],
-        GLOBAL_POINT_SIZE,
-    )
-    add_points_layer(
-        f"{marker_col}_neigh_B",
-        mask_B,
-        NEIGH_COLORS["B"],
-        GLOBAL_POINT_SIZE,
-    )
-    add_points_layer(
-        f"{marker_col}_neigh_T",
-        mask_T,
-        NEIGH_COLORS["T"],
-        GLOBAL_POINT_SIZE,
-    )
-    add_points_layer(
-        f"{marker_col}_neigh_other",
-        mask_other,
-        NEIGH_COLORS["other"],
-        GLOBAL_POINT_SIZE,
-    )
+    # --- Add / update napari layers ---------------------------------
 
-    name_edges = f"{marker_col}_neigh_edges"
-    ly_edges = find_layer(viewer, name_edges)
-    if segments.size > 0:
-        if ly_edges is not None:
-            viewer.layers.remove(ly_edges)
-        viewer.add_shapes(
-            segments,
-            shape_type="path",
-            edge_color="white",
-            face_color=(0, 0, 0, 0),
-            edge_width=0.4,
-            name=name_edges,
-            blending="translucent",
-            visible=True,
-        )
+    # one categorical Points layer; overlapping classes resolve to the most specific
+    codes = np.full(n, -1, dtype=np.int8)
+    for cls, mask in (
+        ("other", mask_other),
+        ("immune", mask_immune),
+        ("T", mask_T),
+        ("B", mask_B),
+        ("tumor", mask_tumor),
+    ):
+        codes[mask] = NEIGH_CLASSES.index(cls)
+    drawn = codes >= 0
+    classes = np.asarray(NEIGH_CLASSES)[codes[drawn]]
+    sizes = np.where(classes == "tumor", NEIGH_POINT_SIZE, GLOBAL_POINT_SIZE).astype(np.float32)
+    _set_neighborhood_points(viewer, f"{marker_col}_neigh_cells", all_points[drawn], classes, sizes)
+    for cls in NEIGH_CLASSES:
+        # layers of the earlier one-layer-per-class display
+        legacy = next((ly for ly in viewer.layers if ly.name == f"{marker_col}_neigh_{cls}"), None)
+        if legacy is not None:
+            viewer.layers.remove(legacy)
+
+    _set_neighborhood_edges(viewer, f"{marker_col}_neigh_edges", segments)
 
     logger.info("[neigh] neighborhood layers added/updated in napari.")
-    return "Tumor neighborhood computed and layers updated."
+    return (
+        f"Tumor neighborhood computed and layers updated: "
+        f"{int(n_neigh)} neighbor cells within {radius:g}px of {n_tumor} tumor cells."
+    )
 
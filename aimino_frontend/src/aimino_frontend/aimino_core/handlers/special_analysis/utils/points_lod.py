@@ -0,0 +1,225 @@
+"""Level-of-detail Points layers for whole-slide cell overlays.
+
+Points are ranked once by grid sampling: level 0 keeps one point per cell of
+a coarse grid, each further level halves the cell side and adds one point per
+newly uncovered cell, and whatever is left forms the last level. Stored in
+that order, every level of detail is a prefix of the array.
+
+A ``PointsLOD`` controller drives one napari layer. On every camera change it
+takes the points inside the (padded) viewport and draws the finest level
+whose count stays under ``POINTS_LOD_BUDGET``, so low zoom shows a
+density-bounded sample and the full set appears once the view is small
+enough. Per-point attributes (e.g. a categorical ``properties`` column and
+sizes) follow the selection. Layers of other items (e.g. Vectors) use the
+points as anchors and pass the items to draw as ``data``.
+
+A controller only writes to the layer whose ``metadata["lod"]`` is itself,
+and drops its camera callbacks once that layer is removed or replaced.
+"""
+
+import logging
+import os
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .helpers import find_layer_simple as find_layer
+
+if TYPE_CHECKING:
+    from napari.viewer import Viewer
+
+logger = logging.getLogger(__name__)
+
+# Points drawn at most per LOD layer.
+POINTS_LOD_BUDGET = int(os.getenv("AIMINO_POINTS_LOD_BUDGET", "200000"))
+# Cells per side of the level-0 sampling grid.
+LOD_TOP_CELLS = 64
+# The selection covers the viewport plus this fraction of its size on every side.
+LOD_MARGIN = 0.5
+# Canvas size assumed when the viewer does not report one.
+_DEFAULT_CANVAS = (1024, 1024)
+
+
+def _spread_bits(v: np.ndarray) -> np.ndarray:
+    """Interleave zeros between the low 32 bits of ``v`` (Morton encoding helper)."""
+    v = v.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in (
+        (16, 0x0000FFFF0000FFFF),
+        (8, 0x00FF00FF00FF00FF),
+        (4, 0x0F0F0F0F0F0F0F0F),
+        (2, 0x3333333333333333),
+        (1, 0x5555555555555555),
+    ):
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+
+def lod_order(points: np.ndarray, top_cells: int = LOD_TOP_CELLS, min_cell: float = 1.0):
+    """Rank ``(n, 2)`` points coarse-to-fine; return ``(order, levels)`` with ``levels`` sorted.
+
+    Points are sorted along a Z-order curve of the finest grid, where every
+    grid cell of every level is a contiguous run; a point belongs to the
+    coarsest level at which it starts a run.
+    """
+    n = len(points)
+    if not n:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int16)
+    lo = points.min(axis=0)
+    extent = float(max((points.max(axis=0) - lo).max(), min_cell))
+    finest = int(max(0, np.floor(np.log2(extent / top_cells / min_cell))))
+    side = top_cells * 2**finest  # finest cells per axis
+    q = np.minimum(((points - lo) / extent * side).astype(np.int64), side - 1)
+    code = (_spread_bits(q[:, 0]) << np.uint64(1)) | _spread_bits(q[:, 1])
+    zorder = np.argsort(code, kind="stable")
+    code = code[zorder]
+
+    levels = np.full(n, finest + 1, dtype=np.int16)  # duplicates within a finest cell
+    for level in range(finest, -1, -1):
+        cell = code >> np.uint64(2 * (finest - level))
+        starts = np.ones(n, dtype=bool)
+        starts[1:] = cell[1:] != cell[:-1]
+        levels[starts] = level
+    order = np.argsort(levels, kind="stable")
+    return zorder[order], levels[order]
+
+
+def _canvas_size(viewer: "Viewer"):
+    size = getattr(viewer, "_canvas_size", None)
+    try:
+        h, w = (float(v) for v in size)
+        if h > 0 and w > 0:
+            return h, w
+    except (TypeError, ValueError):
+        pass
+    return _DEFAULT_CANVAS
+
+
+def view_box(viewer: "Viewer", margin: float = LOD_MARGIN):
+    """World box ``(y0, x0, y1, x1)`` seen by the 2D camera, padded by ``margin``."""
+    cam = viewer.camera
+    try:
+        cy, cx = (float(v) for v in tuple(cam.center)[-2:])
+        zoom = float(cam.zoom)
+    except (TypeError, ValueError):
+        return None
+    if zoom <= 0:
+        return None
+    h, w = _canvas_size(viewer)
+    hh, hw = h / zoom * (0.5 + margin), w / zoom * (0.5 + margin)
+    return cy - hh, cx - hw, cy + hh, cx + hw
+
+
+class PointsLOD:
+    """Viewport- and budget-bounded view of a large point set for one Points layer."""
+
+    def __init__(self, layer_name: str, budget: Optional[int] = None) -> None:
+        self.layer_name = layer_name
+        self.budget = POINTS_LOD_BUDGET if budget is None else int(budget)
+        self.points = np.zeros((0, 2), dtype=np.float32)
+        self.data: Optional[np.ndarray] = None
+        self.levels = np.zeros(0, dtype=np.int16)
+        self.attrs: Dict[str, np.ndarray] = {}
+        self._box = None
+        self._level = None
+        self._connections: List[Tuple[object, Callable]] = []
+
+    def set_points(self, points: np.ndarray, data: Optional[np.ndarray] = None, **attrs: np.ndarray) -> None:
+        """Replace the point set; ``attrs`` are per-point arrays (properties, sizes).
+
+        ``data`` holds one layer item per point when the layer does not draw
+        the points themselves.
+        """
+        points = np.asarray(points, dtype=np.float32)
+        order, self.levels = lod_order(points)
+        self.points = points[order]
+        self.data = None if data is None else np.asarray(data)[order]
+        self.attrs = {k: np.asarray(v)[order] for k, v in attrs.items()}
+        self._box = self._level = None
+
+    def select(self, box=None) -> np.ndarray:
+        """Indices (into the ranked arrays) to draw for world ``box`` (None: whole set)."""
+        if box is None:
+            inside = np.ones(len(self.points), dtype=bool)
+        else:
+            y0, x0, y1, x1 = box
+            p = self.points
+            inside = (p[:, 0] >= y0) & (p[:, 0] <= y1) & (p[:, 1] >= x0) & (p[:, 1] <= x1)
+        counts = np.cumsum(np.bincount(self.levels[inside], minlength=int(self.levels.max(initial=0)) + 1))
+        # finest level within budget; level 0 is always drawn
+        level = max(0, int(np.searchsorted(counts, self.budget, side="right")) - 1)
+        self._level = level
+        return np.flatnonzero(inside[: int(np.searchsorted(self.levels, level, side="right"))])
+
+    def drawn(self, idx: np.ndarray) -> np.ndarray:
+        """Layer data for the selected indices."""
+        return (self.points if self.data is None else self.data)[idx]
+
+    def layer(self, viewer: "Viewer"):
+        """The layer this controller drives, or None once it was removed or replaced."""
+        ly = find_layer(viewer, self.layer_name)
+        if ly is None or getattr(ly, "metadata", {}).get("lod") is not self:
+            return None
+        return ly
+
+    def update(self, viewer: "Viewer") -> bool:
+        """Redraw the layer for the current camera; False when nothing had to change."""
+        ly = self.layer(viewer)
+        if ly is None:
+            self.disconnect()
+            return False
+        box = view_box(viewer)
+        if box is not None and self._box is not None:
+            inner = view_box(viewer, margin=0.0)
+            y0, x0, y1, x1 = self._box
+            contained = inner[0] >= y0 and inner[1] >= x0 and inner[2] <= y1 and inner[3] <= x1
+            # stay put while the view is inside the drawn box at a comparable scale
+            if contained and (box[2] - box[0]) > 0.5 * (y1 - y0):
+                return False
+        idx = self.select(box)
+        self._box = box
+        ly.data = self.drawn(idx)
+        props = {k: v[idx] for k, v in self.attrs.items() if k != "size"}
+        if props:
+            ly.properties = props
+        if "size" in self.attrs:
+            ly.size = self.attrs["size"][idx]
+        if hasattr(ly, "refresh_colors"):
+            ly.refresh_colors(update_color_mapping=False)
+        logger.debug(f"[lod] {self.layer_name}: {len(idx)}/{len(self.points)} points at level {self._level}")
+        return True
+
+    def connect(self, viewer: "Viewer") -> None:
+        """Redraw on camera changes until the layer is removed."""
+        self.disconnect()
+
+        def redraw(*args) -> None:
+            self.update(viewer)
+
+        def removed(*args) -> None:
+            if self.layer(viewer) is None:
+                self.disconnect()
+
+        events = viewer.camera.events
+        self._connections = [(events.zoom, redraw), (events.center, redraw)]
+        layer_events = getattr(viewer.layers, "events", None)
+        if layer_events is not None:
+            self._connections.append((layer_events.removed, removed))
+        for emitter, callback in self._connections:
+            emitter.connect(callback)
+
+    def disconnect(self) -> None:
+        """Stop reacting to viewer events."""
+        connections, self._connections = self._connections, []
+        for emitter, callback in connections:
+            try:
+                emitter.disconnect(callback)
+            except (RuntimeError, ValueError):
+                pass
+
+
+__all__ = [
+    "POINTS_LOD_BUDGET",
+    "PointsLOD",
+    "lod_order",
+    "view_box",
+]
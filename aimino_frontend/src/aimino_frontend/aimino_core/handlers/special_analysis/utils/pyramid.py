@@ -0,0 +1,254 @@
+"""Multiscale image pyramids for whole-slide display.
+
+Slides larger than ``AIMINO_PYRAMID_MIN_SIDE`` get a pyramid of 2x2
+block-mean levels. Level 0 is the source TIFF itself, read tile by tile
+through ``TiffPlane``; only the coarser levels are stored, as one tiled,
+compressed ``levels.tif`` (see ``raster_store.write_levels``) under
+``<output_root>/pyramid/<image>/``. Levels are opened lazily and handed to
+napari as multiscale data, so panning/zooming only touches the pixels on
+screen and no global downsample or 16k cap is needed for display.
+
+Ingest only schedules the build on a background worker
+(``schedule_pyramid``). ``ensure_pyramid`` never waits for it: while the
+build is pending it returns level 0 alone (scheduling the build on first
+display when nothing was scheduled), and ``on_pyramid_ready`` hands the full
+levels to the caller once the build finishes. Level rasters are opened
+through the shared object cache, so repeated displays reuse their file
+handles and the cache's handle budget covers them.
+
+Derived rasters (masks, density maps) use strided views of themselves as
+their lower levels, which costs no memory.
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from ....data_store import _file_signature, _matches_signature
+from ....image_probe import image_info
+from ....object_cache import get_object_cache, source_key
+from .raster_store import LazyRaster, write_levels
+from .tiff_access import alloc_plane
+
+logger = logging.getLogger(__name__)
+
+PYRAMID_DIR = "pyramid"
+PYRAMID_META = "meta.json"
+PYRAMID_LEVELS = "levels.tif"
+PYRAMID_VERSION = 2
+# Build a pyramid only for slides at least this large on one side.
+PYRAMID_MIN_SIDE = int(os.getenv("AIMINO_PYRAMID_MIN_SIDE", "8192"))
+# Stop adding levels once the coarsest level fits within this many pixels per side.
+PYRAMID_TOP_SIDE = 1024
+# Rows processed at a time when building block-mean levels (kept even).
+_STRIP_ROWS = 2048
+
+_BUILDER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="aimino-pyramid")
+_PENDING: Dict[str, Future] = {}
+_PENDING_LOCK = threading.Lock()
+
+
+def pyramid_dir(image_path: str, output_root: str) -> Path:
+    return Path(output_root) / PYRAMID_DIR / Path(image_path).stem
+
+
+def n_levels_for(shape, top_side: Optional[int] = None) -> int:
+    """Number of 2x levels (including level 0) until the top fits ``top_side``."""
+    top_side = PYRAMID_TOP_SIDE if top_side is None else top_side
+    n, side = 1, max(shape)
+    while side > top_side:
+        side = -(-side // 2)
+        n += 1
+    return n
+
+
+def planned_levels(shape) -> List[dict]:
+    """``{"shape", "downsample"}`` of every pyramid level of a plane of ``shape``, finest first."""
+    levels, (h, w) = [], shape
+    for i in range(n_levels_for(shape)):
+        levels.append({"shape": [int(h), int(w)], "downsample": 2**i})
+        h, w = -(-h // 2), -(-w // 2)
+    return levels
+
+
+def _block_mean_2x(src, dst: np.ndarray) -> None:
+    """Write the 2x2 block mean of ``src`` into ``dst`` strip by strip."""
+    H, W = src.shape
+    for y0 in range(0, H, _STRIP_ROWS):
+        strip = np.asarray(src[y0 : y0 + _STRIP_ROWS], dtype=np.float32)
+        h, w = strip.shape
+        if h % 2 or w % 2:  # replicate the last row/column for odd sizes
+            strip = np.pad(strip, ((0, h % 2), (0, w % 2)), mode="edge")
+        mean = strip.reshape(strip.shape[0] // 2, 2, strip.shape[1] // 2, 2).mean(axis=(1, 3))
+        if np.issubdtype(dst.dtype, np.integer):
+            mean = np.rint(mean)
+        dst[y0 // 2 : y0 // 2 + mean.shape[0]] = mean.astype(dst.dtype, copy=False)
+
+
+def build_pyramid(image_path: str, output_root: str) -> dict:
+    """Write the reduced levels for ``image_path`` and return the pyramid's metadata record."""
+    target = pyramid_dir(image_path, output_root)
+    tmp = target.with_name(target.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    source = LazyRaster(image_path)
+    try:
+        shape, dtype = source.shape, source.dtype
+        levels = planned_levels(shape)
+        # level 0 stays in the source; reduced levels are computed strip by strip
+        reduced, prev = [], source
+        for lvl in levels[1:]:
+            out = alloc_plane(tuple(lvl["shape"]), dtype)
+            _block_mean_2x(prev, out)
+            reduced.append(out)
+            prev = out
+        if reduced:
+            write_levels(str(tmp / PYRAMID_LEVELS), reduced)
+        meta = {
+            "version": PYRAMID_VERSION,
+            "source": _file_signature(Path(image_path)),
+            "dtype": str(dtype),
+            "file": PYRAMID_LEVELS if reduced else None,
+            "levels": levels,
+        }
+        with (tmp / PYRAMID_META).open("w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        del prev, reduced
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    finally:
+        source.close()
+    shutil.rmtree(target, ignore_errors=True)
+    tmp.rename(target)
+    logger.info(f"[pyramid] {len(levels)} levels for {image_path} -> {target}")
+    return {**meta, "dir": str(target)}
+
+
+def needs_pyramid(image_path: str) -> bool:
+    return max(image_info(image_path)["plane_shape"]) >= PYRAMID_MIN_SIDE
+
+
+def _load_meta(image_path: str, output_root: str) -> Optional[dict]:
+    """Metadata of the stored pyramid, or None if absent or stale."""
+    meta_file = pyramid_dir(image_path, output_root) / PYRAMID_META
+    if not meta_file.exists():
+        return None
+    try:
+        with meta_file.open("r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != PYRAMID_VERSION or not _matches_signature(meta.get("source", {}), Path(image_path)):
+        return None
+    return meta
+
+
+def _load_raster(path: str) -> LazyRaster:
+    raster = LazyRaster(path)
+    raster.levels()  # open the stored levels up front so the cache counts their handles
+    return raster
+
+
+def _open_raster(path: str) -> LazyRaster:
+    return get_object_cache().get_or_load(source_key("pyramid", path), lambda: _load_raster(path))
+
+
+def open_pyramid(image_path: str, output_root: str) -> Optional[List[LazyRaster]]:
+    """Return the pyramid levels (finest first, level 0 from the source), or None if absent/stale."""
+    meta = _load_meta(image_path, output_root)
+    if meta is None:
+        return None
+    levels = [_open_raster(image_path)]
+    if meta.get("file"):
+        levels += _open_raster(str(pyramid_dir(image_path, output_root) / meta["file"])).levels()
+    return levels
+
+
+def _build_if_missing(image_path: str, output_root: str) -> Optional[dict]:
+    if _load_meta(image_path, output_root) is not None:
+        return None
+    return build_pyramid(image_path, output_root)
+
+
+def schedule_pyramid(image_path: str, output_root: str) -> Future:
+    """Build the pyramid on the background worker unless it exists or is already being built."""
+    key = str(pyramid_dir(image_path, output_root).resolve())
+    with _PENDING_LOCK:
+        future = _PENDING.get(key)
+        if future is None or future.done():
+            future = _PENDING[key] = _BUILDER.submit(_build_if_missing, image_path, output_root)
+        return future
+
+
+def ensure_pyramid(image_path: str, output_root: str) -> Optional[List[LazyRaster]]:
+    """Open the pyramid of a slide large enough to need one, without waiting for its build.
+
+    Returns None for small slides. While the build is pending (it is scheduled
+    here if nothing was) only level 0 is returned; use ``on_pyramid_ready`` to
+    pick up the reduced levels.
+    """
+    levels = open_pyramid(image_path, output_root)
+    if levels is None and needs_pyramid(image_path):
+        schedule_pyramid(image_path, output_root)
+        levels = [_open_raster(image_path)]
+    return levels
+
+
+def on_pyramid_ready(image_path: str, output_root: str, callback: Callable[[List[LazyRaster]], None]) -> None:
+    """Call ``callback(levels)`` with the full pyramid once its pending build finishes.
+
+    The callback runs on the builder thread, or right away if the build has
+    already finished; UI callers must hop to their own thread. Nothing is
+    called if the build fails.
+    """
+
+    def done(future: Future) -> None:
+        if future.exception() is not None:
+            logger.warning(f"[pyramid] build failed for {image_path}: {future.exception()}")
+            return
+        levels = open_pyramid(image_path, output_root)
+        if levels is not None:
+            callback(levels)
+
+    schedule_pyramid(image_path, output_root).add_done_callback(done)
+
+
+def strided_levels(arr: np.ndarray, top_side: Optional[int] = None) -> List[np.ndarray]:
+    """Zero-copy multiscale levels of ``arr`` by 2x striding (nearest neighbour)."""
+    return [arr[:: 2**i, :: 2**i] for i in range(n_levels_for(arr.shape, top_side))]
+
+
+def layer_data(arr: np.ndarray, min_side: Optional[int] = None):
+    """Return ``(data, multiscale)`` suitable for ``viewer.add_*`` for a 2D raster.
+
+    Lazily stored rasters (see ``raster_store.LazyRaster``) use their stored
+    levels; small ones are decoded since napari reads a 2D layer whole anyway.
+    """
+    if hasattr(arr, "levels"):
+        levels = arr.levels()
+        return (levels, True) if len(levels) > 1 else (np.asarray(arr), False)
+    if max(arr.shape) < (PYRAMID_MIN_SIDE if min_side is None else min_side):
+        return arr, False
+    return strided_levels(arr), True
+
+
+__all__ = [
+    "build_pyramid",
+    "ensure_pyramid",
+    "layer_data",
+    "needs_pyramid",
+    "on_pyramid_ready",
+    "open_pyramid",
+    "planned_levels",
+    "pyramid_dir",
+    "schedule_pyramid",
+    "strided_levels",
+]
@@ -0,0 +1,171 @@
+"""Compact on-disk format for derived rasters (label images and masks).
+
+Rasters are written as tiled, compressed TIFFs (zstd when ``imagecodecs`` is
+available, deflate otherwise):
+
+* label images use the smallest unsigned dtype that holds the largest CellID
+  (uint16 for up to 65535 cells);
+* binary masks are stored as 1-bit (bit-packed) images;
+* rasters at least ``PYRAMID_MIN_SIDE`` on a side also get nearest-neighbour
+  2x sub-resolution levels (SubIFDs), so viewers can show them multiscale.
+
+``open_raster`` returns a ``LazyRaster`` that decodes only the tiles a slice
+touches, so showing a cached mask costs in proportion to what is on screen.
+Files written by earlier versions (plain int32/uint8 TIFFs) still read fine.
+"""
+
+import logging
+import os
+from typing import List, Optional
+
+import numpy as np
+from tifffile import TiffFile, TiffWriter
+
+from . import pyramid
+from .tiff_access import TiffPlane
+
+try:  # zstd needs imagecodecs; deflate (zlib) is built into tifffile
+    import imagecodecs  # noqa: F401
+
+    RASTER_COMPRESSION = "zstd"
+except ImportError:  # pragma: no cover - depends on the environment
+    RASTER_COMPRESSION = "zlib"
+
+logger = logging.getLogger(__name__)
+
+RASTER_TILE = 256
+
+
+def compact_label_dtype(max_id: int) -> np.dtype:
+    """Smallest unsigned dtype able to store label values up to ``max_id``."""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_id <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+def write_raster(path: str, arr: np.ndarray, binary: bool = False) -> None:
+    """Write a label image (or, with ``binary``, a mask) in the compact format."""
+    if binary:
+        data = np.asarray(arr).astype(bool, copy=False)
+    else:
+        data = np.asarray(arr)
+        data = data.astype(compact_label_dtype(int(data.max(initial=0))), copy=False)
+    n_levels = pyramid.n_levels_for(data.shape) if max(data.shape) >= pyramid.PYRAMID_MIN_SIDE else 1
+    write_levels(path, [data[:: 2**i, :: 2**i] for i in range(n_levels)])
+
+
+def write_levels(path: str, levels: List[np.ndarray]) -> None:
+    """Write ``levels`` (finest first) as one tiled, compressed TIFF; coarser levels become SubIFDs."""
+    options = dict(tile=(RASTER_TILE, RASTER_TILE), compression=RASTER_COMPRESSION, photometric="minisblack")
+    tmp = f"{path}.tmp"
+    try:
+        with TiffWriter(tmp) as tw:
+            tw.write(np.ascontiguousarray(levels[0]), subifds=len(levels) - 1 or None, **options)
+            for level in levels[1:]:
+                tw.write(np.ascontiguousarray(level), subfiletype=1, **options)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def read_raster(path: str) -> np.ndarray:
+    """Decode the full-resolution level of a stored raster (masks as uint8)."""
+    with TiffFile(path) as tf:
+        arr = tf.series[0].asarray()
+    return arr.astype(np.uint8) if arr.dtype == bool else arr
+
+
+class LazyRaster:
+    """Read-only 2D array-like over one level of a stored raster.
+
+    Indexing decodes only the tiles that intersect the requested region.
+    """
+
+    ndim = 2
+
+    def __init__(self, path: str, level: int = 0) -> None:
+        self.path = str(path)
+        self.level = level
+        self._plane = TiffPlane(self.path, level=level)
+        self.shape = self._plane.shape
+        self.dtype = np.dtype(np.uint8) if self._plane.dtype == bool else self._plane.dtype
+        self.n_levels = self._plane.n_levels
+        self._levels: Optional[List["LazyRaster"]] = None
+
+    @property
+    def size(self) -> int:
+        return self.shape[0] * self.shape[1]
+
+    @property
+    def cache_handles(self) -> int:
+        """Open TIFF files: this level plus any levels opened through ``levels()``."""
+        return len(self._levels) if self._levels else 1
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, key) -> np.ndarray:
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (2 - len(key) + 1) + key[i + 1 :]
+        key = key + (slice(None),) * (2 - len(key))
+        if len(key) != 2:
+            raise IndexError(f"too many indices for a 2D raster: {key!r}")
+        bounds, squeeze = [], []
+        for axis, (k, n) in enumerate(zip(key, self.shape)):
+            if isinstance(k, (int, np.integer)):
+                k = int(k) + n if k < 0 else int(k)
+                if not 0 <= k < n:
+                    raise IndexError(f"index {k} out of bounds for axis {axis} with size {n}")
+                k = slice(k, k + 1)
+                squeeze.append(axis)
+            start, stop, step = k.indices(n)
+            if step < 1:
+                raise IndexError("LazyRaster does not support negative steps")
+            bounds.append((start, max(start, stop), step))
+        (y0, y1, ys), (x0, x1, xs) = bounds
+        block = self._plane.read(y0, y1, x0, x1)[::ys, ::xs]
+        block = block.astype(self.dtype, copy=False)
+        return block.squeeze(axis=tuple(squeeze)) if squeeze else block
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        arr = self[:, :]
+        return arr if dtype is None else arr.astype(dtype, copy=False)
+
+    def levels(self) -> List["LazyRaster"]:
+        """All stored resolution levels, finest first (opened once, closed with this raster)."""
+        if self._levels is None:
+            self._levels = [self] + [type(self)(self.path, i) for i in range(1, self.n_levels)]
+        return self._levels
+
+    def close(self) -> None:
+        for level in (self._levels or [])[1:]:
+            level.close()
+        self._levels = None
+        self._plane.close()
+
+    def __del__(self) -> None:
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def open_raster(path: str) -> LazyRaster:
+    return LazyRaster(path)
+
+
+__all__ = [
+    "LazyRaster",
+    "RASTER_COMPRESSION",
+    "compact_label_dtype",
+    "open_raster",
+    "read_raster",
+    "write_levels",
+    "write_raster",
+]
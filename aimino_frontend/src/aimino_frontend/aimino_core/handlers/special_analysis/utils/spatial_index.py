@@ -0,0 +1,209 @@
+"""Persistent grid-bucket spatial index of a dataset's cells.
+
+Cell centroids are hashed into a uniform grid of square buckets sized for
+about ``SPATIAL_BUCKET_CELLS`` cells each, and cell IDs (row numbers of the
+cell table) are stored sorted by bucket in row-major order. The index lives
+next to the cell-table sidecar in ``processed/``:
+
+``order.npy``
+    Cell IDs sorted by bucket.
+``yx.npy``
+    Their (y, x) centroids as float32 in the same order, so the exact
+    containment test reads contiguous memory.
+``starts.npy``
+    ``n_buckets + 1`` offsets of each bucket's run.
+``meta.json``
+    Format version, grid origin, bucket size and shape, cell count and the
+    h5ad file signature; the index is rebuilt when the source changes.
+
+A box query touches one contiguous run per bucket row it overlaps, so its
+cost grows with the cells near the box, not with the dataset.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import shutil
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from skimage.measure import points_in_poly
+
+from ....cell_table import open_cell_table
+from ....data_store import _file_signature, _matches_signature
+from ....object_cache import get_object_cache, source_key
+
+logger = logging.getLogger(__name__)
+
+SPATIAL_INDEX_DIR = "spatial_index"
+SPATIAL_INDEX_META = "meta.json"
+SPATIAL_INDEX_VERSION = 1
+# Average number of cells per occupied-area bucket.
+SPATIAL_BUCKET_CELLS = 32
+
+
+def spatial_index_dir(h5ad_path: str | Path, output_root: str | Path) -> Path:
+    """Return the index directory for an h5ad file under ``output_root``."""
+    return Path(output_root) / SPATIAL_INDEX_DIR / Path(h5ad_path).stem
+
+
+class SpatialIndex:
+    """Read-only bucket grid over cell centroids in full-resolution pixels."""
+
+    def __init__(self, root: Path, meta: dict) -> None:
+        self.root = Path(root)
+        self.meta = meta
+        self.n_cells = int(meta["n_cells"])
+        self.origin = np.asarray(meta["origin"], dtype=np.float64)
+        self.bucket = float(meta["bucket"])
+        self.shape = tuple(int(v) for v in meta["shape"])
+        self.order = np.load(self.root / "order.npy", mmap_mode="r")
+        self.yx = np.load(self.root / "yx.npy", mmap_mode="r")
+        self.starts = np.load(self.root / "starts.npy", mmap_mode="r")
+
+    @property
+    def cache_handles(self) -> int:
+        return sum(isinstance(a, np.memmap) for a in (self.order, self.yx, self.starts))
+
+    def _bucket_range(self, lo: float, hi: float, axis: int):
+        first = int(np.floor((lo - self.origin[axis]) / self.bucket))
+        last = int(np.floor((hi - self.origin[axis]) / self.bucket))
+        return max(first, 0), min(last, self.shape[axis] - 1)
+
+    def _candidates(self, y0: float, x0: float, y1: float, x1: float) -> np.ndarray:
+        """Positions (into ``order``/``yx``) of cells in buckets overlapping the box."""
+        r0, r1 = self._bucket_range(y0, y1, 0)
+        c0, c1 = self._bucket_range(x0, x1, 1)
+        if r0 > r1 or c0 > c1:
+            return np.zeros(0, dtype=np.int64)
+        rows = np.arange(r0, r1 + 1) * self.shape[1]
+        # buckets c0..c1 of a row are adjacent, so each row is one run
+        lo = np.asarray(self.starts[rows + c0])
+        hi = np.asarray(self.starts[rows + c1 + 1])
+        counts = hi - lo
+        total = int(counts.sum())
+        return np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+
+    def cells_in_box(self, y0: float, x0: float, y1: float, x1: float) -> np.ndarray:
+        """Sorted IDs of cells whose centroid lies in the box (inclusive)."""
+        y0, y1 = sorted((float(y0), float(y1)))
+        x0, x1 = sorted((float(x0), float(x1)))
+        pos = self._candidates(y0, x0, y1, x1)
+        yx = self.yx[pos]
+        inside = (yx[:, 0] >= y0) & (yx[:, 0] <= y1) & (yx[:, 1] >= x0) & (yx[:, 1] <= x1)
+        return np.sort(np.asarray(self.order[pos[inside]], dtype=np.int64))
+
+    def cells_in_polygon(self, vertices) -> np.ndarray:
+        """Sorted IDs of cells whose centroid lies inside the ``(k, 2)`` (y, x) polygon."""
+        poly = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+        if len(poly) < 3:
+            return np.zeros(0, dtype=np.int64)
+        (y0, x0), (y1, x1) = poly.min(axis=0), poly.max(axis=0)
+        pos = self._candidates(y0, x0, y1, x1)
+        if not pos.size:
+            return np.zeros(0, dtype=np.int64)
+        inside = points_in_poly(np.asarray(self.yx[pos], dtype=np.float64), poly)
+        return np.sort(np.asarray(self.order[pos[inside]], dtype=np.int64))
+
+
+def _write_index(y: np.ndarray, x: np.ndarray, tmp: Path) -> dict:
+    n = len(y)
+    if n:
+        origin = [float(y.min()), float(x.min())]
+        h, w = float(y.max()) - origin[0], float(x.max()) - origin[1]
+        # second term bounds the bucket count for thin, line-like layouts
+        bucket = max(np.sqrt(h * w * SPATIAL_BUCKET_CELLS / n), max(h, w) * SPATIAL_BUCKET_CELLS / n, 1.0)
+        shape = [int(h // bucket) + 1, int(w // bucket) + 1]
+    else:
+        origin, bucket, shape = [0.0, 0.0], 1.0, [1, 1]
+    rows = np.minimum(((y - origin[0]) // bucket).astype(np.int64), shape[0] - 1)
+    cols = np.minimum(((x - origin[1]) // bucket).astype(np.int64), shape[1] - 1)
+    keys = rows * shape[1] + cols
+    order = np.argsort(keys, kind="stable")
+    starts = np.searchsorted(keys[order], np.arange(shape[0] * shape[1] + 1))
+    np.save(tmp / "order.npy", order.astype(np.int32 if n < 2**31 else np.int64))
+    np.save(tmp / "yx.npy", np.column_stack([y[order], x[order]]).astype(np.float32))
+    np.save(tmp / "starts.npy", starts.astype(np.int64))
+    return {
+        "version": SPATIAL_INDEX_VERSION,
+        "n_cells": n,
+        "origin": origin,
+        "bucket": float(bucket),
+        "shape": shape,
+    }
+
+
+def build_spatial_index(h5ad_path: str | Path, output_root: str | Path) -> SpatialIndex:
+    """Bucket the cell centroids and write the index under ``output_root``."""
+    h5ad_path = Path(h5ad_path)
+    obs = open_cell_table(h5ad_path, output_root)
+    y = np.asarray(obs["Y_centroid"], dtype=np.float64)
+    x = np.asarray(obs["X_centroid"], dtype=np.float64)
+
+    target = spatial_index_dir(h5ad_path, output_root)
+    tmp = target.with_name(target.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    try:
+        meta = _write_index(y, x, tmp)
+        meta["source"] = _file_signature(h5ad_path)
+        with (tmp / SPATIAL_INDEX_META).open("w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    shutil.rmtree(target, ignore_errors=True)
+    tmp.rename(target)
+    logger.info(
+        f"[spatial] index for {h5ad_path.name}: {meta['n_cells']} cells in "
+        f"{meta['shape'][0]}x{meta['shape'][1]} buckets of {meta['bucket']:.1f}px -> {target}"
+    )
+    return SpatialIndex(target, meta)
+
+
+def _load_meta(target: Path) -> Optional[dict]:
+    meta_file = target / SPATIAL_INDEX_META
+    if not meta_file.exists():
+        return None
+    try:
+        with meta_file.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def open_spatial_index(
+    h5ad_path: str | Path,
+    output_root: str | Path,
+    *,
+    build: bool = True,
+) -> Optional[SpatialIndex]:
+    """Open the index for ``h5ad_path``, (re)building it when stale or missing."""
+    h5ad_path = Path(h5ad_path)
+    target = spatial_index_dir(h5ad_path, output_root)
+    cache = get_object_cache()
+    key = source_key("spatial_index", h5ad_path, str(target))
+    index = cache.get(key)
+    if index is not None and (target / SPATIAL_INDEX_META).exists():
+        return index
+    meta = _load_meta(target)
+    if (
+        meta is not None
+        and meta.get("version") == SPATIAL_INDEX_VERSION
+        and _matches_signature(meta.get("source", {}), h5ad_path)
+    ):
+        return cache.put(key, SpatialIndex(target, meta))
+    if not build:
+        return None
+    return cache.put(key, build_spatial_index(h5ad_path, output_root))
+
+
+__all__ = [
+    "SpatialIndex",
+    "build_spatial_index",
+    "open_spatial_index",
+    "spatial_index_dir",
+]
@@ -0,0 +1,267 @@
+"""Lazy, region-wise access to the analysis plane of a TIFF.
+
+``TiffPlane`` exposes the 2D grayscale plane that ``_to_2d_gray_safe`` would
+produce from the full series, without decoding the full series. Reads go
+through the cheapest backend the file allows:
+
+* ``memmap``: uncompressed, contiguous series are memory-mapped
+  (``tifffile.memmap``), so a region read only touches its own pages.
+* ``zarr``: when ``zarr`` is installed, ``series.aszarr()`` decodes only the
+  chunks that intersect a region.
+* ``stream``: otherwise the chunks (tiles or strips) of the first page that
+  intersect a region are read and decoded one at a time.
+
+Grayscale conversion and downsampling run block by block, so peak memory is
+one block plus the output rather than the full-resolution image.
+RGB-to-gray runs in float32 over row blocks across a thread pool and writes
+into a preallocated output; outputs above ``AIMINO_MEMMAP_MIN_BYTES`` are
+backed by an anonymous temporary file instead of the heap.
+"""
+
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+import tifffile
+from tifffile import TiffFile
+
+try:  # optional: chunk-level decoding for compressed files
+    import zarr
+except ImportError:  # pragma: no cover - depends on the environment
+    zarr = None
+
+logger = logging.getLogger(__name__)
+
+# Rows read per block when streaming a plane.
+BLOCK_ROWS = 1024
+# Rows converted per task in ``rgb_to_gray``.
+GRAY_BLOCK_ROWS = 256
+GRAY_WEIGHTS = (0.2989, 0.587, 0.114)
+# Threads for ``rgb_to_gray`` (0 = min(8, cpu count)).
+GRAY_WORKERS = int(os.getenv("AIMINO_GRAY_WORKERS", "0")) or min(8, os.cpu_count() or 1)
+# Planes at least this large are allocated as file-backed memmaps.
+MEMMAP_MIN_BYTES = int(os.getenv("AIMINO_MEMMAP_MIN_BYTES", str(4 * 1024**3)))
+
+
+def _plane_index(shape) -> Tuple[tuple, bool]:
+    """Index selecting the plane ``_to_2d_gray_safe`` reduces ``shape`` to.
+
+    Returns ``(index, rgb)``; the indexed array is ``(Y, X)`` or, if ``rgb``,
+    ``(Y, X, C)`` with ``C`` in (3, 4).
+    """
+    index = [0 if d == 1 else slice(None) for d in shape]
+    live = [i for i, d in enumerate(shape) if d != 1]
+    while len(live) > 2:
+        if len(live) == 3 and shape[live[-1]] in (3, 4):
+            return tuple(index), True
+        index[live[0]] = 0
+        live = live[1:]
+    return tuple(index), False
+
+
+def alloc_plane(shape, dtype) -> np.ndarray:
+    """Uninitialized output plane: heap memory, or an anonymous memmap if huge."""
+    dtype = np.dtype(dtype)
+    if int(np.prod(shape)) * dtype.itemsize < MEMMAP_MIN_BYTES:
+        return np.empty(shape, dtype=dtype)
+    # The mapping outlives the (already unlinked) temporary file.
+    with tempfile.TemporaryFile(prefix="aimino-plane-") as fh:
+        return np.memmap(fh, dtype=dtype, mode="w+", shape=tuple(shape))
+
+
+def _gray_rows(rgb: np.ndarray, out: np.ndarray) -> None:
+    wr, wg, wb = (np.float32(w) for w in GRAY_WEIGHTS)
+    acc = np.multiply(rgb[..., 0], wr, dtype=np.float32)
+    acc += np.multiply(rgb[..., 1], wg, dtype=np.float32)
+    acc += np.multiply(rgb[..., 2], wb, dtype=np.float32)
+    np.copyto(out, acc, casting="unsafe")  # truncates like ``astype``
+
+
+def rgb_to_gray(
+    rgb: np.ndarray,
+    dtype=None,
+    out: Optional[np.ndarray] = None,
+    workers: Optional[int] = None,
+    rows: int = GRAY_BLOCK_ROWS,
+) -> np.ndarray:
+    """Luma of a ``(Y, X, 3|4)`` array in ``dtype`` (default: input dtype).
+
+    Converts ``rows`` rows at a time in float32, so the only full-size buffer
+    is ``out`` (allocated with ``alloc_plane`` if not given).
+    """
+    if out is None:
+        out = alloc_plane(rgb.shape[:2], dtype or rgb.dtype)
+    starts = range(0, rgb.shape[0], rows)
+    workers = GRAY_WORKERS if workers is None else workers
+
+    def convert(y0: int) -> None:
+        _gray_rows(rgb[y0 : y0 + rows], out[y0 : y0 + rows])
+
+    if workers <= 1 or len(starts) <= 1:
+        for y0 in starts:
+            convert(y0)
+    else:  # numpy releases the GIL inside the ufuncs
+        with ThreadPoolExecutor(min(workers, len(starts))) as pool:
+            list(pool.map(convert, starts))
+    return out
+
+
+def _with_region(index: tuple, ys: slice, xs: slice) -> tuple:
+    """Replace the Y and X slices of a plane index with region slices."""
+    dims = [i for i, ix in enumerate(index) if isinstance(ix, slice)]
+    out = list(index)
+    out[dims[0]], out[dims[1]] = ys, xs
+    return tuple(out)
+
+
+class TiffPlane:
+    """Region reader for the grayscale analysis plane of a TIFF file.
+
+    ``level`` selects a reduced-resolution level of a pyramidal TIFF.
+    """
+
+    def __init__(self, path: str, level: int = 0) -> None:
+        self.path = str(path)
+        self._tf = TiffFile(self.path)
+        self._lock = threading.Lock()
+        self.n_levels = len(self._tf.series[0].levels)
+        series = self._tf.series[0].levels[level]
+        self._array = None
+        try:
+            if level == 0 and series.dataoffset is not None:
+                self._array = tifffile.memmap(self.path, series=0, mode="r")
+                self.backend = "memmap"
+        except (ValueError, OSError) as exc:
+            logger.debug(f"[tiff] memmap unavailable for {self.path}: {exc}")
+        if self._array is None and zarr is not None:
+            try:
+                self._array = zarr.open(self._tf.series[0].aszarr(level=level), mode="r")
+                self.backend = "zarr"
+            except Exception as exc:  # zarr/tifffile version mismatches
+                logger.debug(f"[tiff] aszarr unavailable for {self.path}: {exc}")
+        if self._array is not None:
+            self._index, self.rgb = _plane_index(tuple(self._array.shape))
+        else:
+            self.backend = "stream"
+            self._page = series.keyframe
+            self._index, self.rgb = _plane_index(self._page.shaped)
+            self._init_stream()
+        dims = [self._shape_source[i] for i, ix in enumerate(self._index) if isinstance(ix, slice)]
+        self.shape = (int(dims[0]), int(dims[1]))
+        self.dtype = np.dtype(series.dtype)
+
+    @property
+    def _shape_source(self):
+        return self._array.shape if self._array is not None else self._page.shaped
+
+    def _init_stream(self) -> None:
+        page = self._page
+        _, depth, height, width, _ = page.shaped
+        if page.is_tiled:
+            self._chunk = (page.tilelength, page.tilewidth)
+            tile_depth = max(1, page.tiledepth)
+        else:
+            self._chunk = (min(page.rowsperstrip, height), width)
+            tile_depth = 1
+        ny = -(-height // self._chunk[0])
+        nx = -(-width // self._chunk[1])
+        self._grid = (ny, nx)
+        # Segments are stored sample plane by sample plane, then depth, rows, columns.
+        self._per_sample = -(-depth // tile_depth) * ny * nx
+        sample = self._index[0]
+        self._segment_base = (sample if isinstance(sample, int) else 0) * self._per_sample
+
+    def close(self) -> None:
+        self._array = None
+        self._tf.close()
+
+    def __enter__(self) -> "TiffPlane":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # -- raw region reads ---------------------------------------------------
+
+    def _read_raw(self, y0: int, y1: int, x0: int, x1: int, step: int) -> np.ndarray:
+        """Region (strided by ``step``) as ``(Y, X)`` or ``(Y, X, C)`` in the file dtype."""
+        if self._array is not None:
+            ix = _with_region(self._index, slice(y0, y1, step), slice(x0, x1, step))
+            return np.asarray(self._array[ix])
+        return self._read_stream(y0, y1, x0, x1)[::step, ::step]
+
+    def _read_stream(self, y0: int, y1: int, x0: int, x1: int) -> np.ndarray:
+        page = self._page
+        samples = page.shaped[-1]
+        th, tw = self._chunk
+        out = np.zeros((y1 - y0, x1 - x0, samples), dtype=page.dtype)
+        fh = self._tf.filehandle
+        for ty in range(y0 // th, -(-y1 // th)):
+            for tx in range(x0 // tw, -(-x1 // tw)):
+                seg_no = self._segment_base + ty * self._grid[1] + tx
+                with self._lock:
+                    fh.seek(page.dataoffsets[seg_no])
+                    raw = fh.read(page.databytecounts[seg_no])
+                seg, _, _ = page.decode(raw, seg_no, jpegtables=page.jpegtables)
+                seg = seg[0]  # drop the depth axis -> (h, w, samples)
+                sy0, sx0 = ty * th, tx * tw
+                ry0, ry1 = max(y0, sy0), min(y1, sy0 + seg.shape[0])
+                rx0, rx1 = max(x0, sx0), min(x1, sx0 + seg.shape[1])
+                out[ry0 - y0 : ry1 - y0, rx0 - x0 : rx1 - x0] = seg[ry0 - sy0 : ry1 - sy0, rx0 - sx0 : rx1 - sx0]
+        if self.rgb:
+            return out
+        contig = self._index[-1]
+        return out[..., contig if isinstance(contig, int) else 0]
+
+    # -- grayscale access ---------------------------------------------------
+
+    def _gray(self, raw: np.ndarray) -> np.ndarray:
+        return rgb_to_gray(raw) if self.rgb else raw
+
+    def read(self, y0: int, y1: int, x0: int, x1: int, step: int = 1) -> np.ndarray:
+        """Grayscale region ``[y0:y1:step, x0:x1:step]`` of the plane."""
+        H, W = self.shape
+        y0, y1 = max(0, y0), min(H, y1)
+        x0, x1 = max(0, x0), min(W, x1)
+        return self._gray(self._read_raw(y0, y1, x0, x1, step))
+
+    def iter_blocks(self, rows: int = BLOCK_ROWS, step: int = 1) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield ``(row, block)`` strips covering the plane, strided by ``step``.
+
+        ``row`` is the first output row of the block (in strided coordinates).
+        """
+        H, W = self.shape
+        rows = max(step, rows - rows % step)
+        for y0 in range(0, H, rows):
+            yield y0 // step, self.read(y0, min(H, y0 + rows), 0, W, step)
+
+    def downsample(self, factor: int = 1, rows: int = BLOCK_ROWS) -> np.ndarray:
+        """Strided ``[::factor, ::factor]`` grayscale plane, built block by block."""
+        factor = max(1, int(factor))
+        if factor == 1 and self.backend == "memmap":
+            view = self._array[self._index]
+            # zero-copy view of the file, or a threaded conversion straight from it
+            return rgb_to_gray(view) if self.rgb else view
+        H, W = self.shape
+        out = alloc_plane((-(-H // factor), -(-W // factor)), self.dtype)
+        rows = max(factor, rows - rows % factor)
+        for y0 in range(0, H, rows):
+            raw = self._read_raw(y0, min(H, y0 + rows), 0, W, factor)
+            dst = out[y0 // factor : y0 // factor + raw.shape[0]]
+            if self.rgb:
+                rgb_to_gray(raw, out=dst)
+            else:
+                dst[...] = raw
+        return out
+
+
+def open_plane(path: str) -> TiffPlane:
+    """Open the analysis plane of ``path`` for region-wise reads."""
+    return TiffPlane(path)
+
+
+__all__ = ["BLOCK_ROWS", "TiffPlane", "alloc_plane", "open_plane", "rgb_to_gray"]
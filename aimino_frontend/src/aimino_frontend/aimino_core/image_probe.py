@@ -0,0 +1,116 @@
+"""Header-only TIFF metadata probe.
+
+Reads shape, dtype, axes, channel count, pyramid levels and physical pixel
+size from the TIFF/OME-XML header without decoding any pixel data. Results
+are stored in the dataset manifest (``source_info.image.header``) at ingest
+and memoized per process, so size and shape checks never touch the pixels.
+"""
+
+from __future__ import annotations
+
+import logging
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from tifffile import TiffFile
+
+from .object_cache import get_object_cache, source_key
+
+logger = logging.getLogger(__name__)
+
+_UM_PER_UNIT = {"µm": 1.0, "um": 1.0, "nm": 1e-3, "mm": 1e3, "cm": 1e4, "m": 1e6}
+_UM_PER_RESOLUTION_UNIT = {2: 25400.0, 3: 10000.0}  # TIFF ResolutionUnit: inch, centimeter
+
+
+def _ome_pixel_size(ome_xml: str) -> Optional[dict]:
+    try:
+        root = ET.fromstring(ome_xml)
+    except ET.ParseError:
+        return None
+    for el in root.iter():
+        if not el.tag.endswith("Pixels"):
+            continue
+        sx, sy = el.get("PhysicalSizeX"), el.get("PhysicalSizeY")
+        if sx is None or sy is None:
+            return None
+        ux = _UM_PER_UNIT.get(el.get("PhysicalSizeXUnit", "µm"), 1.0)
+        uy = _UM_PER_UNIT.get(el.get("PhysicalSizeYUnit", "µm"), 1.0)
+        return {"x": float(sx) * ux, "y": float(sy) * uy, "unit": "um", "source": "ome"}
+    return None
+
+
+def _tag_pixel_size(page) -> Optional[dict]:
+    tags = page.tags
+    xres, yres, unit = tags.get("XResolution"), tags.get("YResolution"), tags.get("ResolutionUnit")
+    scale = _UM_PER_RESOLUTION_UNIT.get(int(unit.value) if unit is not None else 2)
+    if xres is None or yres is None or scale is None:
+        return None
+    (xn, xd), (yn, yd) = xres.value, yres.value
+    if not (xn and yn and xd and yd):
+        return None
+    x, y = scale * xd / xn, scale * yd / yn
+    if x == y == scale:  # 1 pixel per unit is the writer default, not a calibration
+        return None
+    return {"x": x, "y": y, "unit": "um", "source": "tiff"}
+
+
+def gray_plane_shape(shape: Sequence[int]) -> List[int]:
+    """Return the 2D shape ``_to_2d_gray_safe`` produces for an array of ``shape``."""
+    dims = [int(d) for d in shape if int(d) != 1]
+    while len(dims) > 2:
+        if len(dims) == 3 and dims[-1] in (3, 4):
+            return dims[:2]
+        dims = [d for d in dims[1:] if d != 1]
+    return dims
+
+
+def probe_image(path: str | Path) -> dict:
+    """Read image metadata from the TIFF header of ``path``."""
+    with TiffFile(path) as tf:
+        series = tf.series[0]
+        page = series.pages[0] if series.pages else tf.pages[0]
+        axes = series.axes
+        shape = [int(d) for d in series.shape]
+        channels = 1
+        for ax in ("C", "S"):
+            if ax in axes:
+                channels *= shape[axes.index(ax)]
+        pixel_size = None
+        if tf.is_ome and tf.ome_metadata:
+            pixel_size = _ome_pixel_size(tf.ome_metadata)
+        if pixel_size is None and page is not None:
+            pixel_size = _tag_pixel_size(page)
+        return {
+            "shape": shape,
+            "dtype": str(series.dtype),
+            "axes": axes,
+            "channels": channels,
+            "plane_shape": gray_plane_shape(shape),
+            "levels": [[int(d) for d in level.shape] for level in series.levels],
+            "pixel_size": pixel_size,
+        }
+
+
+def register_image_info(path: str | Path, info: dict) -> None:
+    """Seed the per-process memo with a header record (e.g. from a manifest)."""
+    get_object_cache().put(source_key("image_info", path), info)
+
+
+def image_info(path: str | Path) -> dict:
+    """Return the header record for ``path``, probing the file at most once."""
+    return get_object_cache().get_or_load(source_key("image_info", path), lambda: probe_image(path))
+
+
+def header_from_manifest(manifest: dict) -> Optional[dict]:
+    """Return the stored image header record of a manifest, if any."""
+    return (manifest.get("source_info", {}).get("image") or {}).get("header")
+
+
+__all__ = [
+    "gray_plane_shape",
+    "header_from_manifest",
+    "image_info",
+    "probe_image",
+    "register_image_info",
+]
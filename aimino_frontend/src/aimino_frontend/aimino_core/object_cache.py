@@ -0,0 +1,209 @@
+"""Process-wide LRU cache for decoded dataset objects.
+
+Images, label rasters, masks and cell tables are expensive to decode and are
+requested several times per command. They are cached here under keys built
+from the source file signature (path, size, mtime) so a changed file never
+hits a stale entry. The cache is bounded by a byte budget
+(``AIMINO_CACHE_MAX_BYTES``) and by the number of open files and memory maps
+its entries hold (``AIMINO_CACHE_MAX_HANDLES``), and evicts
+least-recently-used entries.
+
+File-backed handle objects (rasters, sidecar tables, graphs) report their
+heap memory through ``__sizeof__`` and the files they keep open through a
+``cache_handles`` attribute; every handle is charged ``HANDLE_BYTES`` on top.
+Handles grow as they are used, so they are re-measured on every hit.
+
+Cached arrays are shared between callers and are marked read-only.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+import numpy as np
+
+CACHE_BUDGET_ENV = "AIMINO_CACHE_MAX_BYTES"
+CACHE_HANDLES_ENV = "AIMINO_CACHE_MAX_HANDLES"
+DEFAULT_CACHE_BUDGET = 2 * 1024**3  # 2 GiB
+DEFAULT_CACHE_HANDLES = 256
+# Bytes charged per open file or memory map (descriptors, mappings, decoder state).
+HANDLE_BYTES = 1024**2
+
+
+def _handles(value: Any) -> int:
+    """Number of open files and memory maps a cached value keeps alive."""
+    if isinstance(value, np.memmap):
+        return 1
+    if isinstance(value, np.ndarray):
+        return 0
+    if isinstance(value, (tuple, list)):
+        return sum(_handles(v) for v in value)
+    if isinstance(value, dict):
+        return sum(_handles(v) for v in value.values())
+    return int(getattr(value, "cache_handles", 0))
+
+
+def _sizeof(value: Any) -> int:
+    """Approximate resident size of a cached value in bytes."""
+    if isinstance(value, np.memmap):
+        return HANDLE_BYTES  # backed by the page cache, not the heap
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list)):
+        return sum(_sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sum(_sizeof(v) for v in value.values())
+    return sys.getsizeof(value) + HANDLE_BYTES * _handles(value)
+
+
+def _is_handle(value: Any) -> bool:
+    return hasattr(value, "cache_handles") and not isinstance(value, np.ndarray)
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, np.ndarray) and not isinstance(value, np.memmap):
+        value.flags.writeable = False
+    return value
+
+
+class ObjectCache:
+    """Thread-safe LRU mapping with byte and open-handle budgets and hit/miss counters."""
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BUDGET, max_handles: int = DEFAULT_CACHE_HANDLES) -> None:
+        self.max_bytes = int(max_bytes)
+        self.max_handles = int(max_handles)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int, int]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.current_bytes = 0
+        self.current_handles = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            value = entry[0]
+        if _is_handle(value):
+            # measured outside the lock: handles may take their own locks to report sizes
+            size, handles = _sizeof(value), _handles(value)
+            if (size, handles) != entry[1:]:
+                with self._lock:
+                    current = self._entries.get(key)
+                    if current is not None and current[0] is value:
+                        self._store(key, value, size, handles)
+        return value
+
+    def put(self, key: Hashable, value: Any, nbytes: Optional[int] = None) -> Any:
+        """Insert ``value``; values larger than a whole budget are not kept."""
+        size = _sizeof(value) if nbytes is None else int(nbytes)
+        handles = _handles(value)
+        with self._lock:
+            self._store(key, _freeze(value), size, handles)
+            return value
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return the cached value for ``key``, calling ``loader`` on a miss."""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is not sentinel:
+            return value
+        return self.put(key, loader())
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches ``predicate``; return the count."""
+        with self._lock:
+            doomed = [k for k in self._entries if predicate(k)]
+            for key in doomed:
+                self._discard(key)
+            return len(doomed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.current_handles = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "handles": self.current_handles,
+                "max_handles": self.max_handles,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _store(self, key: Hashable, value: Any, size: int, handles: int) -> None:
+        self._discard(key)
+        if size > self.max_bytes or handles > self.max_handles:
+            return
+        self._entries[key] = (value, size, handles)
+        self.current_bytes += size
+        self.current_handles += handles
+        while (self.current_bytes > self.max_bytes or self.current_handles > self.max_handles) and self._entries:
+            old_key = next(iter(self._entries))
+            self._discard(old_key)
+            self.evictions += 1
+
+    def _discard(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+            self.current_handles -= entry[2]
+
+
+_CACHE: Optional[ObjectCache] = None
+
+
+def get_object_cache() -> ObjectCache:
+    """Return the shared cache, creating it from the environment budgets on first use."""
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = ObjectCache(
+            int(os.getenv(CACHE_BUDGET_ENV, str(DEFAULT_CACHE_BUDGET))),
+            int(os.getenv(CACHE_HANDLES_ENV, str(DEFAULT_CACHE_HANDLES))),
+        )
+    return _CACHE
+
+
+def source_key(kind: str, path: str | Path, *extra: Hashable) -> tuple:
+    """Build a cache key tied to the current size/mtime of ``path``."""
+    p = Path(path)
+    try:
+        stat = p.stat()
+        sig = (stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        sig = (None, None)
+    return (kind, str(p.resolve()), *sig, *extra)
+
+
+__all__ = [
+    "CACHE_BUDGET_ENV",
+    "CACHE_HANDLES_ENV",
+    "HANDLE_BYTES",
+    "ObjectCache",
+    "get_object_cache",
+    "source_key",
+]
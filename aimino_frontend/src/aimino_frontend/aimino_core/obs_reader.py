@@ -0,0 +1,155 @@
+"""Column-level readers for the ``obs`` table of AnnData ``.h5ad`` files.
+
+Analysis commands only need a handful of per-cell columns (centroids, ellipse
+axes, ``CellID`` and marker flags). Reading them through h5py avoids
+``anndata.read_h5ad`` materializing the expression matrix ``X`` and copying the
+full ``obs`` frame.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import h5py
+import numpy as np
+
+# Values treated as "positive" in marker columns stored as strings/categories.
+TRUTHY_TOKENS = ("true", "t", "yes", "y", "1")
+
+# Per-cell geometry columns consumed by the label / density / neighborhood code.
+CELL_GEOMETRY_COLUMNS = (
+    "CellID",
+    "X_centroid",
+    "Y_centroid",
+    "MajorAxisLength",
+    "MinorAxisLength",
+    "Orientation",
+)
+
+
+def _encoding_type(node) -> str:
+    value = node.attrs.get("encoding-type", "")
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    return str(value)
+
+
+def _read_plain(ds: h5py.Dataset) -> np.ndarray:
+    """Read a dataset, decoding variable-length / fixed-width strings to ``str``."""
+    if h5py.check_string_dtype(ds.dtype) is not None or ds.dtype.kind in ("S", "O"):
+        return np.asarray(ds.asstr()[()], dtype=object)
+    return np.asarray(ds[()])
+
+
+def _take_categories(categories: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """Expand categorical codes; missing entries (code -1) become ``None``."""
+    codes = np.asarray(codes).astype(np.int64, copy=False)
+    out = np.empty(codes.shape, dtype=object)
+    valid = codes >= 0
+    out[valid] = categories.astype(object)[codes[valid]]
+    out[~valid] = None
+    return out
+
+
+def _read_column(f: h5py.File, obs: h5py.Group, name: str) -> np.ndarray:
+    node = obs[name]
+    if isinstance(node, h5py.Group):
+        enc = _encoding_type(node)
+        if enc == "categorical":
+            return _take_categories(_read_plain(node["categories"]), node["codes"][()])
+        if enc in ("nullable-boolean", "nullable-integer", "nullable-string-array"):
+            values = _read_plain(node["values"])
+            mask = np.asarray(node["mask"][()], dtype=bool)
+            if enc == "nullable-boolean":
+                return np.asarray(values, dtype=bool) & ~mask
+            if enc == "nullable-integer":
+                out = values.astype(np.float64)
+                out[mask] = np.nan
+                return out
+            out = values.astype(object)
+            out[mask] = None
+            return out
+        raise ValueError(f"Unsupported obs encoding '{enc}' for column '{name}'")
+
+    # anndata < 0.8 stored categoricals as codes with a reference to obs/__categories
+    ref = node.attrs.get("categories")
+    if isinstance(ref, h5py.Reference):
+        return _take_categories(_read_plain(f[ref]), node[()])
+    return _read_plain(node)
+
+
+def _obs_index_name(obs: h5py.Group) -> str:
+    value = obs.attrs.get("_index", "_index")
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    return str(value)
+
+
+def list_obs_columns(h5ad_path: str | Path) -> List[str]:
+    """Return obs column names (excluding the index) without reading any data."""
+    with h5py.File(h5ad_path, "r") as f:
+        if "obs" not in f:
+            return []
+        obs = f["obs"]
+        order = obs.attrs.get("column-order")
+        if order is not None:
+            cols = [c.decode("utf-8") if isinstance(c, bytes) else str(c) for c in np.atleast_1d(order)]
+        else:
+            skip = {_obs_index_name(obs), "__categories"}
+            cols = [k for k in obs.keys() if k not in skip]
+        return [c for c in cols if c in obs]
+
+
+def read_obs_columns(
+    h5ad_path: str | Path,
+    columns: Iterable[str],
+    *,
+    skip_missing: bool = False,
+) -> Dict[str, np.ndarray]:
+    """Read selected obs columns from an h5ad file as NumPy arrays.
+
+    Categorical and string columns are decoded to object arrays of Python
+    values; numeric and boolean columns keep their stored dtype. Missing
+    columns raise ``KeyError`` unless ``skip_missing`` is set.
+    """
+    wanted = list(dict.fromkeys(columns))
+    out: Dict[str, np.ndarray] = {}
+    with h5py.File(h5ad_path, "r") as f:
+        if "obs" not in f:
+            raise KeyError(f"No obs table in {h5ad_path}")
+        obs = f["obs"]
+        index_name = _obs_index_name(obs)
+        missing = []
+        for name in wanted:
+            key = index_name if name == "_index" else name
+            if key not in obs or key == "__categories":
+                missing.append(name)
+                continue
+            out[name] = _read_column(f, obs, key)
+    if missing and not skip_missing:
+        raise KeyError(f"obs column(s) not found in {h5ad_path}: {', '.join(missing)}")
+    return out
+
+
+def positive_mask(values) -> np.ndarray:
+    """Interpret a marker column as a boolean mask.
+
+    Boolean arrays are returned as-is; anything else is compared, after
+    stripping and lower-casing its string form, against ``TRUTHY_TOKENS``.
+    """
+    arr = np.asarray(values)
+    if arr.dtype == bool:
+        return arr
+    uniq, inverse = np.unique(arr.astype(str), return_inverse=True)
+    hits = np.isin(np.char.lower(np.char.strip(uniq)), TRUTHY_TOKENS)
+    return hits[inverse.reshape(arr.shape)]
+
+
+__all__ = [
+    "CELL_GEOMETRY_COLUMNS",
+    "TRUTHY_TOKENS",
+    "list_obs_columns",
+    "positive_mask",
+    "read_obs_columns",
+]
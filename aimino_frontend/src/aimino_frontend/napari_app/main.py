@@ -27,7 +27,6 @@ from qtpy import QtWidgets, QtCore
 from pydantic import BaseModel
 import anndata as ad
 import h5py
-from tifffile import TiffFile
 
 AUTOLOAD_SIZE_LIMIT = int(os.getenv("AIMINO_AUTLOAD_MAX_BYTES", "500000000"))  # 500MB default
 DISABLE_AUTOLOAD = os.getenv("AIMINO_DISABLE_AUTOLOAD", "0").strip() == "1"
@@ -44,6 +43,7 @@ from aimino_frontend.aimino_core.data_store import (
     clear_processed_cache,
 )
 from aimino_frontend.aimino_core.handlers.context_handler import set_context_functions
+from aimino_frontend.aimino_core.image_probe import header_from_manifest, image_info
 from .client_agent import AgentClient, load_last_session_id
 from .dataset_context import (
     get_context_payload,
@@ -463,16 +463,17 @@ class DataImportDock(QtWidgets.QWidget):
         except Exception:
             return False
 
-    def _image_too_large(self, image_path: str) -> bool:
-        """Check TIFF dimensions against common GL limits without full load."""
+    def _image_too_large(self, image_path: str, manifest: Optional[dict] = None) -> bool:
+        """Check image dimensions against common GL limits using the header record."""
         if SKIP_16K_CHECK:
             return False  # User opted to skip this check
+        if (manifest or {}).get("pyramid"):
+            return False  # displayed as a multiscale pyramid, never as one texture
         try:
-            with TiffFile(image_path) as tf:
-                shape = tf.series[0].shape
+            header = header_from_manifest(manifest or {}) or image_info(image_path)
+            shape = header["plane_shape"]
             if len(shape) >= 2:
-                h, w = shape[-2], shape[-1]
-                return max(h, w) > 16384
+                return max(shape) > 16384
         except Exception:
             return False
         return False
@@ -485,12 +486,12 @@ class DataImportDock(QtWidgets.QWidget):
         # If auto-downsample is enabled, skip size checks and load directly
         if AUTO_DOWNSAMPLE >= 1:
             self._append_status(f"[info] Auto-downsample enabled ({AUTO_DOWNSAMPLE}x). Loading...")
-            self._run_command({"action": "special_load_marker_data", **base_cmd})
+            self._run_command({"action": "special_load_marker_data", "preview": True, **base_cmd})
             self._run_command({"action": "special_show_mask", **base_cmd})
             self._run_command({"action": "special_show_density", **base_cmd})
             return
 
-        if self._image_too_large(str(image_path)):
+        if self._image_too_large(str(image_path), manifest):
             self._append_status(
                 "[info] Image exceeds 16k texture limit; auto-load skipped. "
                 "Set AIMINO_AUTO_DOWNSAMPLE=2 in .env or click 'Load Marker Layers'."
@@ -502,7 +503,8 @@ class DataImportDock(QtWidgets.QWidget):
                 "Set AIMINO_AUTO_DOWNSAMPLE=2 in .env or click 'Load Marker Layers'."
             )
             return
-        self._run_command({"action": "special_load_marker_data", **base_cmd})
+        # Preview masks come straight from the cell table; exact masks load on request.
+        self._run_command({"action": "special_load_marker_data", "preview": True, **base_cmd})
         self._run_command({"action": "special_show_mask", **base_cmd})
         self._run_command({"action": "special_show_density", **base_cmd})
 
@@ -665,7 +667,7 @@ class DataImportDock(QtWidgets.QWidget):
             manifest = load_manifest(ds)
         except Exception:
             manifest = {}
-        if self._image_too_large(str(manifest.get("image_path", ""))):
+        if self._image_too_large(str(manifest.get("image_path", "")), manifest):
             self._append_status("[warn] Image too large for safe load; consider downsampled/pyramid data.")
             return
         if not self._within_size_limit(
@@ -30,6 +30,7 @@ REQUIRED_DATASET_ACTIONS = {
     "special_show_density",
     "special_update_density",
     "special_compute_neighborhood",
+    "special_count_cells_in_view",
 }
 
 # Actions that don't require dataset_id (can use current context or none)
@@ -147,6 +148,7 @@ def _autofill_command(
         "special_show_mask",
         "special_show_density",
         "special_update_density",
+        "special_goto_hotspot",
         "special_compute_neighborhood",
     } and not updated.get("marker_col"):
         marker = _pick_candidate(ctx_info.last_marker, ctx_info.marker_candidates)
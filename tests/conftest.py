@@ -0,0 +1,54 @@
+"""Shared fixtures for the AIMinO test suite."""
+
+from pathlib import Path
+from typing import Mapping, Optional, Sequence
+
+import h5py
+import numpy as np
+import pytest
+
+
+def _write_column(group: h5py.Group, name: str, values) -> None:
+    if isinstance(values, Mapping):
+        # encoded column (categorical, nullable, ...): a group of arrays plus attributes
+        sub = group.create_group(name)
+        for key, value in values.items():
+            if key == "attrs":
+                sub.attrs.update(value)
+            else:
+                _write_column(sub, key, value)
+        return
+    values = np.asarray(values)
+    if values.dtype.kind in "OU":
+        group.create_dataset(name, data=values.astype(object), dtype=h5py.string_dtype("utf-8"))
+    else:
+        group.create_dataset(name, data=values)
+
+
+def _write_h5ad(path: Path, columns: Mapping, index: Optional[Sequence[str]] = None, n_vars: int = 1) -> Path:
+    """Write a minimal h5ad whose obs holds ``columns``, using the on-disk encodings anndata produces.
+
+    Column values are arrays (strings become UTF-8 datasets) or, for encoded
+    columns, mappings of sub-arrays with an optional ``attrs`` mapping. The
+    obs index defaults to ``c0, c1, ...``.
+    """
+    if index is None:
+        n = next(len(v) for v in columns.values() if not isinstance(v, Mapping))
+        index = [f"c{i}" for i in range(n)]
+    with h5py.File(path, "w") as f:
+        f.create_dataset("X", data=np.zeros((len(index), n_vars), dtype=np.float32))
+        obs = f.create_group("obs")
+        obs.attrs["encoding-type"] = "dataframe"
+        obs.attrs["encoding-version"] = "0.2.0"
+        obs.attrs["_index"] = "_index"
+        obs.attrs["column-order"] = np.array(list(columns), dtype=object)
+        _write_column(obs, "_index", np.array(index, dtype=object))
+        for name, values in columns.items():
+            _write_column(obs, name, values)
+    return Path(path)
+
+
+@pytest.fixture
+def write_h5ad():
+    """Writer of minimal h5ad files: ``write_h5ad(path, {column: values}, index=None, n_vars=1)``."""
+    return _write_h5ad
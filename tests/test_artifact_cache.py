@@ -0,0 +1,205 @@
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+import pytest
+from tifffile import imwrite
+
+from aimino_frontend.aimino_core.data_store import DATA_ROOT_ENV, clear_processed_cache, save_manifest
+from aimino_frontend.aimino_core.handlers.special_analysis.utils import artifact_cache as ac
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.artifact_cache import (
+    ArtifactCache,
+    ArtifactKey,
+    enforce_global_quota,
+    open_artifact_cache,
+)
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.density_processing import ensure_boundary_paths
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.density_store import cached_levels, ensure_density
+
+SRC = {"path": "/data/cells.h5ad", "size": 1, "mtime": 2.0}
+
+
+def _key(sigma, **extra):
+    return ArtifactKey("density", SRC, {"marker": "m", "sigma": sigma, **extra}, 1, ".bin")
+
+
+def _write(cache, key, nbytes=1000):
+    cache.path(key).write_bytes(b"\0" * nbytes)
+    return cache.put(key)
+
+
+@pytest.fixture(autouse=True)
+def data_root(tmp_path, monkeypatch):
+    monkeypatch.setenv(DATA_ROOT_ENV, str(tmp_path / "data"))
+    ac.get_object_cache().clear()
+    return tmp_path / "data"
+
+
+def test_keys_cover_exact_params_source_and_version():
+    assert _key(199.6).name != _key(200.4).name
+    reordered = ArtifactKey("density", SRC, {"bits": 16, "sigma": 200.0, "marker": "m"}, 1, ".bin")
+    assert _key(200.0, bits=16).name == reordered.name
+    assert _key(200.0).name != _key(200.0)._replace(version=2).name
+    assert _key(200.0).name != _key(200.0)._replace(source={**SRC, "mtime": 3.0}).name
+    assert _key(200.0).name.startswith("density-") and _key(200.0).name.endswith(".bin")
+
+
+def test_index_records_size_and_times_and_survives_reopen(tmp_path):
+    cache = ArtifactCache(tmp_path / "cache", quota_bytes=0)
+    assert cache.get(_key(1.0)) is None
+    path = _write(cache, _key(1.0), 1234)
+    entry = cache.entries("density", SRC, marker="m")[path]
+    assert entry["size"] == 1234 and entry["ctime"] == entry["atime"]
+    assert cache.get(_key(1.0)) == path
+    assert cache.entries("density", SRC)[path]["atime"] >= entry["atime"]
+    assert cache.entries("density", {"other": 1}) == {}
+
+    reopened = ArtifactCache(tmp_path / "cache", quota_bytes=0)
+    assert reopened.get(_key(1.0)) == path and reopened.usage() == 1234
+    path.unlink()  # removed behind the cache's back
+    assert ArtifactCache(tmp_path / "cache").usage() == 0
+
+
+def test_quota_evicts_least_recently_used_first(tmp_path):
+    cache = ArtifactCache(tmp_path / "cache", quota_bytes=2500)
+    a, b = _write(cache, _key(1.0)), _write(cache, _key(2.0))
+    cache.get(_key(1.0))  # a is now more recent than b
+    c = _write(cache, _key(3.0))
+    assert a.exists() and not b.exists() and c.exists()
+    assert cache.usage() == 2000
+    assert json.loads((tmp_path / "cache" / "index.json").read_text())["entries"].keys() == {a.name, c.name}
+
+    big = _write(cache, _key(4.0), 5000)  # never evicted by its own insert
+    assert big.exists() and not a.exists() and not c.exists()
+
+
+def test_lookups_keep_access_times_in_memory_until_flushed(tmp_path):
+    cache = ArtifactCache(tmp_path / "cache", quota_bytes=0)
+    path = _write(cache, _key(1.0))
+    index = tmp_path / "cache" / "index.json"
+    before = index.read_text()
+    for _ in range(10):
+        assert cache.get(_key(1.0)) == path
+    assert index.read_text() == before
+    cache.flush()
+    on_disk = json.loads(index.read_text())["entries"][path.name]["atime"]
+    assert on_disk == cache.entries("density")[path]["atime"] > json.loads(before)["entries"][path.name]["atime"]
+
+
+def test_writers_sharing_a_directory_merge_their_entries(tmp_path):
+    first = ArtifactCache(tmp_path / "cache", quota_bytes=0)
+    second = ArtifactCache(tmp_path / "cache", quota_bytes=0)  # e.g. another process
+    a = _write(first, _key(1.0))
+    b = _write(second, _key(2.0))
+    c = _write(first, _key(3.0))
+    entries = json.loads((tmp_path / "cache" / "index.json").read_text())["entries"]
+    assert entries.keys() == {a.name, b.name, c.name}
+    second.remove(a)
+    _write(first, _key(4.0))
+    assert a.name not in json.loads((tmp_path / "cache" / "index.json").read_text())["entries"]
+
+    lock = tmp_path / "cache" / ac.ARTIFACT_CACHE_LOCK
+    lock.touch()
+    os.utime(lock, (0, 0))  # left behind by a crashed writer
+    _write(first, _key(5.0))
+    assert not lock.exists()
+
+
+def test_global_quota_scans_only_when_the_running_total_crosses_it(data_root, monkeypatch):
+    scans = []
+    cache_roots = ac.cache_roots
+    monkeypatch.setattr(ac, "cache_roots", lambda: scans.append(1) or cache_roots())
+    monkeypatch.setattr(ac, "ARTIFACT_CACHE_GLOBAL_QUOTA_MB", 3500 / 1024**2)
+    cache = open_artifact_cache(data_root / "ds1" / "processed")
+    first = [_write(cache, _key(float(i))) for i in range(3)]
+    assert len(scans) == 1 and all(p.exists() for p in first)
+    _write(cache, _key(9.0))  # 4000 bytes > 3500: rescan and evict
+    assert len(scans) == 2 and not first[0].exists()
+
+
+def _lock_is_free(lock) -> bool:
+    """Whether another thread can take ``lock`` right now."""
+    result = []
+
+    def probe():
+        got = lock.acquire(timeout=1.0)
+        result.append(got)
+        if got:
+            lock.release()
+
+    t = threading.Thread(target=probe)
+    t.start()
+    t.join()
+    return result[0]
+
+
+def test_sizing_and_object_invalidation_never_hold_the_index_lock(tmp_path, monkeypatch):
+    cache = ArtifactCache(tmp_path / "cache", quota_bytes=1500)
+    first = _write(cache, _key(1.0))
+    size = sys.getsizeof(cache)
+    assert size > sys.getsizeof(ArtifactCache(tmp_path / "empty"))
+
+    # the object cache may size the index while another thread holds its lock
+    sized = []
+    with cache._lock:
+        t = threading.Thread(target=lambda: sized.append(sys.getsizeof(cache)))
+        t.start()
+        t.join(timeout=2.0)
+    assert sized == [size]
+
+    held = []
+    invalidate = ac.get_object_cache().invalidate
+    monkeypatch.setattr(
+        ac.get_object_cache(), "invalidate", lambda pred: held.append(not _lock_is_free(cache._lock)) or invalidate(pred)
+    )
+    _write(cache, _key(2.0))  # evicts the first artifact
+    assert not first.exists() and held == [False]
+    assert sys.getsizeof(cache) == size  # one entry of the same shape is indexed again
+
+
+def test_global_quota_spans_all_caches_under_the_data_root(data_root):
+    first = open_artifact_cache(data_root / "ds1" / "processed")
+    second = open_artifact_cache(data_root / "legacy")
+    old = _write(first, _key(1.0))
+    new = _write(second, _key(2.0))
+    assert enforce_global_quota(max_bytes=1500) == 1000
+    assert not old.exists() and new.exists()
+    assert first.usage() == 0
+
+
+def test_density_levels_and_contours_are_content_addressed(tmp_path):
+    image = tmp_path / "slide.tif"
+    imwrite(image, np.zeros((800, 900), np.uint8))
+    out = str(tmp_path / "out")
+    rng = np.random.default_rng(3)
+    x, y = rng.normal(450, 80, 2000), rng.normal(400, 80, 2000)
+
+    d1, _ = ensure_density(str(image), lambda: (x, y), "m_positive", out, 199.6, source=SRC)
+    d2, _ = ensure_density(str(image), lambda: (x, y), "m_positive", out, 200.4, source=SRC)
+    assert d1.path != d2.path and d1.sigma == 199.6 and d2.sigma == 200.4
+    assert sorted(cached_levels(str(image), "m_positive", out, SRC)) == [199.6, 200.4]
+    assert cached_levels(str(image), "m_positive", out, {**SRC, "size": 9}) == {}
+
+    p95 = ensure_boundary_paths(d2, out)
+    p80 = ensure_boundary_paths(d2, out, percentile=80.0)
+    cache = open_artifact_cache(out)
+    contours = cache.entries("contours")
+    assert len(contours) == 2 and {e["params"]["percentile"] for e in contours.values()} == {95.0, 80.0}
+    again = ensure_boundary_paths(d2, out)
+    np.testing.assert_array_equal(again.values, p95.values)
+    assert len(p80) >= 1
+
+
+def test_clear_derived_only_keeps_the_cell_table(data_root):
+    processed = data_root / "ds1" / "processed"
+    save_manifest("ds1", {"dataset_id": "ds1", "output_root": str(processed)})
+    (processed / "cell_table").mkdir(parents=True)
+    cache = open_artifact_cache(processed)
+    path = _write(cache, _key(1.0), 2048)
+
+    removed = clear_processed_cache("ds1", derived_only=True)
+    assert removed["processed"] and removed["cache_bytes"] >= 2048  # artifacts plus the index
+    assert not path.exists() and (processed / "cell_table").exists()
+    assert open_artifact_cache(processed).usage() == 0
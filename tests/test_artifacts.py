@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.artifacts import (
+    RaggedArray,
+    open_artifact,
+    remove_artifact,
+    save_artifact,
+)
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.density_processing import (
+    load_boundary_paths,
+    save_boundary_paths,
+)
+
+RNG = np.random.default_rng(3)
+
+
+def test_round_trip_is_memory_mapped_and_pickle_free(tmp_path):
+    paths = [RNG.random((int(n), 2)) for n in RNG.integers(1, 40, 500)]
+    mask = RNG.random(1001) < 0.3
+    table = np.arange(12, dtype=np.int32).reshape(3, 4)
+    path = tmp_path / "a.art"
+    save_artifact(path, arrays={"table": table}, ragged={"paths": paths}, masks={"m": mask}, meta={"sigma": 200})
+
+    art = open_artifact(path)
+    assert art.meta == {"sigma": 200}
+    assert "paths" in art and "m" in art and "nope" not in art
+    ragged = art.ragged("paths")
+    assert isinstance(ragged, RaggedArray) and isinstance(ragged.values, np.memmap)
+    assert len(ragged) == 500
+    for got, want in zip(ragged, paths):
+        np.testing.assert_array_equal(got, want)
+    np.testing.assert_array_equal(ragged[-1], paths[-1])
+    assert len(ragged[10:20]) == 10
+    np.testing.assert_array_equal(ragged.lengths(), [len(p) for p in paths])
+    np.testing.assert_array_equal(art.mask("m"), mask)
+    np.testing.assert_array_equal(art.array("table"), table)
+    # bit-packed on disk
+    assert (path / "m.bits.npy").stat().st_size < 200 + mask.size // 8
+    for fname in ("table.npy", "paths.values.npy", "paths.offsets.npy", "m.bits.npy"):
+        np.load(path / fname, allow_pickle=False)
+    with pytest.raises(IndexError):
+        ragged[500]
+    with pytest.raises(KeyError):
+        art.array("paths")
+
+
+def test_replace_remove_and_invalid(tmp_path):
+    path = tmp_path / "a.art"
+    save_artifact(path, ragged={"paths": [np.ones((3, 2))]})
+    save_artifact(path, ragged={"paths": []})
+    assert len(open_artifact(path).ragged("paths")) == 0
+    assert not (tmp_path / "a.art.tmp").exists()
+    remove_artifact(path)
+    assert open_artifact(path) is None
+    (tmp_path / "b.art").mkdir()
+    (tmp_path / "b.art" / "meta.json").write_text('{"format": "other"}')
+    assert open_artifact(tmp_path / "b.art") is None
+
+
+def test_boundary_paths_round_trip(tmp_path):
+    paths = [RNG.random((int(n), 2)) * 100 for n in RNG.integers(9, 60, 50)]
+    out = str(tmp_path / "contours.art")
+    save_boundary_paths(paths, out)
+    loaded = load_boundary_paths(out)
+    assert len(loaded) == len(paths)
+    for got, want in zip(loaded, paths):
+        assert got.dtype == np.float32
+        np.testing.assert_allclose(got, want, rtol=1e-6)
+    assert load_boundary_paths(str(tmp_path / "missing.art")) == []
@@ -0,0 +1,109 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from aimino_frontend.aimino_core import cell_table as ct
+from aimino_frontend.aimino_core.cell_table import cell_table_dir, open_cell_table
+from aimino_frontend.aimino_core.data_store import DATA_ROOT_ENV, ingest_dataset
+
+
+def _columns(n: int = 20) -> dict:
+    rng = np.random.default_rng(0)
+    return {
+        "CellID": np.arange(1, n + 1),
+        "X_centroid": rng.uniform(0, 100, n),
+        "tumor_positive": np.arange(n) % 3 == 0,
+        "CD45_positive": ["yes" if i % 2 else "no" for i in range(n)],
+        "sample": ["s1"] * n,
+    }
+
+
+def test_build_and_reopen_memory_mapped(tmp_path, write_h5ad):
+    h5 = tmp_path / "cells.h5ad"
+    write_h5ad(h5, _columns())
+    out = tmp_path / "processed"
+
+    table = open_cell_table(h5, out)
+    assert table.n_cells == 20
+    assert set(table.numeric_columns) == {"CellID", "X_centroid"}
+    assert set(table.marker_columns) == {"tumor_positive", "CD45_positive"}
+    assert (cell_table_dir(h5, out) / "markers.npy").exists()
+
+    reopened = open_cell_table(h5, out, build=False)
+    assert reopened is not None
+    assert isinstance(reopened["X_centroid"], np.memmap)
+    np.testing.assert_array_equal(reopened["CellID"], np.arange(1, 21))
+    assert reopened["tumor_positive"].tolist() == [i % 3 == 0 for i in range(20)]
+    assert reopened["CD45_positive"].tolist() == [bool(i % 2) for i in range(20)]
+    # non-numeric, non-marker columns fall back to the h5ad reader
+    assert list(reopened["sample"][:2]) == ["s1", "s1"]
+    assert "sample" in reopened and "missing" not in reopened
+    with pytest.raises(KeyError):
+        reopened["missing"]
+
+
+def test_all_missing_object_column_is_not_a_marker(tmp_path, write_h5ad):
+    h5 = tmp_path / "cells.h5ad"
+    columns = _columns(6)
+    columns["note"] = ["nan", "", "NaN", "None", " ", "nan"]
+    columns["CD3E_positive"] = ["True", "nan", "", "false", "nan", "TRUE"]
+    write_h5ad(h5, columns)
+
+    table = open_cell_table(h5, tmp_path / "processed")
+    assert "note" not in table.marker_columns
+    assert "CD3E_positive" in table.marker_columns
+    assert table["CD3E_positive"].tolist() == [True, False, False, False, False, True]
+    assert list(table["note"][:2]) == ["nan", ""]
+
+
+def test_reopen_does_not_touch_h5ad(tmp_path, monkeypatch, write_h5ad):
+    h5 = tmp_path / "cells.h5ad"
+    write_h5ad(h5, _columns())
+    out = tmp_path / "processed"
+    open_cell_table(h5, out)
+
+    def boom(*args, **kwargs):
+        raise AssertionError("h5ad should not be decoded again")
+
+    monkeypatch.setattr(ct, "read_obs_columns", boom)
+    table = open_cell_table(h5, out)
+    assert table["X_centroid"].shape == (20,)
+
+
+def test_rebuilds_when_source_changes(tmp_path, write_h5ad):
+    h5 = tmp_path / "cells.h5ad"
+    write_h5ad(h5, _columns(20))
+    out = tmp_path / "processed"
+    open_cell_table(h5, out)
+
+    write_h5ad(h5, _columns(30))
+    os.utime(h5, (1_000_000_000, 1_000_000_000))
+    assert open_cell_table(h5, out, build=False) is None
+    assert open_cell_table(h5, out).n_cells == 30
+
+
+def test_ingest_writes_cell_table(tmp_path, monkeypatch, write_h5ad):
+    monkeypatch.setenv(DATA_ROOT_ENV, str(tmp_path / "data"))
+    img = tmp_path / "sample.tif"
+    img.write_bytes(b"tiff")
+    h5 = tmp_path / "sample.h5ad"
+    write_h5ad(h5, _columns())
+
+    manifest = ingest_dataset(img, h5, "case_cells")
+    table = open_cell_table(h5, manifest["output_root"], build=False)
+    assert table is not None and table.n_cells == 20
+
+
+def test_ingest_tolerates_unreadable_h5ad(tmp_path, monkeypatch):
+    monkeypatch.setenv(DATA_ROOT_ENV, str(tmp_path / "data"))
+    img = tmp_path / "sample.tif"
+    h5 = tmp_path / "sample.h5ad"
+    img.write_bytes(b"tiff")
+    h5.write_bytes(b"h5ad")
+
+    manifest = ingest_dataset(img, h5, "case_bad")
+    processed = Path(manifest["output_root"])
+    assert not cell_table_dir(h5, processed).exists()
+    assert not list((processed / ct.CELL_TABLE_DIR).glob("*.tmp"))
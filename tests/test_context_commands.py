@@ -494,3 +494,16 @@ class TestLeadManagerContextActions:
         )
         assert error is None
         assert cmd["marker_col"] == "SOX10"
+
+    def test_autofill_goto_hotspot_needs_no_dataset(self):
+        """goto_hotspot works on the loaded density layer; only the marker is filled."""
+        from src.api_service.api.agents.lead_manager import (
+            _autofill_command,
+            _ContextInfo,
+        )
+
+        ctx_info = _ContextInfo()
+        ctx_info.register_marker("SOX10_positive")
+        cmd, error = _autofill_command({"action": "special_goto_hotspot", "hotspot": 3}, ctx_info)
+        assert error is None
+        assert cmd == {"action": "special_goto_hotspot", "hotspot": 3, "marker_col": "SOX10_positive"}
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter
+from skimage import measure
+from skimage.measure import approximate_polygon
+
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.contours import (
+    find_contours_tiled,
+    histogram_quantile,
+    simplify_paths,
+    stitch_paths,
+)
+
+RNG = np.random.default_rng(21)
+
+
+def _field(shape=(300, 410), sigma=9.0):
+    f = gaussian_filter(RNG.random(shape), sigma)
+    return ((f - f.min()) / (f.max() - f.min())).astype(np.float32)
+
+
+def _canonical(paths):
+    """Order-independent description of contours: closed loops as vertex sets, open ones as sequences."""
+    out = []
+    for p in paths:
+        pts = [tuple(np.round(v, 6)) for v in p]
+        if pts[0] == pts[-1]:
+            out.append(("loop", frozenset(pts)))
+        else:
+            out.append(("open", tuple(pts)))
+    return sorted(out, key=repr)
+
+
+@pytest.mark.parametrize("q", [0.05, 0.5, 0.95, 0.999])
+def test_histogram_quantile_is_close_to_exact(q):
+    values = np.r_[np.zeros(5000), RNG.beta(0.5, 3.0, 200_000)].reshape(-1, 41)
+    exact = np.quantile(values[values > 0], q)
+    assert abs(histogram_quantile(values, q, rows=97) - exact) <= 1 / 65536
+    assert histogram_quantile(np.array([[0.0, 1.0, 1.0]]), 0.9) == pytest.approx(1.0, abs=1e-4)
+    with pytest.raises(ValueError):
+        histogram_quantile(np.zeros((4, 4)), 0.5)
+
+
+@pytest.mark.parametrize("tile", [37, 64, 128])
+def test_tiled_contours_match_whole_map(tile):
+    density = _field()
+    level = float(np.quantile(density, 0.7))
+    whole = measure.find_contours(density, level)
+    tiled = find_contours_tiled(density, level, tile=tile, workers=3)
+    assert len(tiled) == len(whole)
+    assert _canonical(tiled) == _canonical(whole)
+
+
+def test_stitch_joins_pieces_in_order():
+    a = np.array([[0.0, 0.0], [0.0, 1.0]])
+    b = np.array([[0.0, 1.0], [1.0, 1.0]])
+    c = np.array([[1.0, 1.0], [1.0, 0.0], [0.0, 0.0]])
+    loop = np.array([[5.0, 5.0], [5.0, 6.0], [6.0, 6.0], [5.0, 5.0]])
+    out = stitch_paths([c, loop, b, a])
+    assert len(out) == 2
+    ring = next(p for p in out if len(p) == 5 and p[0][0] != 5.0)
+    assert _canonical([ring]) == _canonical([np.vstack([a, b[1:], c[1:]])])
+
+
+@pytest.mark.parametrize("tolerance", [0.25, 1.0, 4.0])
+def test_batched_simplify_matches_approximate_polygon(tolerance):
+    density = _field((400, 400), 5.0)
+    paths = measure.find_contours(density, 0.55)
+    paths.append(np.array([[1.0, 1.0], [1.0, 1.0], [2.0, 2.0]]))  # degenerate chords
+    simplified = simplify_paths(paths, tolerance)
+    for got, p in zip(simplified, paths):
+        np.testing.assert_array_equal(got, approximate_polygon(p, tolerance))
+    assert all(a is b for a, b in zip(simplify_paths(paths, 0), paths))
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter
+
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.density_grid import (
+    bin_counts,
+    compute_densities,
+    compute_density,
+    grid_cell_for,
+    grid_shape_for,
+)
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.density_processing import (
+    density_to_boundary_paths,
+)
+
+RNG = np.random.default_rng(5)
+
+
+def _clustered_points(shape, n_clusters=6, per_cluster=300, spread=120.0):
+    H, W = shape
+    centres = RNG.uniform((0, 0), (W, H), (n_clusters, 2))
+    pts = centres.repeat(per_cluster, axis=0) + RNG.normal(0, spread, (n_clusters * per_cluster, 2))
+    background = RNG.uniform((0, 0), (W, H), (500, 2))
+    pts = np.vstack([pts, background])
+    return np.clip(pts[:, 0], 0, W - 1), np.clip(pts[:, 1], 0, H - 1)
+
+
+def test_duplicates_count_and_bins_are_centred():
+    counts = bin_counts([0, 0, 0, 24.9, 25.0, 99, np.nan], [0, 0, 0, 0, 0, 99, 3], (100, 100), 50)
+    assert counts.shape == grid_shape_for((100, 100), 50) == (3, 3)
+    assert counts[0, 0] == 4  # three duplicates plus a point just below the bin edge
+    assert counts[0, 1] == 1 and counts[2, 2] == 1
+    assert counts.sum() == 6  # NaN centroid dropped
+
+
+@pytest.mark.parametrize("sigma", [50.0, 200.0])
+def test_matches_full_resolution_gaussian(sigma):
+    shape = (1500, 1800)
+    x, y = _clustered_points(shape)
+    density, cell = compute_density(x, y, shape, sigma)
+    assert cell == grid_cell_for(sigma) and cell > 1
+    assert density.dtype == np.float32 and density.max() == pytest.approx(1.0)
+    assert density.size * cell * cell >= shape[0] * shape[1]
+
+    full = np.zeros(shape, np.float64)
+    np.add.at(full, (np.round(y).astype(int), np.round(x).astype(int)), 1)
+    full = gaussian_filter(full, sigma)
+    full /= full.max()
+    n = min(full[::cell].shape[0], density.shape[0]), min(full[:, ::cell].shape[1], density.shape[1])
+    sampled = full[::cell, ::cell][: n[0], : n[1]]
+    m = int(2 * sigma // cell)  # within ~2 sigma of the edge the boundary modes differ
+    inner = (slice(m, n[0] - m), slice(m, n[1] - m))
+    assert np.abs(density[: n[0], : n[1]][inner] - sampled[inner]).max() < 0.025
+
+
+def test_boundaries_on_the_grid():
+    shape = (3000, 3000)
+    x = np.r_[RNG.normal(800, 150, 2000), RNG.normal(2200, 150, 2000)]
+    y = np.r_[RNG.normal(800, 150, 2000), RNG.normal(2000, 150, 2000)]
+    density, cell = compute_density(x, y, shape, 200.0)
+    paths = density_to_boundary_paths(density, percentile=95.0)
+    assert len(paths) == 2
+    centres = sorted(tuple(np.round(p.mean(axis=0) * cell, -2)) for p in paths)
+    assert centres == [(800.0, 800.0), (2000.0, 2200.0)]
+
+
+def test_stacked_markers_match_one_at_a_time():
+    shape = (1200, 900)
+    x, y = _clustered_points(shape)
+    x[::97] = np.nan
+    selections = [RNG.random(x.size) < p for p in (0.1, 0.5, 0.0)]
+    stack, cell = compute_densities(x, y, selections, shape, 100.0)
+    assert stack.shape[0] == 3 and cell == grid_cell_for(100.0)
+    for sel, density in zip(selections, stack):
+        single, _ = compute_density(x[sel], y[sel], shape, 100.0)
+        np.testing.assert_allclose(density, single, atol=1e-6)
+    assert not stack[2].any()  # no positive cells: an all-zero map, not NaNs
@@ -0,0 +1,116 @@
+import os
+
+import numpy as np
+import pytest
+from tifffile import TiffFile, imwrite
+
+from aimino_frontend.aimino_core.handlers.special_analysis.utils import density_store
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.density_grid import compute_density
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.density_store import (
+    DensityRaster,
+    cached_levels,
+    ensure_densities,
+    ensure_density,
+    load_density,
+    refine_density,
+    save_density,
+)
+
+SHAPE = (2000, 2400)
+RNG = np.random.default_rng(11)
+X = np.r_[RNG.normal(600, 200, 3000), RNG.normal(1800, 120, 2000), RNG.uniform(0, SHAPE[1], 800)]
+Y = np.r_[RNG.normal(700, 200, 3000), RNG.normal(1400, 120, 2000), RNG.uniform(0, SHAPE[0], 800)]
+X, Y = np.clip(X, 0, SHAPE[1] - 1), np.clip(Y, 0, SHAPE[0] - 1)
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / "slide.tif"
+    imwrite(path, np.zeros(SHAPE, np.uint8))
+    return str(path)
+
+
+class _Points:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return X, Y
+
+
+@pytest.mark.parametrize("sigma_from, sigma_to", [(50.0, 200.0), (64.0, 90.0), (100.0, 100.5)])
+def test_refined_density_matches_direct(sigma_from, sigma_to):
+    base, cell = compute_density(X, Y, SHAPE, sigma_from)
+    derived, cell_to = refine_density(base, cell, sigma_from, sigma_to, SHAPE)
+    direct, direct_cell = compute_density(X, Y, SHAPE, sigma_to)
+    assert cell_to == direct_cell and derived.shape == direct.shape
+    m = int(2 * sigma_to // cell_to)  # within ~2 sigma of the edge the boundary modes differ
+    assert np.abs(derived - direct)[m:-m, m:-m].max() < 0.02
+    with pytest.raises(ValueError):
+        refine_density(direct, direct_cell, sigma_to, sigma_from, SHAPE)
+
+
+def test_new_sigmas_derive_from_cached_levels(image, tmp_path):
+    out = str(tmp_path / "out")
+    points = _Points()
+    d100, _ = ensure_density(image, points, "m_positive", out, 100.0)
+    d300, _ = ensure_density(image, points, "m_positive", out, 300.0)
+    assert points.calls == 1  # sigma=300 came from the cached sigma=100 level
+    assert sorted(cached_levels(image, "m_positive", out)) == [100, 300]
+
+    again, _ = ensure_density(image, points, "m_positive", out, 300.0)
+    np.testing.assert_array_equal(np.asarray(again), np.asarray(d300))
+    ensure_density(image, points, "m_positive", out, 50.0)  # nothing smaller cached
+    assert points.calls == 2
+
+    ensure_density(image, points, "m_positive", out, 300.0, force_recompute=True)
+    assert points.calls == 3
+    assert sorted(cached_levels(image, "m_positive", out)) == [300]
+
+
+def test_levels_are_bounded_and_keep_the_finest(image, tmp_path, monkeypatch):
+    monkeypatch.setattr(density_store, "DENSITY_CACHE_LEVELS", 3)
+    out = str(tmp_path / "out")
+    points = _Points()
+    for i, sigma in enumerate([40.0, 80.0, 120.0, 160.0, 200.0]):
+        ensure_density(image, points, "m_positive", out, sigma)
+        os.utime(cached_levels(image, "m_positive", out)[int(sigma)], (i, i))  # unambiguous creation order
+    assert sorted(cached_levels(image, "m_positive", out)) == [40, 160, 200]
+    assert points.calls == 1
+
+
+@pytest.mark.parametrize("bits, dtype", [(16, np.uint16), (8, np.uint8)])
+def test_levels_are_quantized_compressed_and_lazy(tmp_path, bits, dtype):
+    density, cell = compute_density(X, Y, SHAPE, 40.0)
+    path = str(tmp_path / f"d{bits}.tif")
+    save_density(path, density, cell, 40.0, bits=bits)
+    with TiffFile(path) as tf:
+        assert tf.pages[0].dtype == dtype and tf.pages[0].is_tiled and tf.pages[0].compression != 1
+    assert os.path.getsize(path) < density.nbytes / (4 if bits == 8 else 2)
+
+    lazy = load_density(path)
+    assert isinstance(lazy, DensityRaster) and (lazy.cell, lazy.sigma) == (cell, 40.0)
+    assert lazy.dtype == np.float32 and lazy.shape == density.shape
+    full = np.asarray(lazy)
+    assert np.abs(full - density).max() <= 0.5 / np.iinfo(dtype).max + 1e-6
+    np.testing.assert_array_equal(lazy[40:90, 7:300:3], full[40:90, 7:300:3])
+    assert full.max() == 1.0
+
+
+def test_missing_markers_are_computed_in_one_call(image, tmp_path):
+    out = str(tmp_path / "out")
+    masks = {"a_positive": X < 1000, "b_positive": Y > 900, "c_positive": X > Y}
+    calls = []
+
+    def positives(cols):
+        calls.append(list(cols))
+        return X, Y, [masks[c] for c in cols]
+
+    ensure_density(image, lambda: (X[masks["b_positive"]], Y[masks["b_positive"]]), "b_positive", out, 100.0)
+    levels = ensure_densities(image, positives, list(masks), out, 100.0)
+    assert calls == [["a_positive", "c_positive"]]  # b came from the cache
+    assert list(levels) == list(masks)
+    for col, level in levels.items():
+        direct, _ = compute_density(X[masks[col]], Y[masks[col]], SHAPE, 100.0)
+        assert np.abs(np.asarray(level) - direct).max() < 1e-4
@@ -0,0 +1,49 @@
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.artifacts import open_artifact, save_artifact
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.density_processing import set_boundary_layer
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.geometry import (
+    drop_long_segments,
+    path_segments,
+    segments_to_vectors,
+)
+
+RNG = np.random.default_rng(9)
+
+
+def _naive(paths):
+    return [np.stack([p[i], p[i + 1]]) for p in paths for i in range(len(p) - 1)]
+
+
+def test_path_segments_stay_within_paths(tmp_path):
+    paths = [RNG.random((int(n), 2)) for n in (5, 1, 2, 9, 0, 3)]
+    expected = np.asarray(_naive(paths), dtype=np.float32)
+    np.testing.assert_array_equal(path_segments(paths), expected)
+    save_artifact(tmp_path / "p.art", ragged={"paths": paths}, dtype=np.float32)
+    np.testing.assert_array_equal(path_segments(open_artifact(tmp_path / "p.art").ragged("paths")), expected)
+    assert path_segments([]).shape == (0, 2, 2)
+
+
+def test_vectors_and_length_filter():
+    segments = np.array([[[0, 0], [0, 1]], [[2, 2], [3, 2]], [[5, 5], [5, 6]], [[0, 0], [30, 40]]], dtype=float)
+    vectors = segments_to_vectors(segments)
+    assert vectors.dtype == np.float32
+    np.testing.assert_array_equal(vectors[:, 0], segments[:, 0])
+    np.testing.assert_array_equal(vectors[:, 0] + vectors[:, 1], segments[:, 1])
+    assert len(drop_long_segments(segments, factor=4)) == 3
+    assert len(drop_long_segments(segments, factor=0)) == 4
+
+
+def test_boundaries_are_one_vectors_layer():
+    viewer = MagicMock()
+    old = MagicMock()
+    old.name = "m_density_boundary"
+    viewer.layers.__iter__.return_value = iter([old])
+    paths = [RNG.random((20, 2)) * 50 for _ in range(30)]
+    assert set_boundary_layer(viewer, "m_density_boundary", paths, scale=(8, 8)) == 30 * 19
+    viewer.layers.remove.assert_called_once_with(old)
+    viewer.add_shapes.assert_not_called()
+    data = viewer.add_vectors.call_args.args[0]
+    assert data.shape == (570, 2, 2) and viewer.add_vectors.call_args.kwargs["scale"] == (8, 8)
@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.density_grid import compute_density
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.density_processing import (
+    _set_density_layer,
+    zoom_to_dense_region,
+    zoom_to_hotspot,
+)
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.density_store import load_density, save_density
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.hotspots import find_hotspots
+
+SHAPE = (4000, 5000)
+RNG = np.random.default_rng(8)
+# (x, y, cells): three clusters of decreasing size, the last two closer than two sigma
+CLUSTERS = [(1000, 1200, 3000), (3500, 2800, 2000), (3500, 3150, 600)]
+
+
+def _density(sigma=150.0):
+    x = np.concatenate([RNG.normal(cx, 120, n) for cx, _, n in CLUSTERS])
+    y = np.concatenate([RNG.normal(cy, 120, n) for _, cy, n in CLUSTERS])
+    return compute_density(np.clip(x, 0, SHAPE[1] - 1), np.clip(y, 0, SHAPE[0] - 1), SHAPE, sigma)
+
+
+def test_top_peaks_with_suppression_and_boxes():
+    density, cell = _density()
+    spots = find_hotspots(density, cell, 150.0)
+    assert [s["rank"] for s in spots] == list(range(1, len(spots) + 1))
+    assert spots[0]["value"] == pytest.approx(1.0)
+    assert spots[0]["value"] >= spots[1]["value"]
+    # the weak cluster next to the second one is suppressed
+    assert len(spots) == 2
+    for spot, (cx, cy, _) in zip(spots, CLUSTERS):
+        assert abs(spot["x"] - cx) < 100 and abs(spot["y"] - cy) < 100
+        y0, x0, y1, x1 = spot["bbox"]
+        assert y0 < spot["y"] < y1 and x0 < spot["x"] < x1
+        assert 150 < x1 - x0 < 1500
+    assert find_hotspots(density, cell, 150.0, k=1) == spots[:1]
+    assert find_hotspots(np.zeros((20, 20), np.float32), cell, 150.0) == []
+
+
+def test_hotspots_are_stored_with_the_level(tmp_path):
+    density, cell = _density()
+    path = str(tmp_path / "d.tif")
+    save_density(path, density, cell, 150.0)
+    level = load_density(path)
+    assert level._hotspots is not None
+    assert level.hotspots == find_hotspots(density, cell, 150.0)
+
+
+def _viewer_with(layer):
+    viewer = MagicMock()
+    viewer.layers = [layer]
+    viewer.window._qt_viewer = None
+    viewer.window.qt_viewer = None
+    return viewer
+
+
+def test_zoom_uses_the_index_and_steps_through_hotspots(tmp_path):
+    density, cell = _density()
+    path = str(tmp_path / "d.tif")
+    save_density(path, density, cell, 150.0)
+    level = load_density(path)
+
+    viewer = MagicMock()
+    viewer.layers = []
+    _set_density_layer(viewer, level, cell, "m_density")
+    metadata = viewer.add_image.call_args.kwargs["metadata"]
+    # zero pixels: only the hotspot index can place the view
+    layer = SimpleNamespace(
+        name="m_density", data=np.zeros(level.shape, np.float32), scale=(cell, cell), metadata=metadata
+    )
+    viewer = _viewer_with(layer)
+
+    spots = level.hotspots
+    assert zoom_to_dense_region(viewer, "m_density") == f"Zoomed to dense region near ({spots[0]['x']},{spots[0]['y']})."
+    msg = zoom_to_hotspot(viewer, "m_density", step=1)
+    assert msg.startswith(f"Zoomed to hotspot 2/{len(spots)}")
+    assert zoom_to_hotspot(viewer, "m_density", step=1).startswith("Zoomed to hotspot 1/")
+    assert zoom_to_hotspot(viewer, "m_density", step=-1).startswith(f"Zoomed to hotspot {len(spots)}/")
+    assert zoom_to_hotspot(viewer, "m_density", index=1).startswith("Zoomed to hotspot 1/")
+    assert layer.metadata["hotspot"] == 1
+    assert zoom_to_hotspot(viewer, "m_density", index=9).startswith("[warn]")
+    cx, cy = viewer.camera.center
+    assert abs(cx - spots[0]["x"]) < 400 and abs(cy - spots[0]["y"]) < 400
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from tifffile import TiffWriter, imwrite
+
+from aimino_frontend.aimino_core.data_store import (
+    DATA_ROOT_ENV,
+    get_dataset_paths,
+    ingest_dataset,
+    load_manifest,
+    save_manifest,
+)
+from aimino_frontend.aimino_core.image_probe import gray_plane_shape, image_info, probe_image
+from aimino_frontend.aimino_core.handlers.special_analysis.utils import image_processing
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.image_processing import (
+    load_image_for_mask,
+    mask_shape_for,
+)
+
+
+def test_probe_plain_and_rgb(tmp_path):
+    gray = tmp_path / "gray.tif"
+    imwrite(gray, np.zeros((40, 60), dtype=np.uint16), resolution=(2.0, 2.0), resolutionunit="CENTIMETER")
+    info = probe_image(gray)
+    assert info["shape"] == [40, 60]
+    assert info["dtype"] == "uint16"
+    assert info["channels"] == 1
+    assert info["plane_shape"] == [40, 60]
+    assert info["pixel_size"]["x"] == pytest.approx(5000.0)
+
+    rgb = tmp_path / "rgb.tif"
+    imwrite(rgb, np.zeros((30, 50, 3), dtype=np.uint8), photometric="rgb")
+    info = probe_image(rgb)
+    assert info["axes"] == "YXS"
+    assert info["channels"] == 3
+    assert info["plane_shape"] == [30, 50]
+    assert info["pixel_size"] is None
+
+
+def test_probe_ome_pyramid(tmp_path):
+    path = tmp_path / "pyr.ome.tif"
+    data = np.zeros((2, 64, 96), dtype=np.uint8)
+    with TiffWriter(path, ome=True) as tw:
+        tw.write(
+            data,
+            subifds=1,
+            metadata={"axes": "CYX", "PhysicalSizeX": 0.65, "PhysicalSizeY": 0.65},
+        )
+        tw.write(data[:, ::2, ::2], subfiletype=1)
+    info = probe_image(path)
+    assert info["channels"] == 2
+    assert info["levels"] == [[2, 64, 96], [2, 32, 48]]
+    assert info["pixel_size"] == {"x": 0.65, "y": 0.65, "unit": "um", "source": "ome"}
+    assert info["plane_shape"] == [64, 96]
+
+
+@pytest.mark.parametrize(
+    "shape",
+    [(5, 7), (1, 5, 7), (5, 7, 3), (5, 7, 4), (2, 5, 7), (1, 2, 5, 7, 3), (3, 1, 5, 7)],
+)
+def test_gray_plane_shape_matches_loader(tmp_path, shape):
+    path = tmp_path / "img.tif"
+    imwrite(path, np.zeros(shape, dtype=np.uint8))
+    assert tuple(gray_plane_shape(image_info(path)["shape"])) == load_image_for_mask(str(path)).shape
+
+
+def test_mask_shape_accounts_for_downsample(tmp_path, monkeypatch):
+    path = tmp_path / "img.tif"
+    imwrite(path, np.zeros((33, 50), dtype=np.uint8))
+    monkeypatch.setattr(image_processing, "AUTO_DOWNSAMPLE", 4)
+    assert mask_shape_for(str(path)) == image_processing._read_image_for_mask(str(path)).shape == (9, 13)
+
+
+def test_header_recorded_in_manifest(tmp_path, monkeypatch):
+    monkeypatch.setenv(DATA_ROOT_ENV, str(tmp_path / "data"))
+    img = tmp_path / "sample.tif"
+    imwrite(img, np.zeros((20, 30), dtype=np.uint8))
+    h5 = tmp_path / "sample.h5ad"
+    h5.write_bytes(b"h5ad")
+
+    manifest = ingest_dataset(img, h5, "case_hdr")
+    assert manifest["source_info"]["image"]["header"]["plane_shape"] == [20, 30]
+
+    # older manifests without a header record are upgraded on first access
+    stored = load_manifest("case_hdr")
+    del stored["source_info"]["image"]["header"]
+    save_manifest("case_hdr", stored)
+    get_dataset_paths("case_hdr")
+    assert load_manifest("case_hdr")["source_info"]["image"]["header"]["shape"] == [20, 30]
@@ -0,0 +1,73 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from aimino_frontend.aimino_core.handlers.special_analysis.utils import rasterize
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.mask_processing import (
+    rebuild_labels_from_obs_safe,
+)
+
+
+def _cells(n, shape, seed=1):
+    rng = np.random.default_rng(seed)
+    H, W = shape
+    major = rng.uniform(6, 40, n)
+    return {
+        "CellID": rng.permutation(np.arange(1, n + 1)),
+        "X_centroid": rng.uniform(0, W, n),
+        "Y_centroid": rng.uniform(0, H, n),
+        "MajorAxisLength": major,
+        "MinorAxisLength": major * rng.uniform(0.3, 1.0, n),
+        "Orientation": rng.uniform(-np.pi / 2, np.pi / 2, n),
+    }
+
+
+def test_tile_assignment_covers_each_box():
+    bounds = rasterize.ellipse_bounds(
+        np.array([5.0, 63.0, 130.0]), np.array([5.0, 63.0, 10.0]),
+        np.array([3.0, 4.0, 50.0]), np.array([3.0, 4.0, 2.0]), np.zeros(3),
+    )
+    tiles = {(y0, x0): list(c) for y0, y1, x0, x1, c in rasterize._tile_cells(bounds, (128, 192), 64)}
+    assert tiles[(0, 0)] == [0, 1]  # cell 1 straddles four tiles
+    assert tiles[(64, 64)] == [1]
+    assert tiles[(0, 64)] == [1, 2] and tiles[(0, 128)] == [2]
+
+
+def test_parallel_tiles_match_single_pass(monkeypatch):
+    monkeypatch.setattr(rasterize, "LABEL_PARALLEL_MIN_PIXELS", 0)
+    shape = (300, 260)
+    obs = _cells(1500, shape)
+    serial = rebuild_labels_from_obs_safe(obs, shape, workers=1)
+    tiled = rebuild_labels_from_obs_safe(obs, shape, workers=2, tile_size=64)
+    assert isinstance(tiled, np.memmap)
+    np.testing.assert_array_equal(tiled, serial)
+
+
+def test_small_work_stays_in_process():
+    obs = _cells(10, (300, 300))
+    labels = rebuild_labels_from_obs_safe(obs, (300, 300), workers=4, tile_size=64)
+    assert not isinstance(labels, np.memmap)
+
+
+@pytest.mark.slow
+@pytest.mark.skipif(not os.getenv("AIMINO_BENCHMARK"), reason="set AIMINO_BENCHMARK=1 to run benchmarks")
+def test_benchmark_label_scaling(monkeypatch, capsys):
+    """Time label building against worker count (``AIMINO_BENCHMARK=1 pytest -m slow``)."""
+    monkeypatch.setattr(rasterize, "LABEL_PARALLEL_MIN_PIXELS", 0)
+    shape = (12000, 12000)
+    obs = _cells(400_000, shape)
+    reference = None
+    counts = sorted({1, 2, 4, 8, 16, 32, os.cpu_count() or 1})
+    with capsys.disabled():
+        print(f"\n{len(obs['CellID'])} cells on {shape}, {os.cpu_count()} cores")
+        for workers in [w for w in counts if w <= (os.cpu_count() or 1)]:
+            t0 = time.perf_counter()
+            labels = rebuild_labels_from_obs_safe(obs, shape, workers=workers, tile_size=2048)
+            elapsed = time.perf_counter() - t0
+            print(f"  workers={workers:>2}  {elapsed:6.2f} s")
+            if reference is None:
+                reference = np.array(labels)
+            else:
+                np.testing.assert_array_equal(labels, reference)
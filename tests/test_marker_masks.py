@@ -0,0 +1,82 @@
+import numpy as np
+
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.mask_processing import build_marker_masks
+
+
+def test_single_pass_matches_isin_per_marker():
+    rng = np.random.default_rng(5)
+    labels = rng.integers(0, 400, (257, 190)).astype(np.uint16)
+    labels[0, 0] = 999  # label without a cell-table row
+    cell_ids = rng.permutation(np.arange(1, 400))
+    positives = {f"m{i}": rng.random(len(cell_ids)) > 0.6 for i in range(10)}
+
+    masks = build_marker_masks(labels, cell_ids, positives, block_rows=50)
+    assert list(masks) == list(positives)
+    for name, pos in positives.items():
+        expected = np.isin(labels, cell_ids[pos]).astype(np.uint8)
+        assert masks[name].dtype == np.uint8
+        np.testing.assert_array_equal(masks[name], expected)
+
+
+def test_background_never_positive():
+    labels = np.array([[0, 1], [2, 0]], np.int32)
+    masks = build_marker_masks(labels, np.array([0, 1, 2]), {"a": np.array([True, True, False])})
+    np.testing.assert_array_equal(masks["a"], [[0, 1], [0, 0]])
+
+
+def _obs(n=300, shape=(120, 160), seed=2):
+    rng = np.random.default_rng(seed)
+    H, W = shape
+    return {
+        "CellID": np.arange(1, n + 1),
+        "X_centroid": rng.uniform(0, W, n),
+        "Y_centroid": rng.uniform(0, H, n),
+        "MajorAxisLength": rng.uniform(4, 16, n),
+        "MinorAxisLength": rng.uniform(3, 8, n),
+        "Orientation": rng.uniform(-1.5, 1.5, n),
+        "tumor_positive": rng.random(n) < 0.3,
+    }
+
+
+def test_preview_covers_exact_mask():
+    from aimino_frontend.aimino_core.handlers.special_analysis.utils.mask_processing import (
+        rebuild_labels_from_obs_safe,
+        render_marker_preview,
+    )
+
+    obs = _obs()
+    labels = rebuild_labels_from_obs_safe(obs, (120, 160))
+    exact = build_marker_masks(labels, obs["CellID"], {"t": obs["tumor_positive"]})["t"]
+    preview = render_marker_preview(obs, "tumor_positive", (120, 160), 1)
+    assert preview.dtype == np.uint8
+    assert np.all(preview >= exact)
+    # extra preview pixels belong to overlapping negative cells
+    extra = (preview == 1) & (exact == 0)
+    assert np.all(labels[extra] > 0)
+
+    coarse = render_marker_preview(obs, "tumor_positive", (30, 40), 4)
+    assert coarse.shape == (30, 40) and coarse.any()
+
+
+def test_preview_skips_label_image(tmp_path, monkeypatch):
+    from tifffile import imwrite
+
+    from aimino_frontend.aimino_core.handlers.special_analysis.utils import mask_processing
+
+    img = tmp_path / "img.tif"
+    imwrite(img, np.zeros((120, 160), np.uint8))
+    obs = _obs()
+
+    def no_labels(*args, **kwargs):
+        raise AssertionError("preview must not build the label image")
+
+    monkeypatch.setattr(mask_processing, "_ensure_labels", no_labels)
+    out = mask_processing._preview_masks(str(img), obs, ["tumor_positive"], str(tmp_path), downsample=2)
+    mask, factor = out["tumor_positive"]
+    assert factor == 2 and mask.shape == (60, 80)
+
+    monkeypatch.undo()
+    exact = mask_processing._ensure_mask(str(img), obs, "tumor_positive", str(tmp_path))
+    mask, factor = mask_processing._preview_masks(str(img), obs, ["tumor_positive"], str(tmp_path))["tumor_positive"]
+    assert factor == 1
+    np.testing.assert_array_equal(np.asarray(mask), exact)
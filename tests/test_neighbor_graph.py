@@ -0,0 +1,138 @@
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+from scipy.spatial import cKDTree
+
+from aimino_frontend.aimino_core.handlers.special_analysis.utils import neighbor_graph as ng
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.neighbor_graph import (
+    neighbor_graph_dir,
+    open_neighbor_graph,
+)
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.neighbor_search import within_radius
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.neighborhood import (
+    compute_tumor_neighborhood_layers,
+)
+
+N = 3000
+RNG = np.random.default_rng(13)
+X = RNG.uniform(0, 1500, N)
+Y = RNG.uniform(0, 1000, N)
+TUMOR = RNG.random(N) < 0.1
+POINTS = np.column_stack([Y, X])
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch, write_h5ad):
+    monkeypatch.setattr(ng, "BUILD_CHUNK", 700)  # several chunks
+    h5 = write_h5ad(tmp_path / "cells.h5ad", {"X_centroid": X, "Y_centroid": Y, "tumor_positive": TUMOR})
+    return h5, tmp_path / "processed"
+
+
+def test_graph_answers_smaller_radii_knn_and_counts(dataset, monkeypatch):
+    h5, out = dataset
+    monkeypatch.setattr(ng, "NEIGHBOR_GRAPH_RADIUS", 60.0)
+    graph = open_neighbor_graph(h5, out, radius=60.0)
+    assert graph.radius == 60.0 and graph.n_cells == N
+    assert isinstance(graph.distances, np.memmap)
+    tree = cKDTree(POINTS)
+
+    for r in (0.0, 12.5, 35.0, 60.0):
+        expected = tree.query_ball_point(POINTS, r, return_length=True) - 1
+        np.testing.assert_array_equal(graph.degree(r), expected)
+        np.testing.assert_array_equal(
+            graph.within(TUMOR, r) | TUMOR, within_radius(POINTS, POINTS[TUMOR], r) | TUMOR
+        )
+        indptr, indices, distances = graph.subgraph(r)
+        np.testing.assert_array_equal(np.diff(indptr), expected)
+        assert (distances <= r).all()
+        row = 17
+        assert set(indices[indptr[row] : indptr[row + 1]]) == set(tree.query_ball_point(POINTS[row], r)) - {row}
+
+    idx, dist = graph.knn(4)
+    ref_dist, ref_idx = tree.query(POINTS, k=5)
+    known = ref_dist[:, 1:] <= 60.0
+    np.testing.assert_allclose(dist[known], ref_dist[:, 1:][known], rtol=1e-6)
+    assert (idx[~known] == -1).all() and np.isinf(dist[~known]).all()
+    with pytest.raises(ValueError):
+        graph.within(TUMOR, 61.0)
+
+
+def test_graph_is_reused_and_rebuilt_when_needed(dataset, monkeypatch):
+    h5, out = dataset
+    monkeypatch.setattr(ng, "NEIGHBOR_GRAPH_RADIUS", 40.0)
+    graph = open_neighbor_graph(h5, out, radius=20.0)
+    assert graph.radius == 40.0  # built at the configured radius, not the requested one
+    stamp = (neighbor_graph_dir(h5, out) / "indices.bin").stat().st_mtime_ns
+    assert open_neighbor_graph(h5, out, radius=40.0) is graph
+    ng.get_object_cache().clear()
+    reopened = open_neighbor_graph(h5, out, radius=40.0, build=False)
+    assert reopened is not None and reopened.n_pairs == graph.n_pairs
+    assert (neighbor_graph_dir(h5, out) / "indices.bin").stat().st_mtime_ns == stamp
+    assert open_neighbor_graph(h5, out, radius=80.0, build=False) is None
+    assert open_neighbor_graph(h5, out, radius=80.0).radius == 80.0
+    assert open_neighbor_graph(h5, out, radius=20.0, force=True).radius == 40.0
+
+
+def test_radius_sweep_builds_the_graph_once(dataset, monkeypatch):
+    h5, out = dataset
+    monkeypatch.setattr(ng, "NEIGHBOR_GRAPH_RADIUS", 100.0)
+    monkeypatch.setattr(
+        "aimino_frontend.aimino_core.handlers.special_analysis.utils.neighborhood.NEIGHBOR_GRAPH_RADIUS", 100.0
+    )
+    built = []
+    build = ng.build_neighbor_graph
+    monkeypatch.setattr(ng, "build_neighbor_graph", lambda h, o, r=None: built.append(r) or build(h, o, r))
+    viewer = MagicMock()
+    viewer.layers = []
+
+    def run(r, force=False):
+        compute_tumor_neighborhood_layers(
+            viewer, str(out / "img.tif"), str(h5), "tumor_positive", str(out), r, force_recompute=force
+        )
+
+    for r in (20.0, 30.0, 40.0, 50.0, 10.0):
+        run(r)
+    assert built == [100.0]
+    run(20.0, force=True)
+    assert built == [100.0, 100.0]
+
+
+@pytest.mark.parametrize("radius", [25.0, 150.0])
+def test_neighborhood_filters_the_graph(dataset, monkeypatch, radius):
+    h5, out = dataset
+    monkeypatch.setattr(ng, "NEIGHBOR_GRAPH_RADIUS", 100.0)
+    monkeypatch.setattr(
+        "aimino_frontend.aimino_core.handlers.special_analysis.utils.neighborhood.NEIGHBOR_GRAPH_RADIUS", 100.0
+    )
+    viewer = MagicMock()
+    viewer.layers = []
+    msg = compute_tumor_neighborhood_layers(viewer, str(out / "img.tif"), str(h5), "tumor_positive", str(out), radius)
+    expected = int((within_radius(POINTS, POINTS[TUMOR], radius) & ~TUMOR).sum())
+    assert f"{expected} neighbor cells within {radius:g}px of {int(TUMOR.sum())} tumor cells" in msg
+    # radius 25 filters the graph built at 100; 150 is searched directly
+    assert neighbor_graph_dir(h5, out).exists() == (radius <= 100.0)
+    if radius <= 100.0:
+        assert open_neighbor_graph(h5, out, build=False).radius == 100.0
+    assert (out / "img" / "img_tumor_positive_neighborhood_edges.art").exists()
+    # one categorical, float32 points layer for all classes
+    viewer.add_points.assert_called_once()
+    data = viewer.add_points.call_args.args[0]
+    kwargs = viewer.add_points.call_args.kwargs
+    assert data.dtype == np.float32 and kwargs["face_color"] == "class"
+    classes = kwargs["properties"]["class"]
+    assert len(classes) == len(data) and (classes == "tumor").sum() == TUMOR.sum()
+    assert set(kwargs["face_color_cycle"]) >= set(classes)
+    # Delaunay edges as one vectors layer instead of one shape per edge
+    viewer.add_shapes.assert_not_called()
+    vectors = viewer.add_vectors.call_args.args[0]
+    assert vectors.shape[1:] == (2, 2) and vectors.dtype == np.float32
+
+
+def test_nearest_source_distance_answers_every_radius(dataset):
+    h5, out = dataset
+    graph = open_neighbor_graph(h5, out, radius=50.0)
+    nearest = graph.nearest(TUMOR)
+    for r in (5.0, 20.0, 50.0):
+        np.testing.assert_array_equal(nearest <= r, graph.within(TUMOR, r))
+    assert np.isinf(graph.nearest(np.zeros(N, dtype=bool))).all()
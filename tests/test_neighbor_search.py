@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from scipy.spatial import cKDTree
+
+from aimino_frontend.aimino_core.handlers.special_analysis.utils import neighbor_search
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.neighbor_search import within_radius
+
+RNG = np.random.default_rng(5)
+
+
+def _reference(points, sources, radius):
+    """The previous per-cell ball queries merged into a set."""
+    hits = set()
+    for inds in cKDTree(points).query_ball_point(sources, r=radius):
+        hits.update(inds)
+    mask = np.zeros(len(points), dtype=bool)
+    mask[sorted(hits)] = True
+    return mask
+
+
+@pytest.mark.parametrize("engine", ["kdtree", "grid"])
+@pytest.mark.parametrize("radius", [0.0, 7.5, 50.0, 400.0])
+def test_engines_match_ball_queries(engine, radius):
+    points = np.round(RNG.uniform(-100, 2000, size=(20_000, 2)), 1)
+    sources = points[RNG.random(len(points)) < 0.05]
+    expected = _reference(points, sources, radius)
+    np.testing.assert_array_equal(within_radius(points, sources, radius, engine=engine), expected)
+
+
+def test_grid_engine_chunks_and_exact_distances(monkeypatch):
+    monkeypatch.setattr(neighbor_search, "GRID_CHUNK_PAIRS", 7)
+    sources = np.array([[0.0, 0.0], [0.0, 0.5], [100.0, 100.0]])
+    points = np.array([[3.0, 4.0], [3.0, 4.01], [100.0, 110.0], [-5.0, 0.0], [80.0, 100.0]])
+    # distance exactly 5, 4.62 to the second source, 10, exactly 5, 20
+    expected = [True, True, False, True, False]
+    for engine in ("kdtree", "grid"):
+        assert within_radius(points, sources, 5.0, engine=engine).tolist() == expected
+
+
+def test_auto_engine_and_edge_cases(monkeypatch):
+    points = RNG.uniform(0, 100, size=(500, 2))
+    sources = points[:20]
+    monkeypatch.setattr(neighbor_search, "NEIGHBOR_GRID_MIN_POINTS", 100)
+    np.testing.assert_array_equal(within_radius(points, sources, 9.0), _reference(points, sources, 9.0))
+    assert not within_radius(points, np.empty((0, 2)), 9.0).any()
+    assert within_radius(np.empty((0, 2)), sources, 9.0).shape == (0,)
+    with pytest.raises(ValueError):
+        within_radius(points, sources, 9.0, engine="octree")
@@ -0,0 +1,135 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from aimino_frontend.aimino_core.object_cache import HANDLE_BYTES, ObjectCache, get_object_cache, source_key
+
+
+def test_lru_eviction_respects_byte_budget():
+    cache = ObjectCache(max_bytes=250)
+    a, b, c = (np.zeros(100, dtype=np.uint8) for _ in range(3))
+    cache.put("a", a)
+    cache.put("b", b)
+    assert cache.get("a") is a  # "a" becomes most recently used
+    cache.put("c", c)
+
+    assert "b" not in cache
+    assert "a" in cache and "c" in cache
+    stats = cache.stats()
+    assert stats["bytes"] == 200
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 1
+
+
+def test_oversized_values_are_not_kept():
+    cache = ObjectCache(max_bytes=10)
+    big = np.zeros(100, dtype=np.uint8)
+    assert cache.put("big", big) is big
+    assert len(cache) == 0
+
+
+class _Handle:
+    """Stand-in for a file-backed object that decodes more data as it is used."""
+
+    def __init__(self, files=1):
+        self.cache_handles = files
+        self.decoded = []
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + sum(a.nbytes for a in self.decoded)
+
+
+def test_handles_are_charged_and_capped():
+    cache = ObjectCache(max_bytes=10 * HANDLE_BYTES, max_handles=3)
+    a, b = _Handle(2), _Handle(1)
+    cache.put("a", a)
+    cache.put("b", b)
+    assert cache.stats()["handles"] == 3 and cache.stats()["bytes"] > 3 * HANDLE_BYTES
+    cache.get("a")
+    cache.put("c", _Handle(1))  # over the handle cap: "b" is least recently used
+    assert "b" not in cache and "a" in cache and "c" in cache
+    assert cache.put("wide", _Handle(4)) is not None and "wide" not in cache
+
+
+def test_handles_are_remeasured_when_they_grow():
+    cache = ObjectCache(max_bytes=3 * HANDLE_BYTES)
+    first, grower = _Handle(), _Handle()
+    cache.put("first", first)
+    cache.put("grower", grower)
+    grower.decoded.append(np.zeros(HANDLE_BYTES // 2, dtype=np.uint8))
+    assert cache.get("grower") is grower
+    assert cache.stats()["bytes"] > 2.5 * HANDLE_BYTES
+    grower.decoded.append(np.zeros(HANDLE_BYTES, dtype=np.uint8))
+    cache.get("grower")
+    assert "first" not in cache and "grower" in cache
+
+
+def test_handles_are_measured_outside_the_cache_lock():
+    cache = ObjectCache(max_bytes=10 * HANDLE_BYTES)
+
+    class Locking(_Handle):
+        """Reports its size under its own lock while another thread drops cache entries."""
+
+        blocked = False
+
+        def __sizeof__(self):
+            other = threading.Thread(target=cache.invalidate, args=(lambda k: k == "other",))
+            other.start()
+            other.join(timeout=2.0)
+            Locking.blocked |= other.is_alive()
+            return super().__sizeof__()
+
+    handle = Locking()
+    cache.put("h", handle)
+    handle.decoded.append(np.zeros(16, dtype=np.uint8))
+    assert cache.get("h") is handle
+    assert not Locking.blocked and cache.stats()["bytes"] > HANDLE_BYTES + 16
+
+
+def test_get_or_load_counts_hits_and_misses():
+    cache = ObjectCache()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return np.arange(4)
+
+    first = cache.get_or_load("k", loader)
+    second = cache.get_or_load("k", loader)
+    assert first is second
+    assert len(calls) == 1
+    assert cache.stats()["misses"] == 1 and cache.stats()["hits"] == 1
+    with pytest.raises(ValueError):
+        first[0] = 5  # cached arrays are shared, so they are read-only
+
+
+def test_source_key_tracks_file_changes(tmp_path):
+    path = tmp_path / "img.tif"
+    path.write_bytes(b"one")
+    key1 = source_key("image", path, 2)
+    path.write_bytes(b"three")
+    os.utime(path, (1_000_000_000, 1_000_000_000))
+    key2 = source_key("image", path, 2)
+    assert key1 != key2
+    assert key1[0] == "image" and key1[-1] == 2
+
+
+def test_load_image_for_mask_decodes_once(tmp_path, monkeypatch):
+    from tifffile import imwrite
+    from aimino_frontend.aimino_core.handlers.special_analysis.utils import image_processing
+
+    path = tmp_path / "img.tif"
+    imwrite(path, np.arange(64, dtype=np.uint16).reshape(8, 8))
+    reads = []
+    original = image_processing._read_image_for_mask
+    monkeypatch.setattr(
+        image_processing, "_read_image_for_mask", lambda p: reads.append(p) or original(p)
+    )
+
+    img1 = image_processing.load_image_for_mask(str(path))
+    img2 = image_processing.load_image_for_mask(str(path))
+    assert img1 is img2
+    assert len(reads) == 1
+    assert get_object_cache().stats()["hits"] >= 1
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from aimino_frontend.aimino_core.obs_reader import (
+    list_obs_columns,
+    positive_mask,
+    read_obs_columns,
+)
+
+
+INDEX = ["a", "b", "c", "d"]
+COLUMNS = {
+    "CellID": np.array([1, 2, 3, 4], dtype=np.int64),
+    "X_centroid": np.array([1.5, 2.5, 3.5, 4.5]),
+    "SOX10_positive": np.array([True, False, True, False]),
+    "CD3E_positive": {
+        "attrs": {"encoding-type": "categorical", "ordered": False},
+        "categories": ["False", "True"],
+        "codes": np.array([1, 0, -1, 1], dtype=np.int8),
+    },
+    "label": ["yes", " no", "Y ", "1"],
+    "count": {
+        "attrs": {"encoding-type": "nullable-integer"},
+        "values": np.array([5, 6, 7, 8]),
+        "mask": np.array([False, True, False, False]),
+    },
+}
+
+
+def test_read_selected_columns(tmp_path, write_h5ad):
+    path = tmp_path / "cells.h5ad"
+    write_h5ad(path, COLUMNS, index=INDEX)
+
+    assert list_obs_columns(path) == [
+        "CellID",
+        "X_centroid",
+        "SOX10_positive",
+        "CD3E_positive",
+        "label",
+        "count",
+    ]
+    obs = read_obs_columns(path, ["CellID", "X_centroid", "CD3E_positive", "label", "count", "_index"])
+    assert obs["CellID"].dtype == np.int64
+    np.testing.assert_allclose(obs["X_centroid"], [1.5, 2.5, 3.5, 4.5])
+    assert list(obs["CD3E_positive"]) == ["True", "False", None, "True"]
+    assert list(obs["label"]) == ["yes", " no", "Y ", "1"]
+    assert np.isnan(obs["count"][1]) and obs["count"][2] == 7
+    assert list(obs["_index"]) == ["a", "b", "c", "d"]
+    assert "SOX10_positive" not in obs
+
+
+def test_missing_columns(tmp_path, write_h5ad):
+    path = tmp_path / "cells.h5ad"
+    write_h5ad(path, COLUMNS, index=INDEX)
+
+    with pytest.raises(KeyError, match="nope"):
+        read_obs_columns(path, ["CellID", "nope"])
+    obs = read_obs_columns(path, ["CellID", "nope"], skip_missing=True)
+    assert set(obs) == {"CellID"}
+
+
+def test_positive_mask_matches_string_rules(tmp_path, write_h5ad):
+    path = tmp_path / "cells.h5ad"
+    write_h5ad(path, COLUMNS, index=INDEX)
+    obs = read_obs_columns(path, ["SOX10_positive", "CD3E_positive", "label"])
+
+    assert positive_mask(obs["SOX10_positive"]).tolist() == [True, False, True, False]
+    assert positive_mask(obs["CD3E_positive"]).tolist() == [True, False, False, True]
+    assert positive_mask(obs["label"]).tolist() == [True, False, True, True]
+    assert positive_mask(np.array([1, 0, 2])).tolist() == [True, False, False]
+
+
+def test_matches_anndata_roundtrip(tmp_path):
+    ad = pytest.importorskip("anndata")
+    pd = pytest.importorskip("pandas")
+
+    frame = pd.DataFrame(
+        {
+            "CellID": [10, 11, 12],
+            "Y_centroid": [3.0, 4.0, 5.0],
+            "tumor_positive": pd.Categorical(["True", "False", "True"]),
+            "CD45_positive": [False, True, True],
+        },
+        index=["c0", "c1", "c2"],
+    )
+    path = tmp_path / "roundtrip.h5ad"
+    ad.AnnData(np.zeros((3, 1), dtype=np.float32), obs=frame).write_h5ad(path)
+
+    obs = read_obs_columns(path, ["CellID", "Y_centroid", "tumor_positive", "CD45_positive"])
+    np.testing.assert_array_equal(obs["CellID"], frame["CellID"].to_numpy())
+    np.testing.assert_allclose(obs["Y_centroid"], frame["Y_centroid"].to_numpy())
+    assert positive_mask(obs["tumor_positive"]).tolist() == [True, False, True]
+    assert positive_mask(obs["CD45_positive"]).tolist() == [False, True, True]
@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.points_lod import PointsLOD, lod_order, view_box
+
+RNG = np.random.default_rng(4)
+
+
+def test_levels_are_prefixes_of_grid_samples():
+    points = np.r_[RNG.uniform(0, 6400, (20_000, 2)), RNG.normal(3000, 30, (5000, 2))].astype(np.float32)
+    order, levels = lod_order(points, top_cells=8)
+    assert sorted(order.tolist()) == list(range(len(points)))
+    assert (np.diff(levels) >= 0).all()
+    ranked = points[order]
+    lo = points.min(axis=0)
+    extent = (points.max(axis=0) - lo).max()
+    for level in range(int(levels.max())):
+        side = 8 * 2**level
+        prefix = ranked[levels <= level]
+        cells = np.minimum(((prefix - lo) / extent * side).astype(int), side - 1)
+        keys = cells[:, 0] * side + cells[:, 1]
+        # one point per occupied cell of the level's grid
+        assert len(np.unique(keys)) == len(keys)
+        every = np.minimum(((points - lo) / extent * side).astype(int), side - 1)
+        assert len(keys) == len(np.unique(every[:, 0] * side + every[:, 1]))
+
+
+class _Layers(list):
+    events = None
+
+
+def _viewer(center, zoom, layer):
+    events = SimpleNamespace(zoom=MagicMock(), center=MagicMock())
+    camera = SimpleNamespace(center=center, zoom=zoom, events=events)
+    layers = _Layers([layer])
+    layers.events = SimpleNamespace(removed=MagicMock())
+    return SimpleNamespace(camera=camera, layers=layers, _canvas_size=(500, 800))
+
+
+def test_selection_is_budget_bounded_and_culled():
+    points = RNG.uniform(0, 10_000, (50_000, 2)).astype(np.float32)
+    lod = PointsLOD("cells", budget=5000)
+    classes = np.where(RNG.random(len(points)) < 0.5, "tumor", "other")
+    lod.set_points(points, **{"class": classes, "size": np.full(len(points), 20.0, np.float32)})
+    overview = lod.select(None)
+    assert 0 < len(overview) <= 5000
+    layer = SimpleNamespace(name="cells", data=None, properties=None, size=None, metadata={"lod": lod})
+    viewer = _viewer((5000.0, 5000.0), 0.05, layer)
+    assert view_box(viewer) == pytest.approx((-5000.0, -11000.0, 15000.0, 21000.0))
+
+    # zoomed far in: every point in the padded view, nothing outside it
+    viewer.camera.center, viewer.camera.zoom = (2000.0, 3000.0), 5.0
+    assert lod.update(viewer)
+    y0, x0, y1, x1 = view_box(viewer)
+    inside = (points[:, 0] >= y0) & (points[:, 0] <= y1) & (points[:, 1] >= x0) & (points[:, 1] <= x1)
+    assert len(layer.data) == inside.sum() and layer.data.dtype == np.float32
+    assert len(layer.properties["class"]) == len(layer.size) == len(layer.data)
+    drawn = {tuple(p) for p in layer.data}
+    assert all(tuple(p) in drawn for p in points[inside])
+    for i in range(0, len(layer.data), 97):
+        j = np.flatnonzero((points == layer.data[i]).all(axis=1))[0]
+        assert layer.properties["class"][i] == classes[j]
+
+    # small pans inside the drawn margin keep the layer as is
+    viewer.camera.center = (2010.0, 3010.0)
+    assert not lod.update(viewer)
+    viewer.camera.zoom = 0.05
+    assert lod.update(viewer) and len(layer.data) <= 5000
+    lod.connect(viewer)
+    viewer.camera.events.zoom.connect.assert_called_once()
+
+
+def test_stale_controller_leaves_a_replacement_layer_alone():
+    points = RNG.uniform(0, 1000, (2000, 2)).astype(np.float32)
+    old = PointsLOD("cells")
+    old.set_points(points)
+    layer = SimpleNamespace(name="cells", data=None, metadata={"lod": old})
+    viewer = _viewer((500.0, 500.0), 1.0, layer)
+    old.connect(viewer)
+    assert old.update(viewer) and len(layer.data) == len(points)
+
+    # the layer is deleted and a new one with the same name takes its place
+    fresh = SimpleNamespace(name="cells", data="fresh", metadata={})
+    viewer.layers[:] = [fresh]
+    removed = viewer.layers.events.removed.connect.call_args.args[0]
+    removed(SimpleNamespace(value=layer))
+    assert not old.update(viewer) and fresh.data == "fresh"
+    for emitter in (viewer.camera.events.zoom, viewer.camera.events.center, viewer.layers.events.removed):
+        assert emitter.disconnect.call_count == 1
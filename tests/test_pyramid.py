@@ -0,0 +1,125 @@
+import os
+from concurrent.futures import Future
+
+import numpy as np
+from tifffile import TiffFile, imwrite
+
+from aimino_frontend.aimino_core.data_store import DATA_ROOT_ENV, ingest_dataset
+from aimino_frontend.aimino_core.handlers.special_analysis.utils import pyramid
+
+
+def _small_pyramids(monkeypatch):
+    monkeypatch.setattr(pyramid, "PYRAMID_MIN_SIDE", 64)
+    monkeypatch.setattr(pyramid, "PYRAMID_TOP_SIDE", 16)
+    monkeypatch.setattr(pyramid, "_STRIP_ROWS", 8)
+
+
+class _DeferredBuilder:
+    """Background worker stand-in that runs submitted builds only when asked."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.jobs.append((future, fn, args))
+        return future
+
+    def run(self):
+        for future, fn, args in self.jobs:
+            future.set_result(fn(*args))
+
+
+def test_build_pyramid_levels(tmp_path, monkeypatch):
+    _small_pyramids(monkeypatch)
+    img = np.arange(70 * 45, dtype=np.uint16).reshape(70, 45)
+    path = tmp_path / "slide.tif"
+    imwrite(path, img)
+
+    meta = pyramid.build_pyramid(str(path), str(tmp_path / "out"))
+    levels = pyramid.open_pyramid(str(path), str(tmp_path / "out"))
+    assert [lvl.shape for lvl in levels] == [(70, 45), (35, 23), (18, 12), (9, 6)]
+    assert [lvl["downsample"] for lvl in meta["levels"]] == [1, 2, 4, 8]
+    # level 0 is read from the source; only the reduced levels are stored, tiled and compressed
+    assert levels[0].path == str(path)
+    np.testing.assert_array_equal(np.asarray(levels[0]), img)
+    stored = tmp_path / "out" / "pyramid" / "slide"
+    assert sorted(p.name for p in stored.iterdir()) == ["levels.tif", "meta.json"]
+    with TiffFile(stored / "levels.tif") as tf:
+        page = tf.pages[0]
+        assert page.is_tiled and page.compression != 1 and len(tf.series[0].levels) == 3
+
+    padded = np.pad(img.astype(np.float32), ((0, 0), (0, 1)), mode="edge")
+    expected = np.rint(padded.reshape(35, 2, 23, 2).mean(axis=(1, 3)))
+    np.testing.assert_array_equal(np.asarray(levels[1]), expected.astype(np.uint16))
+    assert not (tmp_path / "out" / "pyramid" / "slide.tmp").exists()
+
+
+def test_open_pyramid_detects_stale_source(tmp_path, monkeypatch):
+    _small_pyramids(monkeypatch)
+    builder = _DeferredBuilder()
+    monkeypatch.setattr(pyramid, "_BUILDER", builder)
+    monkeypatch.setattr(pyramid, "_PENDING", {})
+    path = tmp_path / "slide.tif"
+    imwrite(path, np.zeros((64, 64), dtype=np.uint8))
+    out = str(tmp_path / "out")
+    pyramid.build_pyramid(str(path), out)
+    assert len(pyramid.ensure_pyramid(str(path), out)) == 3 and not builder.jobs
+
+    imwrite(path, np.ones((64, 64), dtype=np.uint8))
+    os.utime(path, (1_000_000_000, 1_000_000_000))
+    assert pyramid.open_pyramid(str(path), out) is None
+    levels = pyramid.ensure_pyramid(str(path), out)
+    assert len(levels) == 1 and np.asarray(levels[0]).max() == 1 and len(builder.jobs) == 1
+    builder.run()
+    levels = pyramid.open_pyramid(str(path), out)
+    assert np.asarray(levels[0]).max() == 1 and np.asarray(levels[-1]).max() == 1
+
+
+def test_small_images_skip_pyramid(tmp_path, monkeypatch):
+    _small_pyramids(monkeypatch)
+    path = tmp_path / "small.tif"
+    imwrite(path, np.zeros((32, 32), dtype=np.uint8))
+    assert pyramid.ensure_pyramid(str(path), str(tmp_path / "out")) is None
+
+
+def test_layer_data_uses_strided_levels(monkeypatch):
+    _small_pyramids(monkeypatch)
+    arr = np.arange(100 * 40, dtype=np.float32).reshape(100, 40)
+    data, multiscale = pyramid.layer_data(arr, min_side=64)
+    assert multiscale
+    assert [lvl.shape for lvl in data] == [(100, 40), (50, 20), (25, 10), (13, 5)]
+    assert all(np.shares_memory(lvl, arr) for lvl in data)
+    small, multiscale = pyramid.layer_data(arr[:32], min_side=64)
+    assert not multiscale and small.shape == (32, 40)
+
+
+def test_ingest_schedules_the_pyramid_in_the_background(tmp_path, monkeypatch):
+    _small_pyramids(monkeypatch)
+    builder = _DeferredBuilder()
+    monkeypatch.setattr(pyramid, "_BUILDER", builder)
+    monkeypatch.setattr(pyramid, "_PENDING", {})
+    monkeypatch.setenv(DATA_ROOT_ENV, str(tmp_path / "data"))
+    img = tmp_path / "big.tif"
+    imwrite(img, np.zeros((80, 80), dtype=np.uint8))
+    h5 = tmp_path / "big.h5ad"
+    h5.write_bytes(b"h5ad")
+
+    manifest = ingest_dataset(img, h5, "case_pyr")
+    assert [lvl["shape"] for lvl in manifest["pyramid"]["levels"]] == [[80, 80], [40, 40], [20, 20], [10, 10]]
+    image, out = manifest["image_path"], manifest["output_root"]
+    assert len(builder.jobs) == 1 and pyramid.open_pyramid(image, out) is None
+    # a display request while the build is pending waits for it instead of starting another
+    assert pyramid.schedule_pyramid(image, out) is builder.jobs[0][0]
+    # display does not wait for it either: level 0 now, the reduced levels once the build finishes
+    levels = pyramid.ensure_pyramid(image, out)
+    assert [lvl.shape for lvl in levels] == [(80, 80)] and len(builder.jobs) == 1
+    ready = []
+    pyramid.on_pyramid_ready(image, out, ready.append)
+    assert ready == []
+    builder.run()
+    assert [lvl.shape for lvl in ready[0]] == [(80, 80), (40, 40), (20, 20), (10, 10)]
+    # level rasters are shared through the object cache instead of reopened per display
+    again = pyramid.ensure_pyramid(image, out)
+    assert again[0] is levels[0] is ready[0][0]
+    assert all(a is b for a, b in zip(again, ready[0]))
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+from tifffile import TiffFile, imwrite
+
+from aimino_frontend.aimino_core.handlers.special_analysis.utils import pyramid, raster_store
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.pyramid import layer_data
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.raster_store import (
+    compact_label_dtype,
+    open_raster,
+    read_raster,
+    write_raster,
+)
+
+RNG = np.random.default_rng(3)
+
+
+def test_labels_use_smallest_dtype_and_compress(tmp_path):
+    labels = np.zeros((512, 512), np.int32)
+    labels[100:200, 50:400] = 4000
+    labels[300:310, :] = 70000 - 1
+    path = tmp_path / "labels.tif"
+
+    write_raster(str(path), labels[:, :256] % 60000)
+    assert read_raster(str(path)).dtype == np.uint16
+    write_raster(str(path), labels)
+    back = read_raster(str(path))
+    assert back.dtype == np.uint32
+    np.testing.assert_array_equal(back, labels)
+    assert path.stat().st_size < labels.nbytes / 20
+    with TiffFile(path) as tf:
+        assert tf.pages[0].is_tiled and tf.pages[0].compression != 1
+    assert compact_label_dtype(65535) == np.uint16 and compact_label_dtype(65536) == np.uint32
+
+
+def test_masks_are_bit_packed(tmp_path):
+    mask = (RNG.random((300, 200)) > 0.7).astype(np.uint8)
+    path = tmp_path / "mask.tif"
+    write_raster(str(path), mask, binary=True)
+    with TiffFile(path) as tf:
+        assert tf.pages[0].bitspersample == 1
+    back = read_raster(str(path))
+    assert back.dtype == np.uint8
+    np.testing.assert_array_equal(back, mask)
+
+
+def test_lazy_raster_slicing(tmp_path):
+    labels = RNG.integers(0, 900, (700, 530)).astype(np.int32)
+    path = tmp_path / "labels.tif"
+    write_raster(str(path), labels)
+    lazy = open_raster(str(path))
+    assert lazy.shape == labels.shape and lazy.ndim == 2
+    np.testing.assert_array_equal(lazy[10:300, 257:520], labels[10:300, 257:520])
+    np.testing.assert_array_equal(lazy[::7, 3::5], labels[::7, 3::5])
+    np.testing.assert_array_equal(lazy[-1], labels[-1])
+    np.testing.assert_array_equal(lazy[5, 6:9], labels[5, 6:9])
+    np.testing.assert_array_equal(lazy[..., 4], labels[..., 4])
+    np.testing.assert_array_equal(np.asarray(lazy), labels)
+    with pytest.raises(IndexError):
+        lazy[700]
+
+
+def test_large_rasters_store_levels(tmp_path, monkeypatch):
+    monkeypatch.setattr(pyramid, "PYRAMID_MIN_SIDE", 256)
+    monkeypatch.setattr(pyramid, "PYRAMID_TOP_SIDE", 64)
+    mask = (RNG.random((300, 260)) > 0.5).astype(np.uint8)
+    path = tmp_path / "mask.tif"
+    write_raster(str(path), mask, binary=True)
+
+    data, multiscale = layer_data(open_raster(str(path)))
+    assert multiscale
+    assert [lvl.shape for lvl in data] == [(300, 260), (150, 130), (75, 65), (38, 33)]
+    np.testing.assert_array_equal(data[2][:, :], mask[::4, ::4])
+
+
+def test_levels_are_opened_once_and_closed_with_the_raster(tmp_path, monkeypatch):
+    monkeypatch.setattr(pyramid, "PYRAMID_MIN_SIDE", 256)
+    monkeypatch.setattr(pyramid, "PYRAMID_TOP_SIDE", 64)
+    path = tmp_path / "mask.tif"
+    write_raster(str(path), np.ones((300, 260), np.uint8), binary=True)
+    raster = open_raster(str(path))
+    assert raster.cache_handles == 1
+    levels = raster.levels()
+    assert len(levels) > 1 and raster.cache_handles == len(levels)
+    for _ in range(5):  # redraws reuse the open levels
+        assert raster.levels() is levels
+    raster.close()
+    assert all(lvl._plane._tf.filehandle.closed for lvl in levels)
+
+
+def test_legacy_uncompressed_files_still_read(tmp_path):
+    labels = RNG.integers(0, 50, (40, 30)).astype(np.int32)
+    path = tmp_path / "old_labels.tif"
+    imwrite(path, labels)
+    np.testing.assert_array_equal(read_raster(str(path)), labels)
+    np.testing.assert_array_equal(open_raster(str(path))[5:9, 2:4], labels[5:9, 2:4])
+    assert raster_store.RASTER_COMPRESSION in ("zstd", "zlib")
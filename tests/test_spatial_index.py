@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import h5py
+import numpy as np
+import pytest
+from skimage.measure import points_in_poly
+
+from aimino_frontend.aimino_core.command_models import CmdCountCellsInView
+from aimino_frontend.aimino_core.errors import CommandExecutionError
+from aimino_frontend.aimino_core.handlers.special_analysis.spatial_handler import handle_count_cells_in_view
+from aimino_frontend.aimino_core.handlers.special_analysis.utils import spatial_index as si
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.spatial_index import (
+    open_spatial_index,
+    spatial_index_dir,
+)
+
+N = 5000
+RNG = np.random.default_rng(21)
+X = RNG.uniform(0, 2000, N)
+Y = RNG.uniform(0, 1200, N)
+SOX10 = RNG.random(N) < 0.2
+
+
+@pytest.fixture
+def dataset(tmp_path, write_h5ad):
+    h5 = write_h5ad(tmp_path / "cells.h5ad", {"X_centroid": X, "Y_centroid": Y, "SOX10_positive": SOX10})
+    return h5, tmp_path / "processed"
+
+
+def _in_box(y0, x0, y1, x1):
+    y, x = Y.astype(np.float32), X.astype(np.float32)
+    return np.flatnonzero((y >= y0) & (y <= y1) & (x >= x0) & (x <= x1))
+
+
+def test_box_and_polygon_queries_match_brute_force(dataset):
+    h5, out = dataset
+    index = open_spatial_index(h5, out)
+    assert index.n_cells == N and index.shape[0] * index.shape[1] <= N
+
+    for box in [(100, 200, 400, 650), (0, 0, 1200, 2000), (-50, -50, 10, 10), (5000, 5000, 6000, 6000), (700, 900, 300, 100)]:
+        y0, x0, y1, x1 = box
+        expected = _in_box(min(y0, y1), min(x0, x1), max(y0, y1), max(x0, x1))
+        np.testing.assert_array_equal(index.cells_in_box(*box), expected)
+
+    poly = np.array([[100.0, 100.0], [900.0, 300.0], [1000.0, 1500.0], [300.0, 1800.0]])
+    yx = np.column_stack([Y, X]).astype(np.float32).astype(np.float64)
+    np.testing.assert_array_equal(index.cells_in_polygon(poly), np.flatnonzero(points_in_poly(yx, poly)))
+    assert index.cells_in_polygon(poly[:2]).size == 0
+
+
+def test_index_is_reused_and_rebuilt_when_source_changes(dataset):
+    h5, out = dataset
+    index = open_spatial_index(h5, out)
+    stamp = (spatial_index_dir(h5, out) / "order.npy").stat().st_mtime_ns
+    assert open_spatial_index(h5, out) is index
+    si.get_object_cache().clear()
+    reopened = open_spatial_index(h5, out, build=False)
+    assert reopened is not None and reopened.shape == index.shape
+    assert (spatial_index_dir(h5, out) / "order.npy").stat().st_mtime_ns == stamp
+
+    si.get_object_cache().clear()
+    with h5py.File(h5, "a") as f:
+        f["obs/X_centroid"][...] = X + 10.0
+    assert open_spatial_index(h5, out, build=False) is None
+    assert open_spatial_index(h5, out).origin[1] == pytest.approx(X.min() + 10.0)
+
+
+def test_count_command_uses_view_box_and_polygon(dataset):
+    h5, out = dataset
+    img = h5.with_suffix(".tif")
+    img.touch()
+    paths = dict(image_path=str(img), h5ad_path=str(h5), output_root=str(out))
+    viewer = MagicMock()
+    viewer.camera = SimpleNamespace(center=(0.0, 600.0, 1000.0), zoom=2.0)
+    viewer._canvas_size = (400, 800)
+
+    msg = handle_count_cells_in_view(
+        CmdCountCellsInView(action="special_count_cells_in_view", marker_col="SOX10_positive", **paths), viewer
+    )
+    ids = _in_box(500, 800, 700, 1200)
+    assert msg.startswith(f"{int(SOX10[ids].sum())} SOX10_positive cells of {len(ids)} cells in view")
+
+    cmd = CmdCountCellsInView(action="special_count_cells_in_view", box=[800, 500, 1200, 700], **paths)
+    assert handle_count_cells_in_view(cmd, viewer) == f"{len(ids)} of {N} cells in the box."
+
+    cmd = CmdCountCellsInView(
+        action="special_count_cells_in_view", polygon=[[0, 0], [2000, 0], [0, 1200]], **paths
+    )
+    assert "cells in the 3-vertex polygon" in handle_count_cells_in_view(cmd, viewer)
+
+    with pytest.raises(CommandExecutionError, match="not found"):
+        handle_count_cells_in_view(
+            CmdCountCellsInView(action="special_count_cells_in_view", marker_col="CD8_positive", **paths), viewer
+        )
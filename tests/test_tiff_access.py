@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from tifffile import imwrite
+
+from aimino_frontend.aimino_core.handlers.special_analysis.utils import tiff_access
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.image_processing import _to_2d_gray_safe
+from aimino_frontend.aimino_core.handlers.special_analysis.utils.tiff_access import open_plane
+
+RNG = np.random.default_rng(0)
+
+CASES = {
+    "plain": (RNG.integers(0, 60000, (70, 45), dtype=np.uint16), {}),
+    "stack": (RNG.integers(0, 60000, (3, 70, 45), dtype=np.uint16), {"photometric": "minisblack"}),
+    "rgb": (RNG.integers(0, 255, (70, 45, 3), dtype=np.uint8), {"photometric": "rgb"}),
+    "tiled_zlib": (RNG.integers(0, 60000, (70, 45), dtype=np.uint16), {"tile": (16, 16), "compression": "zlib"}),
+    "strips_zlib_stack": (
+        RNG.integers(0, 60000, (2, 70, 45), dtype=np.uint16),
+        {"rowsperstrip": 8, "compression": "zlib"},
+    ),
+    "rgb_zlib": (
+        RNG.integers(0, 255, (70, 45, 3), dtype=np.uint8),
+        {"photometric": "rgb", "rowsperstrip": 8, "compression": "zlib"},
+    ),
+    "planar_zlib": (
+        RNG.integers(0, 255, (3, 70, 45), dtype=np.uint8),
+        {"photometric": "rgb", "planarconfig": "separate", "rowsperstrip": 8, "compression": "zlib"},
+    ),
+}
+
+
+@pytest.fixture(params=sorted(CASES))
+def tiff_case(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(tiff_access, "zarr", None)  # exercise memmap/stream without zarr
+    data, kwargs = CASES[request.param]
+    path = tmp_path / f"{request.param}.tif"
+    imwrite(path, data, **kwargs)
+    return path, _to_2d_gray_safe(data)
+
+
+def test_backend_selection(tmp_path, monkeypatch):
+    monkeypatch.setattr(tiff_access, "zarr", None)
+    raw, packed = tmp_path / "raw.tif", tmp_path / "packed.tif"
+    imwrite(raw, np.zeros((20, 20), dtype=np.uint8))
+    imwrite(packed, np.zeros((20, 20), dtype=np.uint8), compression="zlib")
+    with open_plane(raw) as a, open_plane(packed) as b:
+        assert a.backend == "memmap"
+        assert b.backend == "stream"
+
+
+def test_region_reads_match_full_decode(tiff_case):
+    path, expected = tiff_case
+    with open_plane(path) as plane:
+        assert plane.shape == expected.shape
+        np.testing.assert_array_equal(plane.read(5, 40, 3, 37), expected[5:40, 3:37])
+        np.testing.assert_array_equal(plane.read(0, 70, 0, 45, step=3), expected[::3, ::3])
+
+
+@pytest.mark.parametrize("factor", [1, 2, 5])
+def test_blockwise_downsample_matches_strided(tiff_case, factor):
+    path, expected = tiff_case
+    with open_plane(path) as plane:
+        out = plane.downsample(factor, rows=16)
+    np.testing.assert_array_equal(out, expected[::factor, ::factor])
+    assert out.dtype == expected.dtype
+
+
+def _float64_gray(rgb):
+    f = rgb[..., :3].astype(float)
+    return (0.2989 * f[..., 0] + 0.587 * f[..., 1] + 0.114 * f[..., 2]).astype(rgb.dtype)
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16, np.float32])
+def test_rgb_to_gray_matches_float64_reference(dtype):
+    rgb = RNG.integers(0, 250, (300, 41, 4)).astype(dtype)
+    serial = tiff_access.rgb_to_gray(rgb, workers=1, rows=7)
+    threaded = tiff_access.rgb_to_gray(rgb, workers=4, rows=7)
+    np.testing.assert_array_equal(serial, threaded)
+    assert serial.dtype == rgb.dtype
+    assert np.abs(serial.astype(float) - _float64_gray(rgb).astype(float)).max() <= 1
+
+
+def test_gray_writes_into_preallocated_and_memmapped_outputs(monkeypatch):
+    rgb = RNG.integers(0, 255, (64, 32, 3), dtype=np.uint8)
+    out = np.zeros((64, 32), dtype=np.uint8)
+    assert _to_2d_gray_safe(rgb[None], out=out) is out
+    np.testing.assert_array_equal(out, tiff_access.rgb_to_gray(rgb))
+
+    monkeypatch.setattr(tiff_access, "MEMMAP_MIN_BYTES", 1024)
+    big = tiff_access.rgb_to_gray(rgb)
+    assert isinstance(big, np.memmap)
+    np.testing.assert_array_equal(big, out)